@@ -0,0 +1,74 @@
+"""Reads the archive manifest kept by the long-term pipeline to find the
+historical files that can hold a plant's readings.
+
+The manifest format and bloom filter hashing must match
+pipeline-long/manifest.py, which writes it; test_archive_manifest.py reads
+entries written by that module to check they agree."""
+
+from base64 import b64decode
+from hashlib import blake2b
+import json
+import pandas as pd
+from botocore.exceptions import ClientError
+
+MANIFEST_NAME = "manifest.json"
+
+ARCHIVE_SUFFIXES = (".csv", ".csv.gz", ".parquet")
+
+
+def in_bloom_filter(bloom: dict, plant_id: int) -> bool:
+    """Returns False if the plant is certainly not in a manifest bloom filter."""
+    data = b64decode(bloom["data"])
+    digest = blake2b(str(int(plant_id)).encode("UTF-8"), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], "big")
+    second = int.from_bytes(digest[8:], "big") | 1
+
+    for i in range(bloom["hashes"]):
+        position = (first + i * second) % bloom["bits"]
+        if not data[position // 8] & (1 << (position % 8)):
+            return False
+    return True
+
+
+def load_manifest(s3_client, bucket_name: str, folder_path: str) -> dict | None:
+    """Returns the archive folder's manifest, or None if it has none."""
+    try:
+        response = s3_client.get_object(Bucket=bucket_name,
+                                        Key=f"{folder_path}{MANIFEST_NAME}")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(response["Body"].read())
+
+
+def may_contain(entry: dict, plant_id: int, start=None, end=None) -> bool:
+    """Returns False if a manifest entry rules out the file holding readings
+    for the plant between start and end."""
+    if start is not None and pd.Timestamp(entry["max_timestamp"]) < pd.Timestamp(start):
+        return False
+    if end is not None and pd.Timestamp(entry["min_timestamp"]) > pd.Timestamp(end):
+        return False
+    if not entry["min_plant_id"] <= plant_id <= entry["max_plant_id"]:
+        return False
+    return in_bloom_filter(entry["plant_bloom"], plant_id)
+
+
+def select_files(manifest: dict, plant_id: int, start=None, end=None) -> list[str]:
+    """Returns the keys of the archive files that may hold readings for the
+    plant between start and end, oldest first."""
+    files = manifest["files"]
+    return sorted((key for key, entry in files.items()
+                   if may_contain(entry, plant_id, start, end)),
+                  key=lambda key: files[key]["min_timestamp"])
+
+
+def list_archive_files(s3_client, bucket_name: str, folder_path: str) -> list[str]:
+    """Returns the keys of every archive file under the folder, following
+    every page of the listing."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    keys = []
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=folder_path):
+        keys.extend(obj["Key"] for obj in page.get("Contents", [])
+                    if obj["Key"].endswith(ARCHIVE_SUFFIXES))
+    return keys
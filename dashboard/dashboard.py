@@ -2,6 +2,7 @@
 """Main dashboard script."""
 
 # Standard library imports
+from io import BytesIO
 from os import environ as ENV
 
 # Third-party imports
@@ -11,7 +12,9 @@ import altair as alt
 from boto3 import client
 
 # Local imports
-from sl_queries import get_today_data, get_plant_ids, fetch_plant_species_data
+from sl_queries import get_today_data, get_plant_ids, fetch_plant_species_data, get_hourly_data
+from archive_manifest import load_manifest, select_files, list_archive_files
+from history import get_archive_cutoff, combine_history
 
 # Page configuration
 st.set_page_config(layout="wide")
@@ -23,53 +26,63 @@ s3 = client('s3',
 
 BUCKET_NAME = 'c13-wshao-lmnh-long-term-storage'
 
+ARCHIVE_FOLDER = 'recordings/'
+
 # Helper functions
 
 
 @st.cache_data
 def list_csv_files():
-    """List all CSV files in the S3 bucket."""
-    response = s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix="recordings/")
-    files = [obj['Key'] for obj in response.get(
-        'Contents', []) if obj['Key'].endswith('.csv')]
-    return files
+    """List all archived files in the S3 bucket, across every page."""
+    return list_archive_files(s3, BUCKET_NAME, ARCHIVE_FOLDER)
+
+
+@st.cache_data(ttl=3600)
+def get_archive_manifest():
+    """Returns the archive manifest, or None if the bucket has none."""
+    return load_manifest(s3, BUCKET_NAME, ARCHIVE_FOLDER)
 
 
 @st.cache_data
 def read_historical_data_from_s3(file_key):
     """Reads historical data from S3."""
     obj = s3.get_object(Bucket=BUCKET_NAME, Key=file_key)
-    return pd.read_csv(obj['Body'])
+    if file_key.endswith('.parquet'):
+        return pd.read_parquet(BytesIO(obj['Body'].read()))
+    compression = 'gzip' if file_key.endswith('.gz') else None
+    return pd.read_csv(obj['Body'], compression=compression)
 
 
 @st.cache_data
-def load_historical_data(selected_plant, plant_name_map):
-    """Loads and combines historical data from multiple CSV files for selected plants."""
-    files = list_csv_files()
-    relevant_files = [file for file in files if 'recordings/' in file]
+def load_historical_data(plant_id, end=None):
+    """Loads and combines historical data for the selected plant, reading
+    only the files the archive manifest says can hold its readings before end."""
+    manifest = get_archive_manifest()
+    if manifest is not None:
+        relevant_files = select_files(manifest, plant_id, end=end)
+    else:
+        relevant_files = list_csv_files()
+
     data_frames = []
     for file in relevant_files:
         df = read_historical_data_from_s3(file)
+        df = df[df['plant_id'] == plant_id]
         # Convert timestamp to datetime
         df['timestamp'] = pd.to_datetime(df['timestamp'])
         data_frames.append(df)
 
-    combined_df = pd.concat(data_frames, ignore_index=True)
-
-    # Get the plant ID for the selected plant and filter data
-    plant_id = plant_name_map[selected_plant]
-    filtered_df = combined_df[combined_df['plant_id'] == plant_id]
+    if not data_frames:
+        return pd.DataFrame(columns=['timestamp', 'soil_moisture', 'temperature', 'plant_id'])
 
-    return filtered_df
+    return pd.concat(data_frames, ignore_index=True)
 
 
 # Plotting functions
-def plot_moisture_chart(df, plant_name_map):
+def plot_moisture_chart(df):
     """Plots Altair chart for historical soil moisture."""
     if not df.empty:
         df = df[['timestamp', 'moisture', 'plant_id']]
         hourly_avg = df.resample('H', on='timestamp').mean().reset_index()
-        hourly_avg['plant_id'] = hourly_avg['plant_id'].map(plant_name_map)
     else:
         hourly_avg = pd.DataFrame(
             columns=['timestamp', 'moisture', 'plant_id'])
@@ -85,12 +98,11 @@ def plot_moisture_chart(df, plant_name_map):
     return chart
 
 
-def plot_temperature_chart(df, plant_name_map):
+def plot_temperature_chart(df):
     """Plots Altair chart for historical soil temperature."""
     if not df.empty:
         df = df[['timestamp', 'temperature', 'plant_id']]
         hourly_avg = df.resample('H', on='timestamp').mean().reset_index()
-        hourly_avg['plant_id'] = hourly_avg['plant_id'].map(plant_name_map)
     else:
         hourly_avg = pd.DataFrame(
             columns=['timestamp', 'temperature', 'plant_id'])
@@ -151,7 +163,6 @@ st.markdown("<h1 style='color: #e3298c;'>🌱 Monitoring Plant Health Metrics 
 plant_ids = get_plant_ids()  # Fetch plant names from the database
 selected_plant = st.sidebar.selectbox(
     'Select plant:', plant_ids)  # List of plant names
-plant_name_map = {name: id for id, name in enumerate(plant_ids)}
 
 col1, spacer, col2 = st.columns([5, 0.25, 4])
 
@@ -192,18 +203,22 @@ with col2:
             today_temperature), use_container_width=True)
 
 
-# Load and display historical data
-historical_data = load_historical_data(selected_plant, plant_name_map)
+# Load and display historical data: the hourly rollups, preceded by the
+# archived readings from before the plant's first rollup hour
+hourly_data = get_hourly_data(selected_plant)
+archive_data = load_historical_data(selected_plant,
+                                    get_archive_cutoff(hourly_data))
+historical_data = combine_history(hourly_data, archive_data)
 
 st.subheader("Historical Data")
 col1, col2 = st.columns(2)
 
 # Display historical Soil Moisture data
 with col1:
-    st.altair_chart(plot_moisture_chart(historical_data,
-                    plant_name_map), use_container_width=True)
+    st.altair_chart(plot_moisture_chart(historical_data),
+                    use_container_width=True)
 
 # Display historical Temperature data
 with col2:
-    st.altair_chart(plot_temperature_chart(historical_data,
-                    plant_name_map), use_container_width=True)
+    st.altair_chart(plot_temperature_chart(historical_data),
+                    use_container_width=True)
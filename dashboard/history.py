@@ -0,0 +1,35 @@
+"""Combines the hourly rollups with the archived readings for the
+historical charts.
+
+The rollups only start when migration 004 ran or when a plant was first
+loaded after it, so every reading before a plant's first rollup hour comes
+from the S3 archive instead."""
+
+import pandas as pd
+
+HISTORY_COLUMNS = ["timestamp", "moisture", "temperature", "plant_id"]
+
+
+def get_archive_cutoff(rollups: pd.DataFrame) -> pd.Timestamp | None:
+    """Returns the start of a plant's first rollup hour, before which its
+    history must be read from the archive, or None if it has no rollups."""
+    if rollups.empty:
+        return None
+    return pd.to_datetime(rollups["timestamp"]).min()
+
+
+def combine_history(rollups: pd.DataFrame, archive: pd.DataFrame) -> pd.DataFrame:
+    """Returns the archived readings taken before the first rollup hour
+    followed by the rollups, in time order."""
+    rollups = rollups.assign(timestamp=pd.to_datetime(rollups["timestamp"]))
+    archive = archive.rename(columns={"soil_moisture": "moisture"})
+    archive = archive.assign(timestamp=pd.to_datetime(archive["timestamp"]))
+
+    cutoff = get_archive_cutoff(rollups)
+    if cutoff is not None:
+        archive = archive[archive["timestamp"] < cutoff]
+
+    frames = [frame[HISTORY_COLUMNS] for frame in (archive, rollups) if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+    return pd.concat(frames, ignore_index=True).sort_values("timestamp", ignore_index=True)
@@ -24,18 +24,18 @@ def get_connection():
 @st.cache_data
 def get_today_data(selected_plant, metric):
     """Fetches today's data for the selected plant."""
-    # Use a direct query for a single plant ID
+    # The plant ID is a parameter so every plant shares one cached plan
     query = f"""
     SELECT time_taken AS time, {metric}, plant_id
     FROM gamma.recordings
-    WHERE time_taken >= CAST(GETDATE() AS DATE)
-      AND plant_id = {selected_plant}
+    WHERE plant_id = %s
+      AND time_taken >= CAST(GETDATE() AS DATE)
     ORDER BY time_taken;
     """
 
     with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(query)
+        cursor.execute(query, (selected_plant,))
         result = cursor.fetchall()
         cursor.close()
 
@@ -43,6 +43,29 @@ def get_today_data(selected_plant, metric):
 
 
 
+@st.cache_data(ttl=600)
+def get_hourly_data(selected_plant):
+    """Fetches hourly mean moisture and temperature for the selected plant
+    from the hourly rollups, which are kept after the recordings are archived."""
+    query = """
+    SELECT period_start AS timestamp,
+        soil_moisture_sum / reading_count AS moisture,
+        temperature_sum / reading_count AS temperature,
+        plant_id
+    FROM gamma.hourly_rollups
+    WHERE plant_id = %s
+    ORDER BY period_start;
+    """
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, (selected_plant,))
+        result = cursor.fetchall()
+        cursor.close()
+
+    return pd.DataFrame(result, columns=["timestamp", "moisture", "temperature", "plant_id"])
+
+
 def get_plant_ids():
     """Gets stored plant names."""
     query = "SELECT plant_id FROM gamma.plants;"
@@ -57,12 +80,11 @@ def get_plant_ids():
 def fetch_plant_species_data(selected_plant_id):
     """Fetches plant species data based on selected plant ID."""
     query = """
-    SELECT TOP 1 p.plant_id, sp.plant_species_id, sp.common_name, sp.scientific_name, r.last_watering 
+    SELECT p.plant_id, sp.plant_species_id, sp.common_name, sp.scientific_name, s.last_watering
     FROM gamma.plants AS p
     JOIN gamma.plant_species AS sp ON sp.plant_species_id = p.plant_species_id
-    JOIN gamma.recordings AS r ON p.plant_id = r.plant_id
+    JOIN gamma.plant_latest_state AS s ON s.plant_id = p.plant_id
     WHERE p.plant_id = %s
-    ORDER BY r.last_watering DESC
     """
     with get_connection() as conn:
         cursor = conn.cursor()
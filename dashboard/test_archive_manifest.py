@@ -0,0 +1,61 @@
+"""Tests for archive_manifest.py, reading manifests written by
+pipeline-long/manifest.py."""
+
+from pathlib import Path
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "pipeline-long"))
+
+# pylint: disable=wrong-import-position
+from manifest import FileStats, select_files as select_written_files
+from archive_manifest import in_bloom_filter, select_files
+
+
+def make_entry(day: str, plant_ids: list[int]) -> dict:
+    """Returns the manifest entry pipeline-long writes for a file holding
+    readings for the plants at the start and end of a day."""
+    stats = FileStats()
+    timestamps = [f"{day} 00:00:00", f"{day} 23:59:00"] * len(plant_ids)
+    stats.update(pd.DataFrame({"timestamp": timestamps, "plant_id": plant_ids * 2}))
+    return stats.to_entry("hash", 100)
+
+
+class TestSelectFiles:
+    """Tests that the dashboard reads the manifest the way pipeline-long writes it."""
+
+    def test_bloom_filter_contains_every_written_plant(self):
+        """Tests that the dashboard's bloom filter check finds every plant
+        pipeline-long added to an entry."""
+        plant_ids = list(range(0, 1000, 3))
+        bloom = make_entry("2024-10-01", plant_ids)["plant_bloom"]
+
+        assert all(in_bloom_filter(bloom, plant_id) for plant_id in plant_ids)
+
+    def test_matches_pipeline_long_selection(self):
+        """Tests that the dashboard selects the same files as pipeline-long
+        for every plant and time range."""
+        manifest = {"files": {
+            "recordings/a.csv": make_entry("2024-10-01", [1, 2, 3]),
+            "recordings/b.csv": make_entry("2024-10-02", [3, 40, 50]),
+            "recordings/c.csv": make_entry("2024-10-03", list(range(100, 200, 7)))
+        }}
+
+        for plant_id in range(0, 210):
+            for end in (None, "2024-10-01 12:00:00", "2024-10-02 12:00:00"):
+                assert (select_files(manifest, plant_id, end=end)
+                        == select_written_files(manifest, plant_id, end=end))
+
+    def test_selects_files_for_plant_before_end(self):
+        """Tests that only files holding the plant before end are selected,
+        oldest first."""
+        manifest = {"files": {
+            "recordings/b.csv": make_entry("2024-10-02", [3, 4]),
+            "recordings/a.csv": make_entry("2024-10-01", [3]),
+            "recordings/c.csv": make_entry("2024-10-03", [3])
+        }}
+
+        assert select_files(manifest, 3, end="2024-10-02 12:00:00") == [
+            "recordings/a.csv", "recordings/b.csv"]
+        assert select_files(manifest, 4) == ["recordings/b.csv"]
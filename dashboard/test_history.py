@@ -0,0 +1,59 @@
+"""Tests for history.py."""
+
+import pandas as pd
+
+from history import get_archive_cutoff, combine_history, HISTORY_COLUMNS
+
+
+def make_rollups(*hours: str) -> pd.DataFrame:
+    """Returns hourly rollup rows for plant 1 starting at the given hours."""
+    return pd.DataFrame({"timestamp": list(hours), "moisture": [50.0] * len(hours),
+                         "temperature": [20.0] * len(hours), "plant_id": [1] * len(hours)})
+
+
+def make_archive(*timestamps: str) -> pd.DataFrame:
+    """Returns archived readings for plant 1 taken at the given times."""
+    return pd.DataFrame({"recording_id": range(1, len(timestamps) + 1),
+                         "timestamp": list(timestamps),
+                         "soil_moisture": [30.0] * len(timestamps),
+                         "temperature": [18.0] * len(timestamps),
+                         "plant_id": [1] * len(timestamps),
+                         "botanist_id": [1] * len(timestamps)})
+
+
+class TestCombineHistory:
+    """Tests for choosing between the rollups and the archive."""
+
+    def test_cutoff_is_first_rollup_hour(self):
+        """Tests that the archive is read up to the plant's first rollup hour."""
+        rollups = make_rollups("2024-10-05 11:00:00", "2024-10-05 10:00:00")
+        assert get_archive_cutoff(rollups) == pd.Timestamp("2024-10-05 10:00:00")
+        assert get_archive_cutoff(make_rollups()) is None
+
+    def test_archive_fills_history_before_rollups(self):
+        """Tests that archived readings before the first rollup hour are kept
+        and those the rollups already cover are dropped."""
+        history = combine_history(
+            make_rollups("2024-10-05 10:00:00", "2024-10-05 11:00:00"),
+            make_archive("2024-10-01 09:00:00", "2024-10-05 09:59:00",
+                         "2024-10-05 10:30:00"))
+
+        assert list(history.columns) == HISTORY_COLUMNS
+        assert history["timestamp"].tolist() == [
+            pd.Timestamp("2024-10-01 09:00:00"), pd.Timestamp("2024-10-05 09:59:00"),
+            pd.Timestamp("2024-10-05 10:00:00"), pd.Timestamp("2024-10-05 11:00:00")]
+        assert history["moisture"].tolist() == [30.0, 30.0, 50.0, 50.0]
+
+    def test_archive_only_without_rollups(self):
+        """Tests that a plant without rollups is charted from the archive alone."""
+        history = combine_history(make_rollups(), make_archive("2024-10-01 09:00:00"))
+
+        assert history["moisture"].tolist() == [30.0]
+
+    def test_rollups_only_without_archive(self):
+        """Tests that the rollups are charted when nothing was archived."""
+        archive = pd.DataFrame(columns=["timestamp", "soil_moisture", "temperature", "plant_id"])
+        history = combine_history(make_rollups("2024-10-05 10:00:00"), archive)
+
+        assert history["moisture"].tolist() == [50.0]
+        assert combine_history(make_rollups(), archive).empty
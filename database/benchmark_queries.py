@@ -0,0 +1,207 @@
+'''Times the recordings hot-path queries before and after the covering indexes.
+
+Seeds synthetic recordings for every plant in gamma.plants, one per plant per
+minute going back from the earliest stored reading, then times each query
+against the schema without the indexes from migration 002 and again with them.
+The "before" queries are the versions that shipped before the migration and
+the "after" queries are the ones that ship now. The botanist lookup in
+pipeline-short/database_functions.py reads gamma.plant_latest_state, so
+migration 003 must be applied before benchmarking; its timing does not
+depend on the recordings or their indexes.
+
+Run this against a scratch copy of the database: it inserts rows into
+gamma.recordings and drops and recreates indexes.
+
+Usage: python benchmark_queries.py --recordings 1000000 --repeat 5'''
+import argparse
+import logging
+from datetime import datetime as dt, timedelta
+from statistics import median
+from time import perf_counter
+
+from dotenv import load_dotenv
+
+from seed_plant_data import get_connection
+
+MIGRATION = "migrations/002_recordings_indexes.sql"
+
+SEED_CHUNK = 500_000
+
+SEED_QUERY = '''WITH numbers AS (
+        SELECT TOP (?) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) - 1 AS i
+        FROM sys.all_objects a CROSS JOIN sys.all_objects b CROSS JOIN sys.all_objects c)
+    INSERT INTO gamma.recordings
+        (time_taken, soil_moisture, temperature, last_watering, plant_id, botanist_id)
+    SELECT DATEADD(MINUTE, -n.i, ?),
+        ABS(CHECKSUM(NEWID())) % 9000 / 100.0,
+        ABS(CHECKSUM(NEWID())) % 3000 / 100.0,
+        DATEADD(HOUR, -(n.i / 60 % 24), ?),
+        p.plant_id,
+        ?
+    FROM numbers AS n CROSS JOIN gamma.plants AS p'''
+
+DROP_INDEXES = '''
+    IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_recordings_plant_last_watering')
+        DROP INDEX ix_recordings_plant_last_watering ON gamma.recordings;
+    IF NOT EXISTS (SELECT 1 FROM sys.key_constraints WHERE name = 'uq_recordings_plant_time')
+        ALTER TABLE gamma.recordings
+        ADD CONSTRAINT uq_recordings_plant_time UNIQUE(plant_id, time_taken);
+    IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_recordings_plant_time')
+        DROP INDEX ux_recordings_plant_time ON gamma.recordings;'''
+
+QUERIES = {
+    "get_today_data": (
+        '''SELECT time_taken AS time, soil_moisture, plant_id
+        FROM gamma.recordings
+        WHERE time_taken >= CAST(GETDATE() AS DATE) AND plant_id = ?
+        ORDER BY time_taken;''',
+        '''SELECT time_taken AS time, soil_moisture, plant_id
+        FROM gamma.recordings
+        WHERE plant_id = ? AND time_taken >= CAST(GETDATE() AS DATE)
+        ORDER BY time_taken;'''),
+    "get_affected_plants": (
+        '''WITH LastThreeRecordings AS (
+            SELECT plant_id, soil_moisture, temperature,
+            ROW_NUMBER() OVER (PARTITION BY plant_id ORDER BY time_taken DESC) AS row_num
+            FROM gamma.recordings)
+        SELECT plant_id FROM LastThreeRecordings
+        WHERE row_num <= 3
+        GROUP BY plant_id
+        HAVING COUNT(*) = 3
+        AND SUM(CASE WHEN (soil_moisture > 70 OR soil_moisture < 15
+            OR temperature > 35 OR temperature < 15) THEN 1 ELSE 0 END) = 3;''',
+        '''SELECT p.plant_id FROM gamma.plants AS p
+        CROSS APPLY (
+            SELECT TOP 3 soil_moisture, temperature
+            FROM gamma.recordings AS r
+            WHERE r.plant_id = p.plant_id
+            ORDER BY r.time_taken DESC) AS LastThreeRecordings
+        GROUP BY p.plant_id
+        HAVING COUNT(*) = 3
+        AND SUM(CASE WHEN (soil_moisture > 70 OR soil_moisture < 15
+            OR temperature > 35 OR temperature < 15) THEN 1 ELSE 0 END) = 3;'''),
+    "map_plant_id_to_most_recent_botanist": (
+        '''SELECT r.plant_id, r.botanist_id
+        FROM gamma.recordings r
+        JOIN (
+            SELECT plant_id, MAX(time_taken) AS max_time
+            FROM gamma.recordings
+            GROUP BY plant_id
+        ) recent ON r.plant_id = recent.plant_id AND r.time_taken = recent.max_time''',
+        "SELECT plant_id, botanist_id FROM gamma.plant_latest_state"),
+    "fetch_plant_species_data": (
+        '''SELECT TOP 1 p.plant_id, sp.plant_species_id, sp.common_name,
+            sp.scientific_name, r.last_watering
+        FROM gamma.plants AS p
+        JOIN gamma.plant_species AS sp ON sp.plant_species_id = p.plant_species_id
+        JOIN gamma.recordings AS r ON p.plant_id = r.plant_id
+        WHERE p.plant_id = ?
+        ORDER BY r.last_watering DESC''',) * 2
+}
+
+PARAMETERISED = {"get_today_data", "fetch_plant_species_data"}
+
+
+def seed_recordings(conn, num_recordings: int) -> int:
+    '''Inserts about num_recordings synthetic readings, one per plant per
+    minute, older than any stored reading. Returns the number inserted.'''
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM gamma.plants")
+        num_plants = cur.fetchone()[0]
+        cur.execute("SELECT MIN(time_taken) FROM gamma.recordings")
+        earliest = cur.fetchone()[0] or dt.now()
+        cur.execute("SELECT MIN(botanist_id) FROM gamma.botanists")
+        botanist_id = cur.fetchone()[0]
+
+    if not num_plants or botanist_id is None:
+        raise ValueError("Seed plants and botanists before benchmarking")
+
+    start = earliest.replace(second=0, microsecond=0) - timedelta(minutes=1)
+    minutes = max(1, num_recordings // num_plants)
+    chunk = max(1, SEED_CHUNK // num_plants)
+    inserted = 0
+
+    for offset in range(0, minutes, chunk):
+        size = min(chunk, minutes - offset)
+        chunk_start = start - timedelta(minutes=offset)
+        with conn.cursor() as cur:
+            cur.execute(SEED_QUERY, (size, chunk_start, chunk_start, botanist_id))
+        conn.commit()
+        inserted += size * num_plants
+        logging.info("Seeded %s of %s recordings", inserted, minutes * num_plants)
+
+    return inserted
+
+
+def get_sample_plant(conn) -> int:
+    '''Returns the plant with the most recordings'''
+    with conn.cursor() as cur:
+        cur.execute('''SELECT TOP 1 plant_id FROM gamma.recordings
+            GROUP BY plant_id ORDER BY COUNT(*) DESC''')
+        return cur.fetchone()[0]
+
+
+def time_query(conn, query: str, params: tuple, repeat: int) -> float:
+    '''Returns the median time in seconds to run a query and fetch its rows'''
+    timings = []
+    for _ in range(repeat):
+        with conn.cursor() as cur:
+            timer = perf_counter()
+            cur.execute(query, *params)
+            cur.fetchall()
+            timings.append(perf_counter() - timer)
+    return median(timings)
+
+
+def time_queries(conn, version: int, plant_id: int, repeat: int) -> dict:
+    '''Times every query in one version, 0 for before and 1 for after'''
+    return {name: time_query(conn, queries[version],
+                             (plant_id,) if name in PARAMETERISED else (), repeat)
+            for name, queries in QUERIES.items()}
+
+
+def run_script(conn, sql: str) -> None:
+    '''Runs a batch of SQL statements and commits'''
+    with conn.cursor() as cur:
+        cur.execute(sql)
+    conn.commit()
+
+
+def benchmark(conn, repeat: int) -> None:
+    '''Times each query without the indexes, applies migration 002 and
+    times each query again'''
+    plant_id = get_sample_plant(conn)
+
+    run_script(conn, DROP_INDEXES)
+    before = time_queries(conn, 0, plant_id, repeat)
+
+    with open(MIGRATION, "r", encoding="utf-8") as f:
+        run_script(conn, f.read())
+    after = time_queries(conn, 1, plant_id, repeat)
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT_BIG(*) FROM gamma.recordings")
+        total = cur.fetchone()[0]
+
+    print(f"{total:,} recordings, median of {repeat} runs")
+    for name in QUERIES:
+        print(f"{name:<38} before {before[name] * 1000:>9.1f}ms"
+              f" | after {after[name] * 1000:>9.1f}ms"
+              f" | speedup {before[name] / after[name]:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recordings", "-r", type=int, default=1_000_000,
+                        help="Synthetic recordings to seed, 0 to use the existing rows")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs of each query to take the median of")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+
+    with get_connection() as connection:
+        if args.recordings:
+            seed_recordings(connection, args.recordings)
+        benchmark(connection, args.repeat)
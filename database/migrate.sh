@@ -0,0 +1,12 @@
+source .env
+sqlcmd -S $HOST,$DB_PORT -U $DB_USER -P $DB_PW -d $DB_NAME -Q "IF OBJECT_ID('gamma.schema_migrations') IS NULL CREATE TABLE gamma.schema_migrations (version VARCHAR(255) NOT NULL PRIMARY KEY, applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP);"
+
+for migration in migrations/*.sql; do
+    version=$(basename $migration .sql)
+    applied=$(sqlcmd -S $HOST,$DB_PORT -U $DB_USER -P $DB_PW -d $DB_NAME -Q "SET NOCOUNT ON; SELECT COUNT(*) FROM gamma.schema_migrations WHERE version = '$version';" -h -1 | xargs)
+    if [ "$applied" = "0" ]; then
+        echo "Applying migration $version"
+        sqlcmd -S $HOST,$DB_PORT -U $DB_USER -P $DB_PW -d $DB_NAME -b -i $migration || exit 1
+        sqlcmd -S $HOST,$DB_PORT -U $DB_USER -P $DB_PW -d $DB_NAME -Q "INSERT INTO gamma.schema_migrations (version) VALUES ('$version');"
+    fi
+done
@@ -0,0 +1,12 @@
+-- Removes repeated readings and allows only one reading per plant per timestamp.
+
+WITH duplicates AS (
+    SELECT ROW_NUMBER() OVER (PARTITION BY plant_id, time_taken ORDER BY recording_id) AS row_num
+    FROM gamma.recordings
+)
+DELETE FROM duplicates WHERE row_num > 1;
+
+IF NOT EXISTS (SELECT 1 FROM sys.key_constraints WHERE name = 'uq_recordings_plant_time')
+    AND NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_recordings_plant_time')
+    ALTER TABLE gamma.recordings
+    ADD CONSTRAINT uq_recordings_plant_time UNIQUE(plant_id, time_taken);
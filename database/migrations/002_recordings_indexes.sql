@@ -0,0 +1,18 @@
+-- Covering indexes for the recordings hot paths.
+-- ux_recordings_plant_time replaces the uq_recordings_plant_time constraint: it
+-- enforces the same uniqueness and also covers the dashboard's readings for a
+-- plant, the checker's last three readings per plant and the latest botanist
+-- per plant, all of which seek on plant_id and read time_taken newest first.
+-- ix_recordings_plant_last_watering serves the dashboard's last watering lookup.
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_recordings_plant_time')
+    CREATE UNIQUE INDEX ux_recordings_plant_time
+    ON gamma.recordings (plant_id, time_taken DESC)
+    INCLUDE (soil_moisture, temperature, last_watering, botanist_id);
+
+IF EXISTS (SELECT 1 FROM sys.key_constraints WHERE name = 'uq_recordings_plant_time')
+    ALTER TABLE gamma.recordings DROP CONSTRAINT uq_recordings_plant_time;
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_recordings_plant_last_watering')
+    CREATE INDEX ix_recordings_plant_last_watering
+    ON gamma.recordings (plant_id, last_watering DESC);
@@ -0,0 +1,40 @@
+-- Adds one row per plant holding its latest reading, last watering, latest
+-- botanist and its last 10 readings as JSON, newest first. The short pipeline
+-- keeps it up to date in the same transaction as each recordings insert.
+
+IF OBJECT_ID('gamma.plant_latest_state') IS NULL
+    CREATE TABLE gamma.plant_latest_state (
+        plant_id INT NOT NULL,
+        time_taken DATETIME NOT NULL,
+        soil_moisture FLOAT(53) NOT NULL,
+        temperature FLOAT(53) NOT NULL,
+        last_watering DATETIME NOT NULL,
+        botanist_id INT NOT NULL,
+        history VARCHAR(MAX) NOT NULL,
+        PRIMARY KEY(plant_id),
+        FOREIGN KEY(botanist_id) REFERENCES gamma.botanists(botanist_id),
+        FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
+    );
+GO
+
+INSERT INTO gamma.plant_latest_state
+    (plant_id, time_taken, soil_moisture, temperature, last_watering, botanist_id, history)
+SELECT p.plant_id, latest.time_taken, latest.soil_moisture, latest.temperature,
+    watered.last_watering, latest.botanist_id,
+    (SELECT TOP 10 r.time_taken, r.soil_moisture, r.temperature, r.botanist_id
+     FROM gamma.recordings AS r
+     WHERE r.plant_id = p.plant_id
+     ORDER BY r.time_taken DESC
+     FOR JSON PATH)
+FROM gamma.plants AS p
+CROSS APPLY (
+    SELECT TOP 1 time_taken, soil_moisture, temperature, botanist_id
+    FROM gamma.recordings AS r
+    WHERE r.plant_id = p.plant_id
+    ORDER BY r.time_taken DESC) AS latest
+CROSS APPLY (
+    SELECT MAX(last_watering) AS last_watering
+    FROM gamma.recordings AS r
+    WHERE r.plant_id = p.plant_id) AS watered
+WHERE NOT EXISTS (
+    SELECT 1 FROM gamma.plant_latest_state AS s WHERE s.plant_id = p.plant_id);
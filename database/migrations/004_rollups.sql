@@ -0,0 +1,61 @@
+-- Adds per-plant hourly and daily rollups of the readings: a count and the
+-- min, max, sum and sum of squares of soil moisture and temperature. The short
+-- pipeline adds each newly inserted reading to them in the same transaction,
+-- and they are not truncated with the recordings table.
+
+IF OBJECT_ID('gamma.hourly_rollups') IS NULL
+    CREATE TABLE gamma.hourly_rollups (
+        plant_id INT NOT NULL,
+        period_start DATETIME NOT NULL,
+        reading_count INT NOT NULL,
+        soil_moisture_min FLOAT(53) NOT NULL,
+        soil_moisture_max FLOAT(53) NOT NULL,
+        soil_moisture_sum FLOAT(53) NOT NULL,
+        soil_moisture_sum_squares FLOAT(53) NOT NULL,
+        temperature_min FLOAT(53) NOT NULL,
+        temperature_max FLOAT(53) NOT NULL,
+        temperature_sum FLOAT(53) NOT NULL,
+        temperature_sum_squares FLOAT(53) NOT NULL,
+        PRIMARY KEY(plant_id, period_start),
+        FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
+    );
+
+IF OBJECT_ID('gamma.daily_rollups') IS NULL
+    CREATE TABLE gamma.daily_rollups (
+        plant_id INT NOT NULL,
+        period_start DATE NOT NULL,
+        reading_count INT NOT NULL,
+        soil_moisture_min FLOAT(53) NOT NULL,
+        soil_moisture_max FLOAT(53) NOT NULL,
+        soil_moisture_sum FLOAT(53) NOT NULL,
+        soil_moisture_sum_squares FLOAT(53) NOT NULL,
+        temperature_min FLOAT(53) NOT NULL,
+        temperature_max FLOAT(53) NOT NULL,
+        temperature_sum FLOAT(53) NOT NULL,
+        temperature_sum_squares FLOAT(53) NOT NULL,
+        PRIMARY KEY(plant_id, period_start),
+        FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
+    );
+GO
+
+INSERT INTO gamma.hourly_rollups
+    (plant_id, period_start, reading_count,
+    soil_moisture_min, soil_moisture_max, soil_moisture_sum, soil_moisture_sum_squares,
+    temperature_min, temperature_max, temperature_sum, temperature_sum_squares)
+SELECT plant_id, DATEADD(HOUR, DATEDIFF(HOUR, 0, time_taken), 0), COUNT(*),
+    MIN(soil_moisture), MAX(soil_moisture), SUM(soil_moisture), SUM(soil_moisture * soil_moisture),
+    MIN(temperature), MAX(temperature), SUM(temperature), SUM(temperature * temperature)
+FROM gamma.recordings AS r
+WHERE NOT EXISTS (SELECT 1 FROM gamma.hourly_rollups AS t WHERE t.plant_id = r.plant_id)
+GROUP BY plant_id, DATEADD(HOUR, DATEDIFF(HOUR, 0, time_taken), 0);
+
+INSERT INTO gamma.daily_rollups
+    (plant_id, period_start, reading_count,
+    soil_moisture_min, soil_moisture_max, soil_moisture_sum, soil_moisture_sum_squares,
+    temperature_min, temperature_max, temperature_sum, temperature_sum_squares)
+SELECT plant_id, CAST(time_taken AS DATE), COUNT(*),
+    MIN(soil_moisture), MAX(soil_moisture), SUM(soil_moisture), SUM(soil_moisture * soil_moisture),
+    MIN(temperature), MAX(temperature), SUM(temperature), SUM(temperature * temperature)
+FROM gamma.recordings AS r
+WHERE NOT EXISTS (SELECT 1 FROM gamma.daily_rollups AS t WHERE t.plant_id = r.plant_id)
+GROUP BY plant_id, CAST(time_taken AS DATE);
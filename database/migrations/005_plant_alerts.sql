@@ -0,0 +1,19 @@
+-- Adds the plant checker's alert state: one row per plant and rule, open while
+-- the rule keeps firing and resolved once it stops, with when it was first and
+-- last seen and when an email last mentioned it. The checker uses it to email
+-- new and resolved incidents once and repeat open ones only after a cooldown.
+
+IF OBJECT_ID('gamma.plant_alerts') IS NULL
+    CREATE TABLE gamma.plant_alerts (
+        plant_id INT NOT NULL,
+        alert_rule VARCHAR(50) NOT NULL,
+        alert_state VARCHAR(10) NOT NULL,
+        first_seen DATETIME NOT NULL,
+        last_seen DATETIME NOT NULL,
+        last_notified DATETIME NULL,
+        resolved_at DATETIME NULL,
+        PRIMARY KEY(plant_id, alert_rule),
+        FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id),
+        CONSTRAINT ck_plant_alerts_state CHECK (alert_state IN ('open', 'resolved'))
+    );
+GO
@@ -0,0 +1,22 @@
+-- Adds the plant checker's rolling state: for each plant, the out-of-range flags
+-- of its newest readings as JSON [time_taken, flag] pairs, newest first, and a
+-- single recording_id watermark. Each run reads only recordings above the
+-- watermark. The state is rebuilt on the checker's next run if the recordings
+-- table is truncated and its identity restarts below the watermark.
+
+IF OBJECT_ID('gamma.plant_checker_state') IS NULL
+    CREATE TABLE gamma.plant_checker_state (
+        plant_id INT NOT NULL,
+        flag_history VARCHAR(MAX) NOT NULL,
+        PRIMARY KEY(plant_id),
+        FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
+    );
+
+IF OBJECT_ID('gamma.plant_checker_watermark') IS NULL
+    CREATE TABLE gamma.plant_checker_watermark (
+        watermark_id TINYINT NOT NULL DEFAULT 1,
+        recording_id BIGINT NOT NULL,
+        PRIMARY KEY(watermark_id),
+        CONSTRAINT ck_plant_checker_watermark_single CHECK (watermark_id = 1)
+    );
+GO
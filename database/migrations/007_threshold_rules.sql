@@ -0,0 +1,35 @@
+-- Adds the plant checker's threshold rules. A rule sets the accepted soil
+-- moisture and temperature range of a species or, overriding it, of one plant.
+-- A NULL bound is inherited from the species rule, then from the checker's
+-- defaults. The watermark records a fingerprint of the rules its flags were
+-- computed with, so the checker rebuilds its state when they change.
+
+IF OBJECT_ID('gamma.threshold_rules') IS NULL
+    CREATE TABLE gamma.threshold_rules (
+        threshold_rule_id INT IDENTITY(1,1),
+        plant_species_id INT NULL,
+        plant_id INT NULL,
+        soil_moisture_min FLOAT(53) NULL,
+        soil_moisture_max FLOAT(53) NULL,
+        temperature_min FLOAT(53) NULL,
+        temperature_max FLOAT(53) NULL,
+        PRIMARY KEY(threshold_rule_id),
+        FOREIGN KEY(plant_species_id) REFERENCES gamma.plant_species(plant_species_id),
+        FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id),
+        CONSTRAINT ck_threshold_rules_target CHECK (
+            (plant_species_id IS NULL AND plant_id IS NOT NULL)
+            OR (plant_species_id IS NOT NULL AND plant_id IS NULL))
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_threshold_rules_species')
+    CREATE UNIQUE INDEX ux_threshold_rules_species
+        ON gamma.threshold_rules (plant_species_id) WHERE plant_species_id IS NOT NULL;
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_threshold_rules_plant')
+    CREATE UNIQUE INDEX ux_threshold_rules_plant
+        ON gamma.threshold_rules (plant_id) WHERE plant_id IS NOT NULL;
+
+IF COL_LENGTH('gamma.plant_checker_watermark', 'rules_hash') IS NULL
+    ALTER TABLE gamma.plant_checker_watermark ADD rules_hash VARCHAR(64) NULL;
+GO
@@ -0,0 +1,19 @@
+-- Adds the plant checker's anomaly state: for each plant, the number of
+-- readings seen, the time of the newest, the exponentially weighted mean and
+-- variance of its soil moisture and temperature, and whether its newest
+-- reading was anomalous. Readings no newer than last_time_taken are ignored.
+
+IF OBJECT_ID('gamma.plant_anomaly_state') IS NULL
+    CREATE TABLE gamma.plant_anomaly_state (
+        plant_id INT NOT NULL,
+        readings INT NOT NULL,
+        last_time_taken DATETIME2 NOT NULL,
+        soil_moisture_mean FLOAT(53) NOT NULL,
+        soil_moisture_var FLOAT(53) NOT NULL,
+        temperature_mean FLOAT(53) NOT NULL,
+        temperature_var FLOAT(53) NOT NULL,
+        anomalous BIT NOT NULL,
+        PRIMARY KEY(plant_id),
+        FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
+    );
+GO
@@ -1,3 +1,11 @@
+DROP TABLE IF EXISTS gamma.plant_anomaly_state;
+DROP TABLE IF EXISTS gamma.threshold_rules;
+DROP TABLE IF EXISTS gamma.plant_checker_watermark;
+DROP TABLE IF EXISTS gamma.plant_checker_state;
+DROP TABLE IF EXISTS gamma.plant_alerts;
+DROP TABLE IF EXISTS gamma.daily_rollups;
+DROP TABLE IF EXISTS gamma.hourly_rollups;
+DROP TABLE IF EXISTS gamma.plant_latest_state;
 DROP TABLE IF EXISTS gamma.recordings;
 DROP TABLE IF EXISTS gamma.plants;
 DROP TABLE IF EXISTS gamma.origins;
@@ -77,3 +85,118 @@ CREATE TABLE gamma.recordings (
     FOREIGN KEY(botanist_id) REFERENCES gamma.botanists(botanist_id),
     FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
 );
+
+CREATE UNIQUE INDEX ux_recordings_plant_time
+ON gamma.recordings (plant_id, time_taken DESC)
+INCLUDE (soil_moisture, temperature, last_watering, botanist_id);
+
+CREATE INDEX ix_recordings_plant_last_watering
+ON gamma.recordings (plant_id, last_watering DESC);
+
+CREATE TABLE gamma.plant_latest_state (
+    plant_id INT NOT NULL,
+    time_taken DATETIME NOT NULL,
+    soil_moisture FLOAT(53) NOT NULL,
+    temperature FLOAT(53) NOT NULL,
+    last_watering DATETIME NOT NULL,
+    botanist_id INT NOT NULL,
+    history VARCHAR(MAX) NOT NULL,
+    PRIMARY KEY(plant_id),
+    FOREIGN KEY(botanist_id) REFERENCES gamma.botanists(botanist_id),
+    FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
+);
+
+CREATE TABLE gamma.hourly_rollups (
+    plant_id INT NOT NULL,
+    period_start DATETIME NOT NULL,
+    reading_count INT NOT NULL,
+    soil_moisture_min FLOAT(53) NOT NULL,
+    soil_moisture_max FLOAT(53) NOT NULL,
+    soil_moisture_sum FLOAT(53) NOT NULL,
+    soil_moisture_sum_squares FLOAT(53) NOT NULL,
+    temperature_min FLOAT(53) NOT NULL,
+    temperature_max FLOAT(53) NOT NULL,
+    temperature_sum FLOAT(53) NOT NULL,
+    temperature_sum_squares FLOAT(53) NOT NULL,
+    PRIMARY KEY(plant_id, period_start),
+    FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
+);
+
+CREATE TABLE gamma.daily_rollups (
+    plant_id INT NOT NULL,
+    period_start DATE NOT NULL,
+    reading_count INT NOT NULL,
+    soil_moisture_min FLOAT(53) NOT NULL,
+    soil_moisture_max FLOAT(53) NOT NULL,
+    soil_moisture_sum FLOAT(53) NOT NULL,
+    soil_moisture_sum_squares FLOAT(53) NOT NULL,
+    temperature_min FLOAT(53) NOT NULL,
+    temperature_max FLOAT(53) NOT NULL,
+    temperature_sum FLOAT(53) NOT NULL,
+    temperature_sum_squares FLOAT(53) NOT NULL,
+    PRIMARY KEY(plant_id, period_start),
+    FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
+);
+
+CREATE TABLE gamma.plant_alerts (
+    plant_id INT NOT NULL,
+    alert_rule VARCHAR(50) NOT NULL,
+    alert_state VARCHAR(10) NOT NULL,
+    first_seen DATETIME NOT NULL,
+    last_seen DATETIME NOT NULL,
+    last_notified DATETIME NULL,
+    resolved_at DATETIME NULL,
+    PRIMARY KEY(plant_id, alert_rule),
+    FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id),
+    CONSTRAINT ck_plant_alerts_state CHECK (alert_state IN ('open', 'resolved'))
+);
+
+CREATE TABLE gamma.plant_checker_state (
+    plant_id INT NOT NULL,
+    flag_history VARCHAR(MAX) NOT NULL,
+    PRIMARY KEY(plant_id),
+    FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
+);
+
+CREATE TABLE gamma.plant_checker_watermark (
+    watermark_id TINYINT NOT NULL DEFAULT 1,
+    recording_id BIGINT NOT NULL,
+    rules_hash VARCHAR(64) NULL,
+    PRIMARY KEY(watermark_id),
+    CONSTRAINT ck_plant_checker_watermark_single CHECK (watermark_id = 1)
+);
+
+CREATE TABLE gamma.threshold_rules (
+    threshold_rule_id INT IDENTITY(1,1),
+    plant_species_id INT NULL,
+    plant_id INT NULL,
+    soil_moisture_min FLOAT(53) NULL,
+    soil_moisture_max FLOAT(53) NULL,
+    temperature_min FLOAT(53) NULL,
+    temperature_max FLOAT(53) NULL,
+    PRIMARY KEY(threshold_rule_id),
+    FOREIGN KEY(plant_species_id) REFERENCES gamma.plant_species(plant_species_id),
+    FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id),
+    CONSTRAINT ck_threshold_rules_target CHECK (
+        (plant_species_id IS NULL AND plant_id IS NOT NULL)
+        OR (plant_species_id IS NOT NULL AND plant_id IS NULL))
+);
+
+CREATE UNIQUE INDEX ux_threshold_rules_species
+    ON gamma.threshold_rules (plant_species_id) WHERE plant_species_id IS NOT NULL;
+
+CREATE UNIQUE INDEX ux_threshold_rules_plant
+    ON gamma.threshold_rules (plant_id) WHERE plant_id IS NOT NULL;
+
+CREATE TABLE gamma.plant_anomaly_state (
+    plant_id INT NOT NULL,
+    readings INT NOT NULL,
+    last_time_taken DATETIME2 NOT NULL,
+    soil_moisture_mean FLOAT(53) NOT NULL,
+    soil_moisture_var FLOAT(53) NOT NULL,
+    temperature_mean FLOAT(53) NOT NULL,
+    temperature_var FLOAT(53) NOT NULL,
+    anomalous BIT NOT NULL,
+    PRIMARY KEY(plant_id),
+    FOREIGN KEY(plant_id) REFERENCES gamma.plants(plant_id)
+);
@@ -0,0 +1,130 @@
+"""Compares the CSV archive against the partitioned Parquet archive.
+
+For each format and compression codec it reports the time to write a
+synthetic export, the bytes stored, the time to read everything back and the
+time to read one plant's soil moisture for one day, which Parquet answers
+from a single partition and column.
+
+Usage: python benchmark_archive.py --days 7 --plants 50 --codecs snappy gzip zstd"""
+
+import argparse
+from os import path, walk
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from transform_long import (write_csv_chunks, write_parquet_chunks, get_partition_path,
+                            get_plant_bucket)
+
+
+def make_chunks(days: int, plants: int, chunk_size: int = 10_000) -> list[pd.DataFrame]:
+    """Returns one reading per plant per minute over a number of days, in
+    recording_id order, split into export-sized chunks."""
+
+    minutes = days * 24 * 60
+    rng = np.random.default_rng(0)
+    rows = minutes * plants
+    timestamps = pd.Timestamp("2024-10-01") + pd.to_timedelta(
+        np.repeat(np.arange(minutes), plants), unit="min")
+
+    data = pd.DataFrame({
+        "recording_id": np.arange(1, rows + 1),
+        "timestamp": timestamps,
+        "soil_moisture": rng.uniform(10, 80, rows).round(3),
+        "temperature": rng.uniform(10, 30, rows).round(3),
+        "plant_id": np.tile(np.arange(1, plants + 1), minutes),
+        "botanist_id": rng.integers(1, 4, rows)
+    })
+
+    return [data.iloc[start:start + chunk_size] for start in range(0, rows, chunk_size)]
+
+
+def get_size(directory: str) -> int:
+    """Returns the total size of the files under a directory."""
+
+    return sum(path.getsize(path.join(root, name))
+               for root, _, names in walk(directory) for name in names)
+
+
+def benchmark_csv(chunks: list[pd.DataFrame], plant_id: int) -> tuple:
+    """Returns write time, size, full read time and one plant-day read time
+    for the CSV archive."""
+
+    with TemporaryDirectory() as directory:
+        file_path = path.join(directory, "01-10-2024.csv")
+
+        timer = perf_counter()
+        with open(file_path, "wb") as csv_file:
+            write_csv_chunks(chunks, csv_file)
+        write_time = perf_counter() - timer
+
+        size = get_size(directory)
+
+        timer = perf_counter()
+        pd.read_csv(file_path, parse_dates=["timestamp"])
+        read_time = perf_counter() - timer
+
+        timer = perf_counter()
+        data = pd.read_csv(file_path, parse_dates=["timestamp"])
+        data[(data["plant_id"] == plant_id)
+             & (data["timestamp"].dt.date == pd.Timestamp("2024-10-01").date())]["soil_moisture"]
+        plant_time = perf_counter() - timer
+
+    return write_time, size, read_time, plant_time
+
+
+def benchmark_parquet(chunks: list[pd.DataFrame], plant_id: int, codec: str) -> tuple:
+    """Returns write time, size, full read time and one plant-day read time
+    for the Parquet archive with one codec."""
+
+    with TemporaryDirectory() as directory:
+        timer = perf_counter()
+        write_parquet_chunks(chunks, directory, "01-10-2024.parquet", codec=codec)
+        write_time = perf_counter() - timer
+
+        size = get_size(directory)
+
+        timer = perf_counter()
+        pq.read_table(directory).to_pandas()
+        read_time = perf_counter() - timer
+
+        partition = path.join(directory, get_partition_path("2024-10-01",
+                                                            get_plant_bucket(plant_id)))
+        timer = perf_counter()
+        pq.read_table(partition, columns=["timestamp", "soil_moisture"],
+                      filters=[("plant_id", "=", plant_id)]).to_pandas()
+        plant_time = perf_counter() - timer
+
+    return write_time, size, read_time, plant_time
+
+
+def report(name: str, result: tuple, csv_size: int) -> None:
+    """Prints one row of the results."""
+
+    write_time, size, read_time, plant_time = result
+    print(f"{name:<16} | write {write_time:7.3f}s | {size / 1e6:8.2f} MB"
+          f" ({csv_size / size:5.1f}x smaller) | read all {read_time:7.3f}s"
+          f" | read one plant-day {plant_time:7.4f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", "-d", type=int, default=7,
+                        help="Days of readings to archive")
+    parser.add_argument("--plants", "-p", type=int, default=50,
+                        help="Plants read each minute")
+    parser.add_argument("--codecs", "-c", nargs="+", default=["none", "snappy", "gzip", "zstd"],
+                        help="Parquet compression codecs to compare")
+    args = parser.parse_args()
+
+    recordings = make_chunks(args.days, args.plants)
+    print(f"{sum(len(chunk) for chunk in recordings):,} readings")
+
+    csv_result = benchmark_csv(recordings, 1)
+    report("csv", csv_result, csv_result[1])
+    for compression in args.codecs:
+        report(f"parquet {compression}", benchmark_parquet(recordings, 1, compression),
+               csv_result[1])
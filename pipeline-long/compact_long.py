@@ -0,0 +1,286 @@
+"""A command to compact the long-term archive into monthly objects.
+
+Every file in the manifest whose readings all fall in finished months is
+merged, with any earlier monthly object for the same month, into one new
+object per month sorted by plant_id then timestamp, with a fresh sketches
+sidecar computed from the merged readings. The new objects replace
+the old entries in a single manifest write, after which the superseded files
+are deleted.
+
+The manifest is the only record of what the archive holds, so an interrupted
+run is safe to repeat: monthly objects written but never added to the
+manifest are deleted, as are files the manifest already marks as superseded.
+Run it when the nightly pipeline is not running, as both rewrite the manifest.
+
+Usage: python compact_long.py [--dry-run]"""
+
+from datetime import datetime
+from os import environ as ENV
+from tempfile import TemporaryFile, NamedTemporaryFile
+from uuid import uuid4
+import argparse
+import logging
+import boto3
+from dotenv import load_dotenv
+import pandas as pd
+
+from load_long import MultipartUpload
+from manifest import (FileStats, load_manifest, save_manifest, list_archive_files,
+                      read_archive_chunks, hash_file, ARCHIVE_SUFFIXES)
+from sketches import SKETCH_SUFFIX
+from transform_long import (write_csv_chunks, get_archive_schema, ARCHIVE_CODEC,
+                            ARCHIVE_DTYPES, ROW_GROUP_SIZE, pa, pq)
+
+LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = ENV.get("ARCHIVE_FORMAT", "csv").lower()
+
+MONTHLY_FOLDER = "monthly/"
+
+WRITE_CHUNK_SIZE = 100_000
+
+DELETE_BATCH_SIZE = 1000
+
+SORT_COLUMNS = ["plant_id", "timestamp", "recording_id"]
+
+
+def get_month(timestamp) -> str:
+    """Returns the month of a timestamp as YYYY-MM."""
+
+    return pd.Timestamp(timestamp).strftime("%Y-%m")
+
+
+def get_entry_months(entry: dict) -> list[str]:
+    """Returns every month a manifest entry holds readings for."""
+
+    months = pd.period_range(pd.Timestamp(entry["min_timestamp"]).to_period("M"),
+                             pd.Timestamp(entry["max_timestamp"]).to_period("M"), freq="M")
+    return [str(month) for month in months]
+
+
+def get_monthly_key(folder_path: str, month: str, run_id: str,
+                    archive_format: str = ARCHIVE_FORMAT) -> str:
+    """Returns the key of a new monthly object. Each run writes new keys so
+    an object in the manifest is never overwritten."""
+
+    suffix = ".parquet" if archive_format == "parquet" else ".csv.gz"
+    return f"{folder_path}{MONTHLY_FOLDER}{month}-{run_id}{suffix}"
+
+
+def plan_compaction(manifest: dict, current_month: str) -> list[dict[str, list[str]]]:
+    """Returns the months to compact and their source files, in groups that
+    must be written together because a daily file spans the months in them.
+    Only months before current_month are compacted, and a month whose only
+    source is its existing monthly object is left alone."""
+
+    months = {}
+    for key, entry in manifest["files"].items():
+        entry_months = get_entry_months(entry)
+        if entry_months[-1] >= current_month:
+            continue
+        for month in entry_months:
+            months.setdefault(month, []).append(key)
+
+    months = {month: sorted(keys) for month, keys in months.items()
+              if any(not manifest["files"][key].get("compacted") for key in keys)}
+
+    groups = []
+    for month in sorted(months):
+        shared = groups and set(months[month]) & set().union(*groups[-1].values())
+        if shared:
+            groups[-1][month] = months[month]
+        else:
+            groups.append({month: months[month]})
+
+    return groups
+
+
+def read_month(s3_client, bucket_name: str, key: str, month: str) -> pd.DataFrame:
+    """Returns the readings in an archive file that were taken in a month."""
+
+    start = pd.Timestamp(f"{month}-01")
+    end = start + pd.offsets.MonthBegin(1)
+
+    with TemporaryFile() as file:
+        s3_client.download_fileobj(bucket_name, key, file)
+        file.seek(0)
+        frames = []
+        for chunk in read_archive_chunks(file, key):
+            timestamps = pd.to_datetime(chunk["timestamp"])
+            chunk = chunk.assign(timestamp=timestamps)
+            frames.append(chunk[(timestamps >= start) & (timestamps < end)])
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_csv_object(s3_client, bucket_name: str, key: str,
+                     data: pd.DataFrame) -> tuple[FileStats, str, int]:
+    """Uploads sorted readings as a compressed CSV. Returns the file's
+    statistics, content hash and size."""
+
+    stats = FileStats()
+    chunks = (data.iloc[start:start + WRITE_CHUNK_SIZE]
+              for start in range(0, len(data), WRITE_CHUNK_SIZE))
+
+    with MultipartUpload(bucket_name, key, compression="gzip", s3_client=s3_client) as upload:
+        write_csv_chunks(stats.track(chunks), upload)
+
+    return stats, upload.content_hash, upload.bytes_uploaded
+
+
+def write_parquet_object(s3_client, bucket_name: str, key: str,
+                         data: pd.DataFrame) -> tuple[FileStats, str, int]:
+    """Uploads sorted readings as one Parquet file, whose row groups then
+    cover narrow plant_id ranges. Returns the file's statistics, content
+    hash and size."""
+
+    if pq is None:
+        raise ImportError("pyarrow is required for the Parquet archive.")
+
+    stats = FileStats()
+    stats.update(data)
+    table = pa.Table.from_pandas(data[list(ARCHIVE_DTYPES)].astype(ARCHIVE_DTYPES),
+                                 schema=get_archive_schema(), preserve_index=False)
+
+    with NamedTemporaryFile(suffix=".parquet") as file:
+        pq.write_table(table, file.name, compression=ARCHIVE_CODEC,
+                       row_group_size=ROW_GROUP_SIZE)
+        file.seek(0)
+        content_hash = hash_file(file)
+        size = file.seek(0, 2)
+        s3_client.upload_file(file.name, bucket_name, key)
+
+    return stats, content_hash, size
+
+
+WRITERS = {"csv": write_csv_object, "parquet": write_parquet_object}
+
+
+def compact_month(s3_client, bucket_name: str, key: str, month: str, sources: list[str],
+                  archive_format: str = ARCHIVE_FORMAT) -> tuple[dict, int]:
+    """Merges a month's readings from its source files into one object sorted
+    by plant_id and timestamp, dropping readings exported more than once, and
+    uploads its sketches sidecar. Returns the new manifest entry and the
+    number of duplicates dropped."""
+
+    data = pd.concat([read_month(s3_client, bucket_name, source, month) for source in sources],
+                     ignore_index=True)
+    rows = len(data)
+    data = data.drop_duplicates("recording_id").sort_values(SORT_COLUMNS, ignore_index=True)
+
+    stats, content_hash, size = WRITERS[archive_format](s3_client, bucket_name, key, data)
+
+    entry = stats.save(s3_client, bucket_name, key, content_hash, size)
+    entry.update({"compacted": True, "month": month})
+    return entry, rows - len(data)
+
+
+def delete_objects(s3_client, bucket_name: str, keys: list[str]) -> None:
+    """Deletes objects in batches of up to DELETE_BATCH_SIZE keys."""
+
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start:start + DELETE_BATCH_SIZE]
+        s3_client.delete_objects(Bucket=bucket_name,
+                                 Delete={"Objects": [{"Key": key} for key in batch],
+                                         "Quiet": True})
+
+
+def clean_up(s3_client, bucket_name: str, folder_path: str, manifest: dict) -> int:
+    """Deletes the files left behind by an earlier run: superseded files the
+    manifest still lists for deletion, and monthly objects and sidecars that
+    never made it into the manifest. Returns the number of objects deleted."""
+
+    superseded = manifest.get("superseded", [])
+    referenced = set(manifest["files"]) | {entry["sketches"] for entry in
+                                           manifest["files"].values() if "sketches" in entry}
+    orphans = [key for key in list_archive_files(s3_client, bucket_name,
+                                                 f"{folder_path}{MONTHLY_FOLDER}",
+                                                 ARCHIVE_SUFFIXES + (SKETCH_SUFFIX,))
+               if key not in referenced]
+
+    delete_objects(s3_client, bucket_name, list(dict.fromkeys(superseded + orphans)))
+
+    if superseded:
+        manifest["superseded"] = []
+        save_manifest(s3_client, bucket_name, folder_path, manifest)
+
+    if superseded or orphans:
+        LOGGER.info("Deleted %s superseded and %s orphaned objects.",
+                    len(superseded), len(orphans))
+
+    return len(superseded) + len(orphans)
+
+
+def compact_archive(s3_client, bucket_name: str, folder_path: str,
+                    archive_format: str = ARCHIVE_FORMAT, current_month: str | None = None,
+                    dry_run: bool = False) -> dict:
+    """Compacts every finished month of the archive into one object per month.
+    Returns the object counts and bytes before and after, and the rows and
+    duplicates seen."""
+
+    current_month = current_month or get_month(datetime.now())
+    run_id = f"{datetime.now():%Y%m%d%H%M%S}-{uuid4().hex[:8]}"
+
+    manifest = load_manifest(s3_client, bucket_name, folder_path)
+    if not dry_run:
+        clean_up(s3_client, bucket_name, folder_path, manifest)
+
+    report = {"months": 0, "objects_before": 0, "bytes_before": 0, "objects_after": 0,
+              "bytes_after": 0, "rows": 0, "duplicates": 0}
+
+    for group in plan_compaction(manifest, current_month):
+        sources = sorted(set().union(*group.values()))
+        report["months"] += len(group)
+        report["objects_before"] += len(sources)
+        report["bytes_before"] += sum(manifest["files"][key]["size"] for key in sources)
+
+        if dry_run:
+            report["objects_after"] += len(group)
+            LOGGER.info("Would compact %s files into months %s.", len(sources), list(group))
+            continue
+
+        entries = {}
+        for month, month_sources in group.items():
+            key = get_monthly_key(folder_path, month, run_id, archive_format)
+            entries[key], duplicates = compact_month(s3_client, bucket_name, key, month,
+                                                     month_sources, archive_format)
+            report["objects_after"] += 1
+            report["bytes_after"] += entries[key]["size"]
+            report["rows"] += entries[key]["rows"]
+            report["duplicates"] += duplicates
+            LOGGER.info("Compacted %s files into %s.", len(month_sources), key)
+
+        superseded = []
+        for key in sources:
+            entry = manifest["files"].pop(key)
+            superseded.extend([key, entry["sketches"]] if "sketches" in entry else [key])
+        manifest["files"].update(entries)
+        manifest["superseded"] = superseded
+        save_manifest(s3_client, bucket_name, folder_path, manifest)
+
+        clean_up(s3_client, bucket_name, folder_path, manifest)
+
+    return report
+
+
+def format_report(report: dict) -> str:
+    """Returns a one line summary of a compaction."""
+
+    return (f"Compacted {report['months']} months: {report['objects_before']} objects "
+            f"({report['bytes_before'] / 1e6:.2f} MB) before, {report['objects_after']} "
+            f"objects ({report['bytes_after'] / 1e6:.2f} MB) after, {report['rows']} rows, "
+            f"{report['duplicates']} duplicate readings dropped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report what would be compacted without changing the archive")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    result = compact_archive(boto3.client("s3"), ENV["S3_BUCKET_NAME"],
+                             ENV["S3_FOLDER_PATH"], dry_run=args.dry_run)
+    print(format_report(result))
@@ -2,6 +2,7 @@
 into a CSV to be stored in an S3 bucket."""
 
 from os import environ as ENV
+from typing import Iterator
 import logging
 from pymssql import connect
 from dotenv import load_dotenv
@@ -11,6 +12,16 @@ from logging_long import logger_setup
 
 LOGGER = logging.getLogger(__name__)
 
+EXPORT_CHUNK_SIZE = int(ENV.get("EXPORT_CHUNK_SIZE", 10_000))
+
+DELETE_BATCH_SIZE = int(ENV.get("DELETE_BATCH_SIZE", 4_000))
+
+COLUMNS = ["recording_id", "timestamp", "soil_moisture", "temperature",
+           "plant_id", "botanist_id"]
+
+EXPORT_COLUMNS = ["recording_id", "time_taken AS timestamp", "soil_moisture",
+                  "temperature", "plant_id", "botanist_id"]
+
 
 def connect_to_rds():
     """Connects to an RDS database using pyodbc."""
@@ -26,38 +37,77 @@ def connect_to_rds():
     return conn
 
 
-def extract_plant_data() -> pd.DataFrame:
-    """Extracts plant data older than 24 from the RDS and truncates the
-    recordings table."""
+def get_watermark(conn) -> int | None:
+    """Returns the highest recording_id currently stored, or None if the
+    recordings table is empty. Only rows up to it are exported and deleted."""
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(recording_id) AS watermark FROM gamma.recordings;")
+        watermark = cur.fetchone()["watermark"]
+
+    LOGGER.info("Captured recording_id watermark %s.", watermark)
+    return watermark
+
 
-    extract_query = (
-        "SELECT * FROM gamma.recordings; "
-    ).strip()
+def stream_plant_data(conn, watermark: int,
+                      chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Yields the recordings at or below the watermark, in recording_id
+    order, as DataFrames of at most chunk_size rows."""
 
-    truncate_query = "TRUNCATE TABLE gamma.recordings;"
+    extract_query = f"""SELECT {", ".join(EXPORT_COLUMNS)}
+        FROM gamma.recordings
+        WHERE recording_id <= %s
+        ORDER BY recording_id;"""
 
-    with connect_to_rds() as conn:
-        try:
-            LOGGER.info("Executing extract query.")
-            with conn.cursor() as cur:
-                cur.execute(extract_query)
-                result = cur.fetchall()
-                LOGGER.info("Data extraction successful.")
+    with conn.cursor() as cur:
+        LOGGER.info("Executing extract query.")
+        cur.execute(extract_query, (watermark,))
 
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=COLUMNS)
 
-            df = pd.DataFrame(result, columns=['recording_id','timestamp','soil_moisture','temperature','plant_id','botanist_id'])
+    LOGGER.info("Data extraction successful.")
 
-        except Exception as e:
-            LOGGER.error("Error during data extraction: %s", e)
-            return pd.DataFrame(columns=["recording_id", "timestamp", "soil_moisture", "temperature", "plant_id", "botanist_id"])
 
-        LOGGER.info("Executing truncate query.")
+def count_recordings(conn, watermark: int) -> int:
+    """Returns the number of recordings at or below the watermark."""
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT_BIG(*) AS total FROM gamma.recordings "
+                    "WHERE recording_id <= %s;", (watermark,))
+        return cur.fetchone()["total"]
+
+
+def delete_exported(conn, watermark: int, exported: int,
+                    batch_size: int = DELETE_BATCH_SIZE) -> int:
+    """Deletes the exported recordings at or below the watermark in batches,
+    committing after each. Nothing is deleted if the number of rows at or
+    below the watermark no longer matches the number exported, as a reading
+    committed late would otherwise be lost. Returns the number deleted."""
+
+    stored = count_recordings(conn, watermark)
+    if stored != exported:
+        LOGGER.error("Exported %s recordings but %s are stored below the watermark, "
+                     "not deleting.", exported, stored)
+        return 0
+
+    deleted = 0
+    while True:
         with conn.cursor() as cur:
-            cur.execute(truncate_query)
-            conn.commit()
-            LOGGER.info("Recordings table truncated successfully.")
+            cur.execute("DELETE TOP (%s) FROM gamma.recordings WHERE recording_id <= %s;",
+                        (batch_size, watermark))
+            batch = cur.rowcount
+        conn.commit()
+
+        deleted += max(batch, 0)
+        if batch < batch_size:
+            break
 
-    return df.rename(columns={"time_taken": "timestamp"})
+    LOGGER.info("Deleted %s exported recordings.", deleted)
+    return deleted
 
 
 if __name__ == "__main__":
@@ -66,12 +116,11 @@ if __name__ == "__main__":
     load_dotenv()
     LOGGER.info("Loading environment variables from .env file.")
 
-    plant_data = extract_plant_data()
-
-    if not plant_data.empty:
-        LOGGER.info("Extracted %s records", len(plant_data))
-        for i in range(len(plant_data)):
-            print(plant_data.iloc[i])
+    with connect_to_rds() as connection:
+        high_water_mark = get_watermark(connection)
 
-    else:
-        LOGGER.info("No data extracted.")
+        if high_water_mark is None:
+            LOGGER.info("No data extracted.")
+        else:
+            LOGGER.info("%s recordings are ready to export.",
+                        count_recordings(connection, high_water_mark))
@@ -1,21 +1,172 @@
 """A file to load the CSV file into a specified S3 bucket."""
 
 from datetime import datetime
-from os import environ as ENV
+from hashlib import sha256
+from os import environ as ENV, path
 import sys
+import zlib
 import boto3
 
+CSV_COMPRESSION = ENV.get("CSV_COMPRESSION", "gzip").lower()
+
+COMPRESSION_LEVEL = int(ENV.get("CSV_COMPRESSION_LEVEL", 6))
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+PART_SIZE = max(MIN_PART_SIZE, int(ENV.get("UPLOAD_PART_SIZE", 8 * 1024 * 1024)))
+
+
+def get_csv_key(folder_path: str, compression: str = CSV_COMPRESSION) -> str:
+    """Returns the key of today's CSV, with a .gz suffix when compressed."""
+
+    current_date = datetime.now().strftime("%d-%m-%Y")
+    suffix = ".csv.gz" if compression == "gzip" else ".csv"
+    return f"{folder_path}{current_date}{suffix}"
+
 
 def upload_csv_to_s3(csv_buffer: bytes, bucket_name: str, folder_path: str):
     """Uploads the CSV file to the specified S3 bucket."""
 
-    current_date = datetime.now().strftime("%d-%m-%Y")
-    filename = f"{folder_path}{current_date}.csv"
+    filename = get_csv_key(folder_path, compression="none")
 
     s3_client = boto3.client("s3")
     s3_client.put_object(Bucket=bucket_name, Key=filename, Body=csv_buffer)
 
 
+class MultipartUpload:
+    """A writable binary file-like object that streams to one S3 object.
+
+    Written bytes are optionally gzip compressed as they arrive and sent as a
+    multipart upload part each time part_size compressed bytes have built up,
+    so at most about one part is held in memory. An object that never fills a
+    part is sent with a single put_object on close. Leaving the context with
+    an exception aborts the upload so no partial object or orphaned parts are
+    left behind. The SHA-256 of the stored bytes is kept for the manifest."""
+
+    def __init__(self, bucket_name: str, key: str, part_size: int = PART_SIZE,
+                 compression: str = CSV_COMPRESSION, s3_client=None):
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.s3_client = s3_client or boto3.client("s3")
+        self.compressor = (zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+                           if compression == "gzip" else None)
+        self.buffer = bytearray()
+        self.digest = sha256()
+        self.upload_id = None
+        self.parts = []
+        self.bytes_written = 0
+        self.bytes_uploaded = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.abort()
+        elif not self.closed:
+            self.close()
+
+    def write(self, data: bytes) -> int:
+        """Compresses data into the buffer and uploads every full part."""
+
+        if self.closed:
+            raise ValueError("Write to a closed upload.")
+
+        self.bytes_written += len(data)
+        self.write_buffer(self.compressor.compress(data) if self.compressor else data)
+
+        return len(data)
+
+    def write_buffer(self, data: bytes) -> None:
+        """Adds bytes ready to store to the buffer and uploads every full part."""
+
+        self.buffer += data
+        self.digest.update(data)
+
+        while len(self.buffer) >= self.part_size:
+            self.upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+
+    def upload_part(self, body: bytes) -> None:
+        """Uploads one part, starting the multipart upload on the first."""
+
+        if self.upload_id is None:
+            response = self.s3_client.create_multipart_upload(Bucket=self.bucket_name,
+                                                              Key=self.key)
+            self.upload_id = response["UploadId"]
+
+        number = len(self.parts) + 1
+        response = self.s3_client.upload_part(Bucket=self.bucket_name, Key=self.key,
+                                              UploadId=self.upload_id, PartNumber=number,
+                                              Body=body)
+        self.parts.append({"ETag": response["ETag"], "PartNumber": number})
+        self.bytes_uploaded += len(body)
+
+    def close(self) -> int:
+        """Flushes the compressor and completes the object.
+        Returns the number of bytes stored."""
+
+        if self.closed:
+            return self.bytes_uploaded
+
+        try:
+            if self.compressor:
+                self.write_buffer(self.compressor.flush())
+
+            if self.upload_id is None:
+                self.s3_client.put_object(Bucket=self.bucket_name, Key=self.key,
+                                          Body=bytes(self.buffer))
+                self.bytes_uploaded += len(self.buffer)
+            else:
+                if self.buffer:
+                    self.upload_part(bytes(self.buffer))
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id,
+                    MultipartUpload={"Parts": self.parts})
+        except Exception:
+            self.abort()
+            raise
+
+        self.buffer = bytearray()
+        self.closed = True
+        return self.bytes_uploaded
+
+    @property
+    def content_hash(self) -> str:
+        """Returns the SHA-256 of the bytes written so far, once stored."""
+
+        return self.digest.hexdigest()
+
+    def abort(self) -> None:
+        """Discards the upload and any parts already sent."""
+
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key,
+                                                  UploadId=self.upload_id)
+            self.upload_id = None
+
+        self.buffer = bytearray()
+        self.closed = True
+
+
+def upload_archive_to_s3(directory: str, files: list[str], bucket_name: str,
+                         folder_path: str) -> list[str]:
+    """Uploads partitioned archive files, given by their paths relative to
+    directory, under the folder path. Returns the uploaded keys."""
+
+    s3_client = boto3.client("s3")
+    keys = []
+
+    for relative_path in files:
+        key = f"{folder_path}{relative_path}"
+        s3_client.upload_file(path.join(directory, relative_path), bucket_name, key)
+        keys.append(key)
+
+    return keys
+
+
 if __name__ == "__main__":
 
     csv_buff = sys.stdin.read()
@@ -0,0 +1,295 @@
+"""A file to maintain the manifest of archived recordings in the S3 bucket.
+
+The manifest is one JSON object under the archive folder with an entry per
+archived file: its row count, the range of timestamps and plant ids it holds,
+a bloom filter of its plant ids and a hash of its content. Readers use it to
+fetch only the files that can hold a plant's readings for a time range
+instead of listing and reading every file."""
+
+from base64 import b64decode, b64encode
+from datetime import datetime
+from hashlib import blake2b, sha256
+from io import BytesIO
+from math import ceil, log
+from os import environ as ENV
+from tempfile import TemporaryFile
+import json
+import logging
+import boto3
+from botocore.exceptions import ClientError
+from dotenv import load_dotenv
+import pandas as pd
+from sketches import PlantSketches, save_sidecar
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+MANIFEST_VERSION = 1
+
+BLOOM_FP_RATE = float(ENV.get("MANIFEST_BLOOM_FP_RATE", 0.01))
+
+ARCHIVE_SUFFIXES = (".csv", ".csv.gz", ".parquet")
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class BloomFilter:
+    """A bloom filter of plant ids, sized for a number of plants and a false
+    positive rate. Positions come from double hashing one blake2b digest so
+    they are the same in every process."""
+
+    def __init__(self, bits: int, hashes: int, data: bytes | None = None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data else bytearray(ceil(bits / 8))
+
+    @classmethod
+    def for_items(cls, items: int, fp_rate: float = BLOOM_FP_RATE) -> "BloomFilter":
+        """Returns an empty filter sized for a number of distinct items."""
+
+        items = max(items, 1)
+        bits = max(64, ceil(-items * log(fp_rate) / log(2) ** 2))
+        hashes = max(1, round(bits / items * log(2)))
+        return cls(bits, hashes)
+
+    def get_positions(self, value: int) -> list[int]:
+        """Returns the bit positions for a value."""
+
+        digest = blake2b(str(int(value)).encode("UTF-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, value: int) -> None:
+        """Adds a value to the filter."""
+
+        for position in self.get_positions(value):
+            self.data[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, value: int) -> bool:
+        return all(self.data[position // 8] & (1 << (position % 8))
+                   for position in self.get_positions(value))
+
+    def to_dict(self) -> dict:
+        """Returns the filter as a JSON serialisable dictionary."""
+
+        return {"bits": self.bits, "hashes": self.hashes,
+                "data": b64encode(bytes(self.data)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, entry: dict) -> "BloomFilter":
+        """Returns the filter stored in a manifest entry."""
+
+        return cls(entry["bits"], entry["hashes"], b64decode(entry["data"]))
+
+
+class FileStats:
+    """Statistics of the recordings written to one archive file, and per-plant
+    sketches of their readings, gathered a chunk at a time as the file is
+    written."""
+
+    def __init__(self):
+        self.rows = 0
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.plant_ids = set()
+        self.sketches = PlantSketches()
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """Adds a chunk of recordings to the statistics."""
+
+        if chunk.empty:
+            return
+
+        timestamps = pd.to_datetime(chunk["timestamp"])
+        low, high = timestamps.min(), timestamps.max()
+
+        self.rows += len(chunk)
+        self.min_timestamp = low if self.min_timestamp is None else min(self.min_timestamp, low)
+        self.max_timestamp = high if self.max_timestamp is None else max(self.max_timestamp, high)
+        self.plant_ids.update(int(plant_id) for plant_id in chunk["plant_id"].unique())
+        self.sketches.update(chunk)
+
+    def track(self, chunks):
+        """Yields the chunks unchanged, adding each one to the statistics."""
+
+        for chunk in chunks:
+            self.update(chunk)
+            yield chunk
+
+    def to_entry(self, content_hash: str, size: int, sketches_key: str | None = None) -> dict:
+        """Returns the manifest entry for the file, naming its sketches
+        sidecar if it has one."""
+
+        bloom = BloomFilter.for_items(len(self.plant_ids))
+        for plant_id in self.plant_ids:
+            bloom.add(plant_id)
+
+        entry = {
+            "rows": self.rows,
+            "min_timestamp": self.min_timestamp.isoformat(sep=" "),
+            "max_timestamp": self.max_timestamp.isoformat(sep=" "),
+            "min_plant_id": min(self.plant_ids),
+            "max_plant_id": max(self.plant_ids),
+            "plant_bloom": bloom.to_dict(),
+            "sha256": content_hash,
+            "size": size
+        }
+        if sketches_key:
+            entry["sketches"] = sketches_key
+
+        return entry
+
+    def save(self, s3_client, bucket_name: str, key: str, content_hash: str,
+             size: int) -> dict:
+        """Uploads the file's sketches sidecar and returns its manifest entry."""
+
+        sidecar = save_sidecar(s3_client, bucket_name, key, self.sketches)
+        return self.to_entry(content_hash, size, sidecar)
+
+
+def hash_file(file) -> str:
+    """Returns the SHA-256 of an open binary file from its start."""
+
+    digest = sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    file.seek(0)
+
+    return digest.hexdigest()
+
+
+def get_manifest_key(folder_path: str) -> str:
+    """Returns the key of the manifest for an archive folder."""
+
+    return f"{folder_path}{MANIFEST_NAME}"
+
+
+def load_manifest(s3_client, bucket_name: str, folder_path: str) -> dict:
+    """Returns the archive folder's manifest, or an empty one if it has none."""
+
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=get_manifest_key(folder_path))
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return {"version": MANIFEST_VERSION, "files": {}}
+        raise
+
+    return json.loads(response["Body"].read())
+
+
+def save_manifest(s3_client, bucket_name: str, folder_path: str, manifest: dict) -> None:
+    """Replaces the archive folder's manifest in a single put, so readers see
+    either the old or the new manifest."""
+
+    manifest["updated_at"] = datetime.now().isoformat(sep=" ", timespec="seconds")
+    s3_client.put_object(Bucket=bucket_name, Key=get_manifest_key(folder_path),
+                         Body=json.dumps(manifest, sort_keys=True).encode("UTF-8"),
+                         ContentType="application/json")
+
+
+def update_manifest(s3_client, bucket_name: str, folder_path: str,
+                    entries: dict[str, dict]) -> dict:
+    """Adds or replaces the entries of archive files, keyed by their S3 key.
+    Returns the new manifest."""
+
+    manifest = load_manifest(s3_client, bucket_name, folder_path)
+    manifest["files"].update(entries)
+    save_manifest(s3_client, bucket_name, folder_path, manifest)
+
+    LOGGER.info("Recorded %s files in the archive manifest.", len(entries))
+    return manifest
+
+
+def may_contain(entry: dict, plant_id: int, start=None, end=None) -> bool:
+    """Returns False if a manifest entry rules out the file holding readings
+    for the plant between start and end, and True otherwise."""
+
+    if start is not None and pd.Timestamp(entry["max_timestamp"]) < pd.Timestamp(start):
+        return False
+    if end is not None and pd.Timestamp(entry["min_timestamp"]) > pd.Timestamp(end):
+        return False
+    if not entry["min_plant_id"] <= plant_id <= entry["max_plant_id"]:
+        return False
+
+    return plant_id in BloomFilter.from_dict(entry["plant_bloom"])
+
+
+def select_files(manifest: dict, plant_id: int, start=None, end=None) -> list[str]:
+    """Returns the keys of the archive files that may hold readings for the
+    plant between start and end, oldest first."""
+
+    files = manifest["files"]
+    return sorted((key for key, entry in files.items()
+                   if may_contain(entry, plant_id, start, end)),
+                  key=lambda key: files[key]["min_timestamp"])
+
+
+def list_archive_files(s3_client, bucket_name: str, folder_path: str,
+                       suffixes: tuple[str, ...] = ARCHIVE_SUFFIXES) -> list[str]:
+    """Returns the keys of every archive file under the folder, or of every
+    object ending in one of suffixes, following every page of the listing."""
+
+    paginator = s3_client.get_paginator("list_objects_v2")
+    keys = []
+
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=folder_path):
+        keys.extend(obj["Key"] for obj in page.get("Contents", [])
+                    if obj["Key"].endswith(suffixes))
+
+    return keys
+
+
+def read_archive_chunks(file, key: str, chunk_size: int = 100_000):
+    """Yields the recordings in a downloaded archive file in chunks."""
+
+    if key.endswith(".parquet"):
+        yield pd.read_parquet(BytesIO(file.read()))
+        return
+
+    compression = "gzip" if key.endswith(".gz") else None
+    yield from pd.read_csv(file, compression=compression, chunksize=chunk_size)
+
+
+def get_object_entry(s3_client, bucket_name: str, key: str) -> dict | None:
+    """Downloads an archive file, uploads its sketches sidecar and returns
+    its manifest entry, or None if it holds no recordings."""
+
+    with TemporaryFile() as file:
+        s3_client.download_fileobj(bucket_name, key, file)
+        size = file.tell()
+        content_hash = hash_file(file)
+
+        stats = FileStats()
+        for chunk in read_archive_chunks(file, key):
+            stats.update(chunk)
+
+    return stats.save(s3_client, bucket_name, key, content_hash, size) if stats.rows else None
+
+
+def backfill_manifest(s3_client, bucket_name: str, folder_path: str) -> dict:
+    """Adds an entry for every archive file missing from the manifest.
+    Returns the new manifest."""
+
+    manifest = load_manifest(s3_client, bucket_name, folder_path)
+    entries = {}
+
+    for key in list_archive_files(s3_client, bucket_name, folder_path):
+        if key in manifest["files"]:
+            continue
+        entry = get_object_entry(s3_client, bucket_name, key)
+        if entry:
+            entries[key] = entry
+
+    return update_manifest(s3_client, bucket_name, folder_path, entries)
+
+
+if __name__ == "__main__":
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    result = backfill_manifest(boto3.client("s3"), ENV["S3_BUCKET_NAME"], ENV["S3_FOLDER_PATH"])
+    print(f"{len(result['files'])} files in the manifest")
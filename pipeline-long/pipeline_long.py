@@ -1,15 +1,78 @@
 """Pipeline file for extracting data from RDS, transforming to CSV,
 and uploading to S3."""
 
-from os import environ as ENV
+from os import environ as ENV, path
 from datetime import datetime
+from tempfile import TemporaryDirectory
+import logging
+import boto3
 from dotenv import load_dotenv
 
-from extract_long import extract_plant_data
-from transform_long import transform_data_to_csv
-from load_long import upload_csv_to_s3
+from extract_long import connect_to_rds, get_watermark, stream_plant_data, delete_exported
+from transform_long import write_csv_chunks, PartitionedParquetWriter
+from load_long import MultipartUpload, get_csv_key, upload_archive_to_s3
+from manifest import FileStats, hash_file, update_manifest
 from send_email import send_email
 
+LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = ENV.get("ARCHIVE_FORMAT", "csv").lower()
+
+
+def export_csv(conn, watermark: int, bucket_name: str, folder_path: str) -> int:
+    """Streams the recordings up to the watermark as a compressed CSV straight
+    into a multipart upload, gathering per-plant sketches in the same pass,
+    and records it in the archive manifest. Returns the number of rows exported."""
+
+    key = get_csv_key(folder_path)
+    stats = FileStats()
+
+    with MultipartUpload(bucket_name, key) as upload:
+        exported = write_csv_chunks(stats.track(stream_plant_data(conn, watermark)), upload)
+        if not exported:
+            upload.abort()
+
+    if exported:
+        entry = stats.save(upload.s3_client, bucket_name, key, upload.content_hash,
+                           upload.bytes_uploaded)
+        update_manifest(upload.s3_client, bucket_name, folder_path, {key: entry})
+
+    return exported
+
+
+def export_parquet(conn, watermark: int, bucket_name: str, folder_path: str) -> int:
+    """Streams the recordings up to the watermark into a Parquet archive
+    partitioned by date and plant bucket, uploads each partition's file and
+    records them in the archive manifest. Returns the number of rows exported."""
+
+    file_name = f"{datetime.now().strftime('%d-%m-%Y')}.parquet"
+
+    with TemporaryDirectory() as directory:
+        writer = PartitionedParquetWriter(directory, file_name)
+        for chunk in stream_plant_data(conn, watermark):
+            writer.write(chunk)
+        files = writer.close()
+        if not files:
+            return 0
+
+        keys = upload_archive_to_s3(directory, list(files), bucket_name, folder_path)
+
+        s3_client = boto3.client("s3")
+        stats = writer.get_file_stats()
+        entries = {}
+        for key, relative_path in zip(keys, files):
+            with open(path.join(directory, relative_path), "rb") as archive_file:
+                entries[key] = stats[relative_path].save(s3_client, bucket_name, key,
+                                                         hash_file(archive_file),
+                                                         path.getsize(archive_file.name))
+
+    update_manifest(s3_client, bucket_name, folder_path, entries)
+
+    return sum(files.values())
+
+
+EXPORTERS = {"csv": export_csv, "parquet": export_parquet}
+
 
 def lambda_handler(event, context):
     """AWS Lambda handler function for running the ETL pipeline."""
@@ -21,20 +84,26 @@ def lambda_handler(event, context):
 
     send_email(is_start=True, date=current_date)
 
-    plant_data = extract_plant_data()
-    print(plant_data)
-    if plant_data.empty:
-        return {"status_code": 404, "message": "No new data to process."}
+    with connect_to_rds() as conn:
+        watermark = get_watermark(conn)
+        if watermark is None:
+            return {"status_code": 404, "message": "No new data to process."}
+
+        try:
+            exported = EXPORTERS[ARCHIVE_FORMAT](conn, watermark, bucket_name,
+                                                 bucket_folder_name)
+        except Exception as e:
+            return {"status_code": 500,
+                    "body": f"Failed to upload {ARCHIVE_FORMAT.upper()} to S3: {e}"}
 
-    csv_buffer = transform_data_to_csv(plant_data)
+        if not exported:
+            return {"status_code": 404, "message": "No new data to process."}
 
+        deleted = delete_exported(conn, watermark, exported)
+        LOGGER.info("Exported %s recordings and deleted %s from the RDS.", exported, deleted)
 
-    try:
-        upload_csv_to_s3(csv_buffer, bucket_name, bucket_folder_name)
-        send_email(is_start=False, date=current_date)
-        return {"status_code": 200, "body": "CSV uploaded successfully and email sent."}
-    except Exception as e:
-        return {"status_code": 500, "body": f"Failed to upload CSV to S3: {e}"}
+    send_email(is_start=False, date=current_date)
+    return {"status_code": 200, "body": "CSV uploaded successfully and email sent."}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,289 @@
+"""A file to summarise each archived file's readings as per-plant sketches.
+
+Each archive object gets a small gzipped JSON sidecar holding, for every plant
+and for soil moisture and temperature, the count, minimum, maximum and sum of
+its readings and a t-digest of their distribution. Sketches from any number
+of files merge into one, so percentiles over months of history come from a
+few KB of sidecars instead of a scan of the archive.
+
+Usage: python sketches.py --plant 3 --start 2024-09-01 --end 2024-12-01"""
+
+from math import asin, pi, sin
+from os import environ as ENV
+import argparse
+import gzip
+import json
+import boto3
+from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
+
+SKETCH_METRICS = ["soil_moisture", "temperature"]
+
+SKETCH_DELTA = int(ENV.get("SKETCH_DELTA", 100))
+
+SKETCH_SUFFIX = ".sketches.json.gz"
+
+SKETCH_VERSION = 1
+
+PERCENTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+class TDigest:
+    """A merging t-digest of one plant's readings for one metric.
+
+    Values are buffered and folded into centroids in sorted batches, with the
+    arcsine scale function keeping centroids small near the tails so extreme
+    percentiles stay accurate. Count, minimum, maximum and sum are exact."""
+
+    def __init__(self, delta: int = SKETCH_DELTA):
+        self.delta = delta
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.buffer = []
+        self.buffered = 0
+        self.count = 0
+        self.total = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    def add(self, values: np.ndarray) -> None:
+        """Adds a batch of readings, ignoring missing values."""
+
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+
+        self.buffer.append(values)
+        self.buffered += len(values)
+        if self.buffered >= self.delta * 5:
+            self.compress()
+
+    def merge(self, other: "TDigest") -> None:
+        """Adds every reading summarised by another digest."""
+
+        other.compress()
+        if not other.count:
+            return
+
+        self.compress()
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.merge_centroids(np.concatenate([self.means, other.means]),
+                             np.concatenate([self.weights, other.weights]))
+
+    def compress(self) -> None:
+        """Folds the buffered readings into the centroids."""
+
+        if not self.buffer:
+            return
+
+        values = np.concatenate(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        self.merge_centroids(np.concatenate([self.means, values]),
+                             np.concatenate([self.weights, np.ones(len(values))]))
+
+    def merge_centroids(self, means: np.ndarray, weights: np.ndarray) -> None:
+        """Replaces the centroids with the given ones merged in mean order,
+        combining neighbours while they fit within one unit of the scale."""
+
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        scale = self.delta / (2 * pi)
+
+        merged_means, merged_weights = [], []
+        mean, weight = means[0], weights[0]
+        done = 0.0
+        limit = total * (sin(min(asin(-1) + 1 / scale, pi / 2)) + 1) / 2
+
+        for next_mean, next_weight in zip(means[1:], weights[1:]):
+            if done + weight + next_weight <= limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                merged_means.append(mean)
+                merged_weights.append(weight)
+                done += weight
+                k = asin(min(2 * done / total - 1, 1)) + 1 / scale
+                limit = total * (sin(min(k, pi / 2)) + 1) / 2
+                mean, weight = next_mean, next_weight
+
+        merged_means.append(mean)
+        merged_weights.append(weight)
+        self.means = np.array(merged_means)
+        self.weights = np.array(merged_weights)
+
+    def quantile(self, q: float) -> float:
+        """Returns the estimated value below which a fraction q of readings lie."""
+
+        self.compress()
+        if not self.count:
+            return float("nan")
+
+        centres = np.cumsum(self.weights) - self.weights / 2
+        return float(np.interp(q * self.count, np.concatenate([[0], centres, [self.count]]),
+                               np.concatenate([[self.minimum], self.means, [self.maximum]])))
+
+    @property
+    def mean(self) -> float:
+        """Returns the exact mean of the readings."""
+
+        return self.total / self.count if self.count else float("nan")
+
+    def to_dict(self) -> dict:
+        """Returns the digest as a JSON serialisable dictionary."""
+
+        self.compress()
+        return {"count": self.count, "sum": round(self.total, 6),
+                "min": self.minimum if self.count else None,
+                "max": self.maximum if self.count else None,
+                "means": np.round(self.means, 4).tolist(),
+                "weights": self.weights.astype(int).tolist()}
+
+    @classmethod
+    def from_dict(cls, data: dict, delta: int = SKETCH_DELTA) -> "TDigest":
+        """Returns the digest stored in a sidecar."""
+
+        digest = cls(delta)
+        digest.count = data["count"]
+        digest.total = data["sum"]
+        digest.minimum = data["min"] if data["count"] else np.inf
+        digest.maximum = data["max"] if data["count"] else -np.inf
+        digest.means = np.array(data["means"], dtype=float)
+        digest.weights = np.array(data["weights"], dtype=float)
+        return digest
+
+
+class PlantSketches:
+    """A digest per plant and metric, updated one chunk at a time."""
+
+    def __init__(self, delta: int = SKETCH_DELTA):
+        self.delta = delta
+        self.digests = {}
+
+    def get(self, plant_id: int, metric: str) -> TDigest:
+        """Returns a plant's digest for a metric, creating it if needed."""
+
+        return self.digests.setdefault((plant_id, metric), TDigest(self.delta))
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """Adds a chunk of readings, grouped by plant with a single sort."""
+
+        metrics = [metric for metric in SKETCH_METRICS if metric in chunk]
+        if chunk.empty or not metrics or "plant_id" not in chunk:
+            return
+
+        plant_ids = chunk["plant_id"].to_numpy()
+        order = np.argsort(plant_ids, kind="stable")
+        plants, starts = np.unique(plant_ids[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+
+        for metric in metrics:
+            values = chunk[metric].to_numpy(dtype=float)[order]
+            for plant_id, start, end in zip(plants, starts, ends):
+                self.get(int(plant_id), metric).add(values[start:end])
+
+    def merge(self, other: "PlantSketches") -> None:
+        """Adds every reading summarised by another set of sketches."""
+
+        for (plant_id, metric), digest in other.digests.items():
+            self.get(plant_id, metric).merge(digest)
+
+    def to_dict(self) -> dict:
+        """Returns the sketches as a JSON serialisable dictionary."""
+
+        plants = {}
+        for (plant_id, metric), digest in sorted(self.digests.items()):
+            plants.setdefault(str(plant_id), {})[metric] = digest.to_dict()
+
+        return {"version": SKETCH_VERSION, "delta": self.delta, "plants": plants}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PlantSketches":
+        """Returns the sketches stored in a sidecar."""
+
+        sketches = cls(data["delta"])
+        for plant_id, metrics in data["plants"].items():
+            for metric, digest in metrics.items():
+                sketches.digests[(int(plant_id), metric)] = TDigest.from_dict(digest,
+                                                                              data["delta"])
+        return sketches
+
+
+def get_sidecar_key(archive_key: str) -> str:
+    """Returns the key of the sketches sidecar of an archive object."""
+
+    return f"{archive_key}{SKETCH_SUFFIX}"
+
+
+def save_sidecar(s3_client, bucket_name: str, archive_key: str,
+                 sketches: PlantSketches) -> str:
+    """Uploads the sketches of an archive object next to it. Returns the
+    sidecar's key."""
+
+    key = get_sidecar_key(archive_key)
+    body = gzip.compress(json.dumps(sketches.to_dict(), separators=(",", ":")).encode("UTF-8"))
+    s3_client.put_object(Bucket=bucket_name, Key=key, Body=body,
+                         ContentType="application/json", ContentEncoding="gzip")
+    return key
+
+
+def load_sidecar(s3_client, bucket_name: str, key: str) -> PlantSketches:
+    """Returns the sketches stored in a sidecar."""
+
+    body = s3_client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+    return PlantSketches.from_dict(json.loads(gzip.decompress(body)))
+
+
+def merge_sidecars(s3_client, bucket_name: str, manifest: dict, keys: list[str]) -> PlantSketches:
+    """Returns the merged sketches of archive objects, given by their keys in
+    the manifest. Objects without a sidecar are skipped."""
+
+    merged = PlantSketches()
+    for key in keys:
+        sidecar = manifest["files"][key].get("sketches")
+        if sidecar:
+            merged.merge(load_sidecar(s3_client, bucket_name, sidecar))
+
+    return merged
+
+
+def summarise(digest: TDigest, percentiles: tuple[float, ...] = PERCENTILES) -> dict:
+    """Returns the count, minimum, maximum, mean and percentiles of a digest."""
+
+    summary = {"count": digest.count, "min": digest.minimum, "max": digest.maximum,
+               "mean": digest.mean}
+    summary.update({f"p{round(q * 100)}": digest.quantile(q) for q in percentiles})
+    return summary
+
+
+if __name__ == "__main__":
+    from manifest import load_manifest, select_files
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--plant", "-p", type=int, required=True, help="Plant to summarise")
+    parser.add_argument("--start", help="Earliest reading to include, by archive file")
+    parser.add_argument("--end", help="Latest reading to include, by archive file")
+    args = parser.parse_args()
+
+    load_dotenv()
+    s3 = boto3.client("s3")
+    bucket, folder = ENV["S3_BUCKET_NAME"], ENV["S3_FOLDER_PATH"]
+
+    archive_manifest = load_manifest(s3, bucket, folder)
+    files = select_files(archive_manifest, args.plant, args.start, args.end)
+    plant_sketches = merge_sidecars(s3, bucket, archive_manifest, files)
+
+    print(f"{len(files)} archive files")
+    for name in SKETCH_METRICS:
+        print(name, summarise(plant_sketches.get(args.plant, name)))
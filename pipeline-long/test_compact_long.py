@@ -0,0 +1,181 @@
+"""Test file for compact_long.py"""
+
+import gzip
+from io import BytesIO
+from unittest.mock import patch
+import pandas as pd
+import pytest
+from compact_long import plan_compaction, compact_archive, compact_month, get_entry_months
+from load_long import MultipartUpload
+from manifest import FileStats, load_manifest, update_manifest
+from test_load_long import LocalS3
+from transform_long import write_csv_chunks
+
+FOLDER = "recordings/"
+
+
+def export_day(s3: LocalS3, name: str, rows: list[tuple]) -> None:
+    """Archives readings as a nightly CSV export and records it in the manifest."""
+    data = pd.DataFrame(rows, columns=["recording_id", "timestamp", "soil_moisture",
+                                       "temperature", "plant_id", "botanist_id"])
+    key = f"{FOLDER}{name}.csv.gz"
+    stats = FileStats()
+    with MultipartUpload("bucket", key, s3_client=s3) as upload:
+        write_csv_chunks(stats.track([data]), upload)
+    update_manifest(s3, "bucket", FOLDER,
+                    {key: stats.save(s3, "bucket", key, upload.content_hash,
+                                     upload.bytes_uploaded)})
+
+
+def get_referenced(manifest: dict) -> set[str]:
+    """Returns the keys of the manifest, archive objects and sidecars it names."""
+    return (set(manifest["files"]) | {entry["sketches"] for entry in manifest["files"].values()}
+            | {f"{FOLDER}manifest.json"})
+
+
+def read_object(s3: LocalS3, key: str) -> pd.DataFrame:
+    """Returns the readings in an archived object."""
+    body = s3.objects[("bucket", key)]
+    if key.endswith(".parquet"):
+        return pd.read_parquet(BytesIO(body))
+    return pd.read_csv(BytesIO(gzip.decompress(body)))
+
+
+@pytest.fixture
+def archive():
+    """An archive with two September days, including a reading exported
+    twice, a day spanning September and October, and a day in November."""
+    s3 = LocalS3()
+    export_day(s3, "02-09-2024", [(1, "2024-09-01 10:00:00", 30.0, 20.0, 2, 1),
+                                  (2, "2024-09-01 10:00:00", 31.0, 21.0, 1, 1)])
+    export_day(s3, "03-09-2024", [(2, "2024-09-01 10:00:00", 31.0, 21.0, 1, 1),
+                                  (3, "2024-09-02 09:00:00", 32.0, 22.0, 1, 1)])
+    export_day(s3, "01-10-2024", [(4, "2024-09-30 23:59:00", 33.0, 23.0, 2, 1),
+                                  (5, "2024-10-01 00:01:00", 34.0, 24.0, 1, 1)])
+    export_day(s3, "02-11-2024", [(6, "2024-11-01 12:00:00", 35.0, 25.0, 1, 1)])
+    return s3
+
+
+class TestPlanCompaction:
+    """Tests for choosing the months and files to compact."""
+
+    def test_entry_months(self):
+        """Tests that an entry spanning a month boundary covers both months."""
+
+        assert get_entry_months({"min_timestamp": "2024-09-30 23:59:00",
+                                 "max_timestamp": "2024-10-01 00:01:00"}) == ["2024-09",
+                                                                              "2024-10"]
+
+    def test_groups_months_sharing_a_file(self, archive):
+        """Tests that months sharing a file are compacted together and the
+        current month is left alone."""
+
+        groups = plan_compaction(load_manifest(archive, "bucket", FOLDER), "2024-11")
+
+        assert groups == [{"2024-09": [f"{FOLDER}01-10-2024.csv.gz", f"{FOLDER}02-09-2024.csv.gz",
+                                       f"{FOLDER}03-09-2024.csv.gz"],
+                           "2024-10": [f"{FOLDER}01-10-2024.csv.gz"]}]
+
+    def test_skips_compacted_months(self, archive):
+        """Tests that a month with only its monthly object is not compacted again."""
+
+        compact_archive(archive, "bucket", FOLDER, current_month="2024-11")
+
+        assert plan_compaction(load_manifest(archive, "bucket", FOLDER), "2024-11") == []
+
+
+class TestCompactArchive:
+    """Tests for compacting the archive into monthly objects."""
+
+    def test_compacts_finished_months(self, archive):
+        """Tests that finished months become one sorted object each, the
+        superseded files are deleted and the report counts them."""
+
+        report = compact_archive(archive, "bucket", FOLDER, current_month="2024-11")
+
+        manifest = load_manifest(archive, "bucket", FOLDER)
+        monthly = sorted(key for key in manifest["files"] if "monthly/" in key)
+        assert len(monthly) == 2
+        assert f"{FOLDER}02-11-2024.csv.gz" in manifest["files"]
+        assert manifest["superseded"] == []
+
+        stored = {key for _, key in archive.objects}
+        assert stored == get_referenced(manifest)
+
+        september = read_object(archive, monthly[0])
+        assert september["recording_id"].tolist() == [2, 3, 1, 4]
+        assert manifest["files"][monthly[0]]["month"] == "2024-09"
+        assert manifest["files"][monthly[0]]["rows"] == 4
+
+        assert report["objects_before"] == 3
+        assert report["objects_after"] == 2
+        assert report["rows"] == 5
+        assert report["duplicates"] == 1
+        assert report["bytes_before"] > 0 and report["bytes_after"] > 0
+
+    def test_merges_late_files_into_monthly_object(self, archive):
+        """Tests that a file archived after its month was compacted is merged
+        with the monthly object into a new one."""
+
+        compact_archive(archive, "bucket", FOLDER, current_month="2024-11")
+        export_day(archive, "late", [(7, "2024-09-15 08:00:00", 36.0, 26.0, 3, 1)])
+
+        compact_archive(archive, "bucket", FOLDER, current_month="2024-11")
+
+        manifest = load_manifest(archive, "bucket", FOLDER)
+        september = [key for key, entry in manifest["files"].items()
+                     if entry.get("month") == "2024-09"]
+        assert len(september) == 1
+        assert read_object(archive, september[0])["recording_id"].tolist() == [2, 3, 1, 4, 7]
+
+    def test_resumes_after_interruption(self, archive):
+        """Tests that a run interrupted before the manifest is rewritten
+        leaves the archive unchanged, and the next run cleans up after it."""
+
+        calls = []
+
+        def fail_second_month(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise ConnectionError("Lost connection")
+            return compact_month(*args, **kwargs)
+
+        before = load_manifest(archive, "bucket", FOLDER)
+        with patch("compact_long.compact_month", side_effect=fail_second_month):
+            with pytest.raises(ConnectionError):
+                compact_archive(archive, "bucket", FOLDER, current_month="2024-11")
+
+        assert load_manifest(archive, "bucket", FOLDER)["files"] == before["files"]
+        assert any("monthly/" in key for _, key in archive.objects)
+
+        report = compact_archive(archive, "bucket", FOLDER, current_month="2024-11")
+
+        manifest = load_manifest(archive, "bucket", FOLDER)
+        assert report["objects_after"] == 2
+        assert {key for _, key in archive.objects} == get_referenced(manifest)
+
+    def test_dry_run_changes_nothing(self, archive):
+        """Tests that a dry run reports the plan without touching the archive."""
+
+        before = dict(archive.objects)
+
+        report = compact_archive(archive, "bucket", FOLDER, current_month="2024-11",
+                                 dry_run=True)
+
+        assert archive.objects == before
+        assert report["objects_before"] == 3
+        assert report["objects_after"] == 2
+
+    def test_compacts_to_parquet(self, archive):
+        """Tests that monthly objects can be written as Parquet."""
+
+        pytest.importorskip("pyarrow")
+
+        compact_archive(archive, "bucket", FOLDER, archive_format="parquet",
+                        current_month="2024-11")
+
+        manifest = load_manifest(archive, "bucket", FOLDER)
+        october = [key for key, entry in manifest["files"].items()
+                   if entry.get("month") == "2024-10"]
+        assert october[0].endswith(".parquet")
+        assert read_object(archive, october[0])["recording_id"].tolist() == [5]
@@ -1,126 +1,126 @@
-from unittest.mock import patch, MagicMock
+from unittest.mock import MagicMock
 import pandas as pd
-from extract_long import extract_plant_data
-
-
-class TestExtractPlantData:
-    """Test suite for the extract_plant_data function, which queries and 
-    extracts plant data older than 24 hours from the database."""
-
-    @patch("extract_long.connect_to_rds")
-    @patch.dict("os.environ", {
-        "DB_HOST": "test_host",
-        "DB_PORT": "1433",
-        "DB_NAME": "test_db",
-        "DB_USER": "test_user",
-        "DB_PASSWORD": "test_password"
-    })
-    def test_extract_plant_data_query_execution(self, mock_connect):
-        """Test that the correct SQL query is executed in extract_plant_data."""
-
-        mock_connection = MagicMock()
-        mock_connect.return_value.__enter__.return_value = mock_connection
-        mock_cursor = MagicMock()
-        mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
-
-        extract_plant_data()
-
-        expected_extract_query = (
-            "SELECT * FROM gamma.recordings;"
-        ).strip()
-
-        expected_truncate_query = "TRUNCATE TABLE gamma.recordings;"
-
-        mock_cursor.execute.assert_any_call(expected_extract_query)
-        mock_cursor.execute.assert_any_call(expected_truncate_query)
-
-    @patch("extract_long.connect_to_rds")
-    @patch.dict("os.environ", {
-        "DB_HOST": "test_host",
-        "DB_PORT": "1433",
-        "DB_NAME": "test_db",
-        "DB_USER": "test_user",
-        "DB_PASSWORD": "test_password"
-    })
-    def test_extract_plant_data_success(self, mock_connect):
-        """Tests successful data extraction from the database, specifically
-        verifying that the returned data matches the expected result."""
-
-        mock_connection = MagicMock()
-        mock_connect.return_value.__enter__.return_value = mock_connection
-        mock_cursor = MagicMock()
-        mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
-
-        mock_cursor.fetchall.return_value = [
-            (1, "2024-10-01 12:00:00", 30.5, 25.2, 101, 202),
-            (2, "2024-10-01 10:00:00", 35.1, 24.7, 102, 203),
-        ]
+from extract_long import get_watermark, stream_plant_data, delete_exported
+
+
+def make_connection():
+    """Returns a mock connection and the cursor its cursor() context yields."""
+
+    mock_connection = MagicMock()
+    mock_cursor = MagicMock()
+    mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
+    return mock_connection, mock_cursor
+
+
+class TestGetWatermark:
+    """Test suite for get_watermark, which captures the highest recording_id
+    to export up to."""
+
+    def test_get_watermark(self):
+        """Tests that the highest recording_id is returned."""
+
+        conn, cursor = make_connection()
+        cursor.fetchone.return_value = {"watermark": 42}
+
+        assert get_watermark(conn) == 42
+        assert "MAX(recording_id)" in cursor.execute.call_args[0][0]
+
+    def test_get_watermark_empty_table(self):
+        """Tests that an empty recordings table has no watermark."""
+
+        conn, cursor = make_connection()
+        cursor.fetchone.return_value = {"watermark": None}
+
+        assert get_watermark(conn) is None
+
+
+class TestStreamPlantData:
+    """Test suite for stream_plant_data, which yields the recordings up to
+    the watermark in bounded chunks."""
 
-        mock_cursor.description = [
-            ("recording_id",), ("time_taken",), ("soil_moisture",
-                                                 ), ("temperature",), ("plant_id",), ("botanist_id",)
+    def test_stream_plant_data_chunks(self):
+        """Tests that rows are fetched with fetchmany and yielded per chunk."""
+
+        conn, cursor = make_connection()
+        cursor.fetchmany.side_effect = [
+            [(1, "2024-10-01 12:00:00", 30.5, 25.2, 101, 202),
+             (2, "2024-10-01 10:00:00", 35.1, 24.7, 102, 203)],
+            [(3, "2024-10-01 11:00:00", 31.0, 24.0, 101, 202)],
+            []
         ]
 
-        data = extract_plant_data()
+        chunks = list(stream_plant_data(conn, 3, chunk_size=2))
+
+        query, params = cursor.execute.call_args[0]
+        assert "WHERE recording_id <= %s" in query
+        assert "ORDER BY recording_id" in query
+        assert params == (3,)
+        cursor.fetchmany.assert_called_with(2)
+        cursor.fetchall.assert_not_called()
 
-        expected_data = pd.DataFrame({
+        assert [len(chunk) for chunk in chunks] == [2, 1]
+        pd.testing.assert_frame_equal(chunks[0], pd.DataFrame({
             "recording_id": [1, 2],
             "timestamp": ["2024-10-01 12:00:00", "2024-10-01 10:00:00"],
             "soil_moisture": [30.5, 35.1],
             "temperature": [25.2, 24.7],
             "plant_id": [101, 102],
             "botanist_id": [202, 203]
-        })
-
-        pd.testing.assert_frame_equal(data, expected_data)
-
-    @patch("extract_long.connect_to_rds")
-    @patch.dict("os.environ", {
-        "DB_HOST": "test_host",
-        "DB_PORT": "1433",
-        "DB_NAME": "test_db",
-        "DB_USER": "test_user",
-        "DB_PASSWORD": "test_password"
-    })
-    def test_extract_plant_data_empty(self, mock_connect):
-        """Tests the behaviour of extract_plant_data when no data is 
-        extracted i.e. returns an empty result."""
-
-        mock_connection = MagicMock()
-        mock_connect.return_value.__enter__.return_value = mock_connection
-        mock_cursor = MagicMock()
-        mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
-
-        mock_cursor.fetchall.return_value = []
-
-        mock_cursor.description = [
-            ("recording_id",), ("time_taken",), ("soil_moisture",
-                                                 ), ("temperature",), ("plant_id",), ("botanist_id",)
-        ]
+        }))
+
+    def test_stream_plant_data_dict_rows(self):
+        """Tests that rows from an as_dict connection keep their columns."""
+
+        conn, cursor = make_connection()
+        cursor.fetchmany.side_effect = [[{
+            "recording_id": 1, "timestamp": "2024-10-01 12:00:00", "soil_moisture": 30.5,
+            "temperature": 25.2, "plant_id": 101, "botanist_id": 202}], []]
+
+        chunk = next(stream_plant_data(conn, 1))
+
+        assert chunk.loc[0, "timestamp"] == "2024-10-01 12:00:00"
+
+    def test_stream_plant_data_empty(self):
+        """Tests that nothing is yielded when there are no rows."""
+
+        conn, cursor = make_connection()
+        cursor.fetchmany.return_value = []
+
+        assert not list(stream_plant_data(conn, 1))
+
+
+class TestDeleteExported:
+    """Test suite for delete_exported, which deletes the exported rows in
+    batches."""
+
+    def test_delete_exported_in_batches(self):
+        """Tests that rows at or below the watermark are deleted in batches
+        until a batch comes back short."""
 
-        data = extract_plant_data()
+        conn, cursor = make_connection()
+        cursor.fetchone.return_value = {"total": 5}
+        rowcounts = iter([2, 2, 1])
 
-        assert data.empty
+        def execute(query, params):
+            if query.startswith("DELETE"):
+                cursor.rowcount = next(rowcounts)
+        cursor.execute.side_effect = execute
 
-    @patch("extract_long.connect_to_rds")
-    @patch.dict("os.environ", {
-        "DB_HOST": "test_host",
-        "DB_PORT": "1433",
-        "DB_NAME": "test_db",
-        "DB_USER": "test_user",
-        "DB_PASSWORD": "test_password"
-    })
-    def test_extract_plant_data_query_failure(self, mock_connect):
-        """Tests that extract_plant_data behaves correctly when the SQL 
-        query execution fails i.e. that it returns an empty result."""
+        deleted = delete_exported(conn, 10, 5, batch_size=2)
 
-        mock_connection = MagicMock()
-        mock_connect.return_value.__enter__.return_value = mock_connection
-        mock_cursor = MagicMock()
-        mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
+        deletes = [c for c in cursor.execute.call_args_list if c[0][0].startswith("DELETE")]
+        assert deleted == 5
+        assert len(deletes) == 3
+        assert deletes[0][0][1] == (2, 10)
+        assert "TRUNCATE" not in " ".join(c[0][0] for c in cursor.execute.call_args_list)
+        assert conn.commit.call_count == 3
 
-        mock_cursor.execute.side_effect = Exception("Query failed.")
+    def test_delete_exported_count_mismatch(self):
+        """Tests that nothing is deleted when rows appeared below the
+        watermark after the export."""
 
-        data = extract_plant_data()
+        conn, cursor = make_connection()
+        cursor.fetchone.return_value = {"total": 6}
 
-        assert data.empty
+        assert delete_exported(conn, 10, 5) == 0
+        conn.commit.assert_not_called()
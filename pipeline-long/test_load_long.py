@@ -1,8 +1,80 @@
 """File to test the function in load.py"""
 
+import gzip
+from io import BytesIO
 from unittest.mock import patch, MagicMock
 from datetime import datetime
-from load_long import upload_csv_to_s3
+import numpy as np
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError
+from load_long import upload_csv_to_s3, upload_archive_to_s3, MultipartUpload, get_csv_key
+from transform_long import write_csv_chunks
+
+
+class LocalS3:
+    """An in-memory stand-in for the S3 client calls the pipeline makes. Like
+    S3 it rejects parts below min_part_size other than the last one, and
+    lists at most page_size keys per page."""
+
+    def __init__(self, min_part_size: int = 1024, page_size: int = 1000):
+        self.min_part_size = min_part_size
+        self.page_size = page_size
+        self.objects = {}
+        self.uploads = {}
+        self.largest_part = 0
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": BytesIO(self.objects[(Bucket, Key)])}
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, "rb") as file:
+            self.objects[(Bucket, Key)] = file.read()
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.objects.pop((Bucket, obj["Key"]), None)
+
+    def download_fileobj(self, Bucket, Key, Fileobj):
+        Fileobj.write(self.objects[(Bucket, Key)])
+
+    def get_paginator(self, operation_name):
+        s3 = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                keys = sorted(key for bucket, key in s3.objects
+                              if bucket == Bucket and key.startswith(Prefix))
+                for start in range(0, len(keys), s3.page_size):
+                    yield {"Contents": [{"Key": key}
+                                        for key in keys[start:start + s3.page_size]]}
+
+        return Paginator()
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f"upload-{len(self.uploads) + 1}"
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        self.largest_part = max(self.largest_part, len(Body))
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        if any(len(parts[number]) < self.min_part_size for number in numbers[:-1]):
+            raise ValueError("EntityTooSmall")
+        self.objects[(Bucket, Key)] = b"".join(parts[number] for number in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
 
 
 class TestUploadCSVtoS3:
@@ -103,3 +175,100 @@ class TestUploadCSVtoS3:
         except Exception as e:
             assert str(e) == "S3 error occurred"
         mock_s3.put_object.assert_called_once()
+
+    @patch("boto3.client")
+    def test_upload_archive_to_s3(self, mock_boto_client):
+        """Tests that each partition file is uploaded under the folder path."""
+
+        mock_s3 = MagicMock()
+        mock_boto_client.return_value = mock_s3
+        files = ["date=2024-10-01/plant_bucket=01/a.parquet",
+                 "date=2024-10-01/plant_bucket=02/a.parquet"]
+
+        keys = upload_archive_to_s3("/tmp/archive", files, "test-bucket", "recordings/")
+
+        assert keys == [f"recordings/{file}" for file in files]
+        mock_s3.upload_file.assert_any_call(
+            "/tmp/archive/date=2024-10-01/plant_bucket=01/a.parquet", "test-bucket",
+            "recordings/date=2024-10-01/plant_bucket=01/a.parquet")
+
+
+def make_chunks(chunks: int, rows: int) -> list[pd.DataFrame]:
+    """Returns chunks of recordings with hard to compress readings."""
+    rng = np.random.default_rng(0)
+    return [pd.DataFrame({"recording_id": range(i * rows, (i + 1) * rows),
+                          "soil_moisture": rng.uniform(10, 80, rows),
+                          "plant_id": rng.integers(1, 50, rows)})
+            for i in range(chunks)]
+
+
+class TestMultipartUpload:
+    """Tests for streaming compressed CSVs to S3 with MultipartUpload."""
+
+    def test_get_csv_key(self):
+        """Tests that compressed CSVs are given a .gz suffix."""
+
+        current_date = datetime.now().strftime("%d-%m-%Y")
+        assert get_csv_key("recordings/", "gzip") == f"recordings/{current_date}.csv.gz"
+        assert get_csv_key("recordings/", "none") == f"recordings/{current_date}.csv"
+
+    def test_streams_parts_bounded_by_part_size(self):
+        """Tests that a large export is uploaded in several parts no bigger
+        than the part size and decompresses to the full CSV."""
+
+        s3 = LocalS3()
+        chunks = make_chunks(10, 2000)
+
+        with MultipartUpload("bucket", "a.csv.gz", part_size=16 * 1024,
+                             s3_client=s3) as upload:
+            rows = write_csv_chunks(chunks, upload)
+            assert len(upload.buffer) < 16 * 1024
+
+        assert rows == 20000
+        assert len(upload.parts) > 2
+        assert s3.largest_part == 16 * 1024
+        assert not s3.uploads
+
+        data = gzip.decompress(s3.objects[("bucket", "a.csv.gz")]).decode()
+        assert data == pd.concat(chunks).to_csv(index=False)
+
+    def test_small_upload_uses_put_object(self):
+        """Tests that an object smaller than one part is sent in one request."""
+
+        s3 = LocalS3()
+        s3.create_multipart_upload = MagicMock()
+
+        with MultipartUpload("bucket", "a.csv", compression="none",
+                             s3_client=s3) as upload:
+            upload.write(b"recording_id\n1\n")
+
+        s3.create_multipart_upload.assert_not_called()
+        assert s3.objects[("bucket", "a.csv")] == b"recording_id\n1\n"
+
+    def test_failure_aborts_upload(self):
+        """Tests that an error while streaming aborts the multipart upload
+        and stores no object."""
+
+        s3 = LocalS3()
+
+        def failing_chunks():
+            yield from make_chunks(5, 2000)
+            raise ConnectionError("Lost connection")
+
+        with pytest.raises(ConnectionError):
+            with MultipartUpload("bucket", "a.csv.gz", part_size=16 * 1024,
+                                 s3_client=s3) as upload:
+                write_csv_chunks(failing_chunks(), upload)
+
+        assert not s3.objects
+        assert not s3.uploads
+
+    def test_abort_without_parts(self):
+        """Tests that aborting an empty export uploads nothing."""
+
+        s3 = LocalS3()
+
+        with MultipartUpload("bucket", "a.csv.gz", s3_client=s3) as upload:
+            upload.abort()
+
+        assert not s3.objects
@@ -0,0 +1,144 @@
+"""Test file for manifest.py"""
+
+import pandas as pd
+from load_long import MultipartUpload
+from manifest import (BloomFilter, FileStats, load_manifest, update_manifest, select_files,
+                      list_archive_files, backfill_manifest, get_manifest_key)
+from test_load_long import LocalS3
+from transform_long import write_csv_chunks
+
+
+def make_entry(day: str, plant_ids: list[int]) -> dict:
+    """Returns the manifest entry of a file holding readings for the plants
+    at the start and end of a day."""
+    stats = FileStats()
+    timestamps = [f"{day} 00:00:00", f"{day} 23:59:00"] * len(plant_ids)
+    stats.update(pd.DataFrame({"timestamp": timestamps, "plant_id": plant_ids * 2}))
+    return stats.to_entry("hash", 100)
+
+
+class TestBloomFilter:
+    """Tests for the plant id bloom filter."""
+
+    def test_contains_every_added_plant(self):
+        """Tests that a filter never misses a plant that was added."""
+
+        bloom = BloomFilter.for_items(500)
+        for plant_id in range(0, 1000, 2):
+            bloom.add(plant_id)
+
+        assert all(plant_id in bloom for plant_id in range(0, 1000, 2))
+
+    def test_false_positive_rate(self):
+        """Tests that few absent plants are reported as present."""
+
+        bloom = BloomFilter.for_items(500, fp_rate=0.01)
+        for plant_id in range(500):
+            bloom.add(plant_id)
+
+        false_positives = sum(plant_id in bloom for plant_id in range(500, 20_500))
+        assert false_positives / 20_000 < 0.03
+
+    def test_round_trip(self):
+        """Tests that a filter is unchanged by storing it in the manifest."""
+
+        bloom = BloomFilter.for_items(3)
+        for plant_id in (4, 8, 15):
+            bloom.add(plant_id)
+
+        restored = BloomFilter.from_dict(bloom.to_dict())
+        assert restored.data == bloom.data
+        assert 15 in restored
+
+
+class TestFileStats:
+    """Tests for gathering the statistics of an archive file."""
+
+    def test_to_entry(self):
+        """Tests the ranges and row count gathered over several chunks."""
+
+        stats = FileStats()
+        chunks = [pd.DataFrame({"timestamp": ["2024-10-01 10:00:00", "2024-10-01 09:00:00"],
+                                "plant_id": [7, 3]}),
+                  pd.DataFrame({"timestamp": ["2024-10-01 23:59:00"], "plant_id": [12]})]
+        assert list(stats.track(chunks)) == chunks
+
+        entry = stats.to_entry("abc", 10)
+        assert entry["rows"] == 3
+        assert entry["min_timestamp"] == "2024-10-01 09:00:00"
+        assert entry["max_timestamp"] == "2024-10-01 23:59:00"
+        assert (entry["min_plant_id"], entry["max_plant_id"]) == (3, 12)
+        assert entry["sha256"] == "abc"
+
+
+class TestSelectFiles:
+    """Tests for pruning archive files with the manifest."""
+
+    manifest = {"files": {
+        "recordings/02-10-2024.csv.gz": make_entry("2024-10-01", [1, 2, 3]),
+        "recordings/03-10-2024.csv.gz": make_entry("2024-10-02", [1, 3]),
+        "recordings/04-10-2024.csv.gz": make_entry("2024-10-03", [40, 50])}}
+
+    def test_selects_by_plant(self):
+        """Tests that files ruled out by plant range or bloom are skipped."""
+
+        assert select_files(self.manifest, 2) == ["recordings/02-10-2024.csv.gz"]
+        assert select_files(self.manifest, 3) == ["recordings/02-10-2024.csv.gz",
+                                                  "recordings/03-10-2024.csv.gz"]
+        assert select_files(self.manifest, 20) == []
+
+    def test_selects_by_time(self):
+        """Tests that files outside the time range are skipped."""
+
+        assert select_files(self.manifest, 1, start="2024-10-02 12:00:00") == [
+            "recordings/03-10-2024.csv.gz"]
+        assert select_files(self.manifest, 1, end="2024-10-01 12:00:00") == [
+            "recordings/02-10-2024.csv.gz"]
+
+
+class TestManifestStorage:
+    """Tests for reading and writing the manifest in S3."""
+
+    def test_missing_manifest_is_empty(self):
+        """Tests that a folder without a manifest has no files."""
+
+        assert load_manifest(LocalS3(), "bucket", "recordings/")["files"] == {}
+
+    def test_update_merges_entries(self):
+        """Tests that updates keep the entries of earlier files."""
+
+        s3 = LocalS3()
+        update_manifest(s3, "bucket", "recordings/", {"recordings/a.csv.gz": {"rows": 1}})
+        update_manifest(s3, "bucket", "recordings/", {"recordings/b.csv.gz": {"rows": 2}})
+
+        manifest = load_manifest(s3, "bucket", "recordings/")
+        assert sorted(manifest["files"]) == ["recordings/a.csv.gz", "recordings/b.csv.gz"]
+
+    def test_list_archive_files_paginates(self):
+        """Tests that listing follows every page of keys."""
+
+        s3 = LocalS3(page_size=2)
+        for day in range(1, 6):
+            s3.put_object(Bucket="bucket", Key=f"recordings/0{day}-10-2024.csv", Body=b"")
+        s3.put_object(Bucket="bucket", Key=get_manifest_key("recordings/"), Body=b"{}")
+
+        assert len(list_archive_files(s3, "bucket", "recordings/")) == 5
+
+    def test_backfill_matches_export(self):
+        """Tests that backfilling an exported file records its statistics
+        and the hash computed while it was uploaded."""
+
+        s3 = LocalS3()
+        chunk = pd.DataFrame({"recording_id": [1, 2], "timestamp": ["2024-10-01 10:00:00",
+                                                                   "2024-10-01 11:00:00"],
+                              "soil_moisture": [30.5, 31.0], "plant_id": [4, 9]})
+        with MultipartUpload("bucket", "recordings/01-10-2024.csv.gz", s3_client=s3) as upload:
+            write_csv_chunks([chunk], upload)
+
+        manifest = backfill_manifest(s3, "bucket", "recordings/")
+
+        entry = manifest["files"]["recordings/01-10-2024.csv.gz"]
+        assert entry["rows"] == 2
+        assert entry["sha256"] == upload.content_hash
+        assert entry["size"] == upload.bytes_uploaded
+        assert (entry["min_plant_id"], entry["max_plant_id"]) == (4, 9)
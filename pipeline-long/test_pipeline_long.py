@@ -1,28 +1,53 @@
 """Test file for pipeline_long.py"""
 
-from unittest.mock import patch, MagicMock
-from pipeline_long import lambda_handler
+from unittest.mock import patch
+import pandas as pd
+import pytest
+from pipeline_long import lambda_handler, export_parquet
+
+
+def fake_stream(conn, watermark):
+    """Yields two chunks of recordings."""
+    yield pd.DataFrame([{"recording_id": 1, "timestamp": "2024-10-01 10:00:00",
+                         "soil_moisture": 30.5, "plant_id": 1}])
+    yield pd.DataFrame([{"recording_id": 2, "timestamp": "2024-10-01 10:01:00",
+                         "soil_moisture": 45.0, "plant_id": 2}])
 
 
 class TestPipeline:
     """Unit tests for the AWS Lambda handler function in the long-term
     ETL pipeline."""
 
-    @patch("pipeline_long.extract_plant_data")
-    @patch("pipeline_long.transform_data_to_csv")
-    @patch("pipeline_long.upload_csv_to_s3")
+    @patch("pipeline_long.connect_to_rds")
+    @patch("pipeline_long.get_watermark", return_value=2)
+    @patch("pipeline_long.stream_plant_data", side_effect=fake_stream)
+    @patch("pipeline_long.delete_exported")
+    @patch("pipeline_long.update_manifest")
+    @patch("pipeline_long.MultipartUpload")
     @patch("pipeline_long.send_email")
     @patch.dict("os.environ", {"S3_BUCKET_NAME": "test-bucket", "S3_FOLDER_PATH": "test-folder"})
-    def test_lambda_handler_success(self, mock_send_email, mock_upload_csv_to_s3, mock_transform_data_to_csv, mock_extract_plant_data):
+    def test_lambda_handler_success(self, mock_send_email, mock_upload, mock_update_manifest,
+                                    mock_delete_exported, mock_stream, mock_watermark,
+                                    mock_connect):
         """Tests successful execution of the ETL pipeline."""
 
-        mock_extract_plant_data.return_value.empty = False
-        mock_transform_data_to_csv.return_value = MagicMock()
+        upload = mock_upload.return_value.__enter__.return_value
 
         response = lambda_handler({}, {})
 
         assert response["status_code"] == 200
         assert response["body"] == "CSV uploaded successfully and email sent."
+        uploaded = b"".join(call.args[0] for call in upload.write.call_args_list)
+        assert uploaded == (b"recording_id,timestamp,soil_moisture,plant_id\n"
+                            b"1,2024-10-01 10:00:00,30.5,1\n2,2024-10-01 10:01:00,45.0,2\n")
+        upload.abort.assert_not_called()
+
+        entries = mock_update_manifest.call_args[0][3]
+        assert [entry["rows"] for entry in entries.values()] == [2]
+        assert all(entry["sketches"].endswith(".sketches.json.gz") for entry in entries.values())
+
+        conn = mock_connect.return_value.__enter__.return_value
+        mock_delete_exported.assert_called_once_with(conn, 2, 2)
 
         assert mock_send_email.call_count == 2
 
@@ -34,15 +59,14 @@ class TestPipeline:
         assert calls[1][1]["is_start"] is False
         assert isinstance(calls[1][1]["date"], str)
 
-    @patch("pipeline_long.extract_plant_data")
+    @patch("pipeline_long.connect_to_rds")
+    @patch("pipeline_long.get_watermark", return_value=None)
     @patch("pipeline_long.send_email")
     @patch.dict("os.environ", {"S3_BUCKET_NAME": "test-bucket", "S3_FOLDER_PATH": "test-folder"})
-    def test_lambda_handler_no_data(self, mock_send_email, mock_extract_plant_data):
+    def test_lambda_handler_no_data(self, mock_send_email, mock_watermark, mock_connect):
         """Tests how the lambda handler function behaves when there is no
         new data is available for processing."""
 
-        mock_extract_plant_data.return_value.empty = True
-
         response = lambda_handler({}, {})
         assert response["status_code"] == 404
         assert response["message"] == "No new data to process."
@@ -53,19 +77,52 @@ class TestPipeline:
         assert first_call_kwargs["is_start"] is True
         assert isinstance(first_call_kwargs["date"], str)
 
-    @patch("pipeline_long.extract_plant_data")
-    @patch("pipeline_long.transform_data_to_csv")
-    @patch("pipeline_long.upload_csv_to_s3")
+    @patch("pipeline_long.connect_to_rds")
+    @patch("pipeline_long.get_watermark", return_value=2)
+    @patch("pipeline_long.stream_plant_data", side_effect=fake_stream)
+    @patch("pipeline_long.delete_exported")
+    @patch("pipeline_long.MultipartUpload")
     @patch("pipeline_long.send_email")
     @patch.dict("os.environ", {"S3_BUCKET_NAME": "test-bucket", "S3_FOLDER_PATH": "test-folder"})
-    def test_lambda_handler_upload_failure(self, mock_send_email, mock_upload_csv_to_s3, mock_transform_data_to_csv, mock_extract_plant_data):
+    def test_lambda_handler_upload_failure(self, mock_send_email, mock_upload,
+                                           mock_delete_exported, mock_stream, mock_watermark,
+                                           mock_connect):
         """Tests how the lambda handler function behaves when the CSV upload
-        to S3 fails."""
+        to S3 fails, and that no recordings are deleted."""
 
-        mock_extract_plant_data.return_value.empty = False
-        mock_transform_data_to_csv.return_value = MagicMock()
-        mock_upload_csv_to_s3.side_effect = Exception("Upload failed")
+        upload = mock_upload.return_value.__enter__.return_value
+        upload.write.side_effect = Exception("Upload failed")
 
         response = lambda_handler({}, {})
         assert response["status_code"] == 500
         assert "Failed to upload CSV to S3" in response["body"]
+        mock_delete_exported.assert_not_called()
+
+
+@patch("pipeline_long.boto3.client")
+@patch("pipeline_long.update_manifest")
+@patch("pipeline_long.upload_archive_to_s3")
+def test_export_parquet_uploads_partitions(mock_upload, mock_update_manifest, mock_client):
+    """Tests that the Parquet export uploads one file per partition and
+    records each one in the manifest."""
+
+    pytest.importorskip("pyarrow")
+
+    def stream(conn, watermark):
+        yield pd.DataFrame({"recording_id": [1, 2], "timestamp": ["2024-10-01 10:00:00"] * 2,
+                            "soil_moisture": [30.5, 31.0], "temperature": [20.0, 21.0],
+                            "plant_id": [1, 2], "botanist_id": [1, 1]})
+
+    mock_upload.side_effect = lambda directory, files, bucket, folder: [
+        f"{folder}{file}" for file in files]
+
+    with patch("pipeline_long.stream_plant_data", side_effect=stream):
+        exported = export_parquet(None, 2, "test-bucket", "recordings/")
+
+    assert exported == 2
+    files = mock_upload.call_args[0][1]
+    assert sorted(f.split("/")[1] for f in files) == ["plant_bucket=01", "plant_bucket=02"]
+
+    entries = mock_update_manifest.call_args[0][3]
+    assert sorted(entries) == sorted(f"recordings/{file}" for file in files)
+    assert {entry["min_plant_id"] for entry in entries.values()} == {1, 2}
@@ -0,0 +1,104 @@
+"""Test file for sketches.py"""
+
+import numpy as np
+import pandas as pd
+from sketches import (TDigest, PlantSketches, save_sidecar, load_sidecar, merge_sidecars,
+                      summarise)
+from test_load_long import LocalS3
+
+
+def get_rank_error(digest: TDigest, values: np.ndarray, q: float) -> float:
+    """Returns how far the digest's q quantile is from q in the true ranks."""
+    return abs(np.searchsorted(np.sort(values), digest.quantile(q)) / len(values) - q)
+
+
+class TestTDigest:
+    """Tests for the t-digest of one plant's readings."""
+
+    values = np.random.default_rng(0).normal(40, 10, 100_000)
+
+    def test_quantiles_are_accurate(self):
+        """Tests that quantiles are within a small rank error, tighter at the tails."""
+
+        digest = TDigest()
+        for batch in np.array_split(self.values, 50):
+            digest.add(batch)
+
+        for q in (0.25, 0.5, 0.75):
+            assert get_rank_error(digest, self.values, q) < 0.01
+        for q in (0.01, 0.99):
+            assert get_rank_error(digest, self.values, q) < 0.002
+        assert len(digest.means) < 200
+
+    def test_exact_summaries(self):
+        """Tests that count, minimum, maximum and mean are exact and missing
+        readings are ignored."""
+
+        digest = TDigest()
+        digest.add(np.array([3.0, np.nan, 1.0, 2.0]))
+
+        assert digest.count == 3
+        assert (digest.minimum, digest.maximum, digest.mean) == (1.0, 3.0, 2.0)
+        assert digest.quantile(0) == 1.0 and digest.quantile(1) == 3.0
+
+    def test_merge_matches_single_digest(self):
+        """Tests that merging digests of two halves summarises the whole."""
+
+        first, second = TDigest(), TDigest()
+        first.add(self.values[:50_000])
+        second.add(self.values[50_000:] + 10)
+        first.merge(second)
+
+        combined = np.concatenate([self.values[:50_000], self.values[50_000:] + 10])
+        assert first.count == 100_000
+        assert np.isclose(first.mean, combined.mean())
+        assert get_rank_error(first, combined, 0.5) < 0.01
+
+    def test_round_trip(self):
+        """Tests that a digest is unchanged by storing it in a sidecar."""
+
+        digest = TDigest()
+        digest.add(self.values[:5000])
+
+        restored = TDigest.from_dict(digest.to_dict())
+        assert restored.count == 5000
+        assert abs(restored.quantile(0.9) - digest.quantile(0.9)) < 0.01
+
+
+class TestPlantSketches:
+    """Tests for the per-plant sketches of an archive file."""
+
+    def test_update_groups_by_plant(self):
+        """Tests that each plant's readings go to its own digests."""
+
+        sketches = PlantSketches()
+        sketches.update(pd.DataFrame({"plant_id": [2, 1, 2, 1], "soil_moisture": [20, 10, 22, 12],
+                                      "temperature": [5, 15, 7, np.nan]}))
+
+        assert sketches.get(1, "soil_moisture").mean == 11
+        assert sketches.get(2, "soil_moisture").mean == 21
+        assert sketches.get(1, "temperature").count == 1
+
+    def test_sidecars_merge(self):
+        """Tests that sidecars of several files merge into the plant's summary."""
+
+        s3 = LocalS3()
+        manifest = {"files": {}}
+        for day in range(3):
+            sketches = PlantSketches()
+            sketches.update(pd.DataFrame({"plant_id": [1] * 1440,
+                                          "soil_moisture": np.linspace(day * 10, day * 10 + 10,
+                                                                       1440),
+                                          "temperature": np.full(1440, 20.0)}))
+            key = f"recordings/0{day}.csv.gz"
+            manifest["files"][key] = {"sketches": save_sidecar(s3, "bucket", key, sketches)}
+            assert len(s3.objects[("bucket", manifest["files"][key]["sketches"])]) < 4096
+
+        merged = merge_sidecars(s3, "bucket", manifest, list(manifest["files"]))
+
+        summary = summarise(merged.get(1, "soil_moisture"))
+        assert summary["count"] == 4320
+        assert summary["min"] == 0 and summary["max"] == 30
+        assert abs(summary["p50"] - 15) < 0.5
+        assert load_sidecar(s3, "bucket", "recordings/00.csv.gz.sketches.json.gz").get(
+            1, "temperature").mean == 20
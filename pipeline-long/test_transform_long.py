@@ -1,7 +1,10 @@
 """Tests for the function in transform.py"""
 
+from io import BytesIO
 import pandas as pd
-from transform_long import transform_data_to_csv
+import pytest
+from transform_long import (transform_data_to_csv, write_csv_chunks, write_parquet_chunks,
+                            get_partition_path, get_plant_bucket, PartitionedParquetWriter)
 
 
 class TestTransformDataToCSV:
@@ -67,3 +70,94 @@ class TestTransformDataToCSV:
         csv_file_like = transform_data_to_csv(data)
 
         assert csv_file_like.decode("UTF-8") == expected_output
+
+
+class TestWriteCSVChunks:
+    """Test suite for the write_csv_chunks function."""
+
+    def test_single_header(self):
+        """Tests that chunks are written as one CSV with a single header."""
+
+        chunks = [pd.DataFrame([{"id": 1, "moisture": 30.5}, {"id": 2, "moisture": 45.0}]),
+                  pd.DataFrame([{"id": 3, "moisture": 25.0}])]
+        output = BytesIO()
+
+        rows = write_csv_chunks(chunks, output)
+
+        assert rows == 3
+        assert output.getvalue().decode("UTF-8") == "id,moisture\n1,30.5\n2,45.0\n3,25.0\n"
+
+    def test_no_chunks(self):
+        """Tests that nothing is written when there are no chunks."""
+
+        output = BytesIO()
+
+        assert write_csv_chunks([], output) == 0
+        assert output.getvalue() == b""
+
+
+def make_recordings(recording_ids, plant_ids, timestamps):
+    """Returns a chunk of recordings as extracted from the RDS."""
+
+    return pd.DataFrame({
+        "recording_id": recording_ids,
+        "timestamp": timestamps,
+        "soil_moisture": [30.5] * len(recording_ids),
+        "temperature": [20.0] * len(recording_ids),
+        "plant_id": plant_ids,
+        "botanist_id": [1] * len(recording_ids)
+    })
+
+
+class TestParquetArchive:
+    """Test suite for the partitioned Parquet archive."""
+
+    def test_partition_path(self):
+        """Tests the Hive-style partition directory names."""
+
+        assert get_plant_bucket(13, buckets=8) == 5
+        assert get_partition_path("2024-10-01", 5) == "date=2024-10-01/plant_bucket=05"
+
+    def test_write_parquet_chunks_partitions(self, tmp_path):
+        """Tests that rows land in one file per date and plant bucket with
+        the explicit schema and codec."""
+
+        pq = pytest.importorskip("pyarrow.parquet")
+        chunks = [make_recordings([1, 2], [1, 9], ["2024-10-01 10:00:00"] * 2),
+                  make_recordings([3, 4], [2, 1], ["2024-10-01 11:00:00",
+                                                   "2024-10-02 00:01:00"])]
+
+        files = write_parquet_chunks(chunks, str(tmp_path), "01-10-2024.parquet", codec="gzip")
+
+        assert files == {
+            "date=2024-10-01/plant_bucket=01/01-10-2024.parquet": 2,
+            "date=2024-10-01/plant_bucket=02/01-10-2024.parquet": 1,
+            "date=2024-10-02/plant_bucket=01/01-10-2024.parquet": 1
+        }
+        parquet_file = pq.ParquetFile(
+            tmp_path / "date=2024-10-01/plant_bucket=01/01-10-2024.parquet")
+        assert str(parquet_file.schema_arrow.field("timestamp").type) == "timestamp[ms]"
+        assert str(parquet_file.schema_arrow.field("plant_id").type) == "int32"
+        assert parquet_file.metadata.row_group(0).column(0).compression == "GZIP"
+        assert parquet_file.read().column("recording_id").to_pylist() == [1, 2]
+
+    def test_row_groups_flush_when_full(self, tmp_path):
+        """Tests that buffered rows are written once a row group fills."""
+
+        pq = pytest.importorskip("pyarrow.parquet")
+        writer = PartitionedParquetWriter(str(tmp_path), "a.parquet", row_group_size=2)
+
+        for i in range(5):
+            writer.write(make_recordings([i], [1], ["2024-10-01 10:00:00"]))
+        files = writer.close()
+
+        metadata = pq.ParquetFile(tmp_path / list(files)[0]).metadata
+        assert files == {"date=2024-10-01/plant_bucket=01/a.parquet": 5}
+        assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [2, 2, 1]
+
+    def test_no_chunks(self, tmp_path):
+        """Tests that no files are written when there are no chunks."""
+
+        pytest.importorskip("pyarrow")
+
+        assert write_parquet_chunks([], str(tmp_path), "a.parquet") == {}
@@ -1,8 +1,34 @@
 """A file to transform the extracted plant data from the RDS into a 
-CSV file to be loaded into the S3 bucket."""
+CSV file, or optionally a partitioned Parquet archive, to be loaded into
+the S3 bucket."""
 
 from io import StringIO
+from os import environ as ENV, makedirs, path
+from typing import BinaryIO, Iterable
 import pandas as pd
+from manifest import FileStats
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+ARCHIVE_CODEC = ENV.get("ARCHIVE_CODEC", "zstd")
+
+PLANT_BUCKETS = int(ENV.get("ARCHIVE_PLANT_BUCKETS", 8))
+
+ROW_GROUP_SIZE = int(ENV.get("ARCHIVE_ROW_GROUP_SIZE", 100_000))
+
+ARCHIVE_DTYPES = {
+    "recording_id": "int64",
+    "timestamp": "datetime64[ms]",
+    "soil_moisture": "float64",
+    "temperature": "float64",
+    "plant_id": "int32",
+    "botanist_id": "int32"
+}
 
 
 def transform_data_to_csv(data: pd.DataFrame) -> bytes:
@@ -22,6 +48,129 @@ def transform_data_to_csv(data: pd.DataFrame) -> bytes:
     return csv_buffer.getvalue().encode("UTF-8")
 
 
+def write_csv_chunks(chunks: Iterable[pd.DataFrame], output: BinaryIO) -> int:
+    """Writes DataFrame chunks to a binary file-like object as one CSV with
+    a single header, one chunk at a time. Returns the number of rows written."""
+
+    rows = 0
+
+    for chunk in chunks:
+        output.write(chunk.to_csv(index=False, header=rows == 0).encode("UTF-8"))
+        rows += len(chunk)
+
+    return rows
+
+
+def get_archive_schema():
+    """Returns the explicit Arrow schema of the Parquet archive."""
+
+    if pa is None:
+        raise ImportError("pyarrow is required for the Parquet archive.")
+
+    return pa.schema([
+        ("recording_id", pa.int64()),
+        ("timestamp", pa.timestamp("ms")),
+        ("soil_moisture", pa.float64()),
+        ("temperature", pa.float64()),
+        ("plant_id", pa.int32()),
+        ("botanist_id", pa.int32())
+    ])
+
+
+def get_plant_bucket(plant_id: int, buckets: int = PLANT_BUCKETS) -> int:
+    """Returns the partition bucket a plant's readings are stored in."""
+
+    return plant_id % buckets
+
+
+def get_partition_path(date: str, bucket: int) -> str:
+    """Returns the Hive-style partition directory for a date and plant bucket."""
+
+    return f"date={date}/plant_bucket={bucket:02d}"
+
+
+class PartitionedParquetWriter:
+    """Writes DataFrame chunks into one Parquet file per date and plant bucket
+    partition under a directory. Rows are buffered per partition and written
+    as row groups of up to row_group_size rows, and the statistics of each
+    file are gathered for the archive manifest."""
+
+    def __init__(self, directory: str, file_name: str, codec: str = ARCHIVE_CODEC,
+                 buckets: int = PLANT_BUCKETS, row_group_size: int = ROW_GROUP_SIZE):
+        self.directory = directory
+        self.file_name = file_name
+        self.codec = codec
+        self.buckets = buckets
+        self.row_group_size = row_group_size
+        self.schema = get_archive_schema()
+        self.writers = {}
+        self.buffers = {}
+        self.rows = {}
+        self.stats = {}
+
+    def write(self, chunk: pd.DataFrame) -> None:
+        """Splits a chunk by partition and buffers it, flushing full row groups."""
+
+        chunk = chunk[list(ARCHIVE_DTYPES)].astype(ARCHIVE_DTYPES)
+        dates = chunk["timestamp"].dt.strftime("%Y-%m-%d")
+        buckets = chunk["plant_id"] % self.buckets
+
+        for (date, bucket), part in chunk.groupby([dates, buckets], sort=False):
+            key = get_partition_path(date, int(bucket))
+            self.buffers.setdefault(key, []).append(part)
+            self.rows[key] = self.rows.get(key, 0) + len(part)
+            self.stats.setdefault(key, FileStats()).update(part)
+
+            if sum(len(buffered) for buffered in self.buffers[key]) >= self.row_group_size:
+                self.flush(key)
+
+    def flush(self, key: str) -> None:
+        """Writes a partition's buffered rows as one row group."""
+
+        buffered = self.buffers.pop(key, [])
+        if not buffered:
+            return
+
+        if key not in self.writers:
+            directory = path.join(self.directory, key)
+            makedirs(directory, exist_ok=True)
+            self.writers[key] = pq.ParquetWriter(path.join(directory, self.file_name),
+                                                 self.schema, compression=self.codec)
+
+        table = pa.Table.from_pandas(pd.concat(buffered, ignore_index=True),
+                                     schema=self.schema, preserve_index=False)
+        self.writers[key].write_table(table)
+
+    def close(self) -> dict[str, int]:
+        """Flushes every partition and closes the files. Returns the number of
+        rows written to each file, keyed by its path relative to the directory."""
+
+        for key in list(self.buffers):
+            self.flush(key)
+        for writer in self.writers.values():
+            writer.close()
+
+        return {f"{key}/{self.file_name}": rows for key, rows in self.rows.items()}
+
+    def get_file_stats(self) -> dict[str, FileStats]:
+        """Returns the statistics of each file, keyed by its path relative to
+        the directory."""
+
+        return {f"{key}/{self.file_name}": stats for key, stats in self.stats.items()}
+
+
+def write_parquet_chunks(chunks: Iterable[pd.DataFrame], directory: str, file_name: str,
+                         codec: str = ARCHIVE_CODEC) -> dict[str, int]:
+    """Writes DataFrame chunks into a date and plant bucket partitioned Parquet
+    archive under directory. Returns the rows written per relative file path."""
+
+    writer = PartitionedParquetWriter(directory, file_name, codec)
+    for chunk in chunks:
+        writer.write(chunk)
+
+    return writer.close()
+
+
 if __name__ == "__main__":
 
     sample_data = [
@@ -0,0 +1,67 @@
+'''Benchmarks extract() against the local mock plants API.
+
+Usage: python benchmark_extract.py --plants 1000 --latency 0.2 --error-rate 0.05 --runs 3'''
+import argparse
+import statistics
+import tempfile
+from os import path
+from time import perf_counter
+
+import extract_short
+import plant_registry
+from extract_short import extract, ConcurrencyController
+from mock_api import add_server_arguments, make_app_from_arguments, start_in_thread, get_live_ids
+
+
+def get_percentiles(latencies: list[float]) -> dict:
+    '''Return the p50, p95 and p99 of a list of latencies'''
+    if len(latencies) < 2:
+        value = latencies[0] if latencies else 0.0
+        return {"p50": value, "p95": value, "p99": value}
+
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def run_benchmark(expected: int) -> dict:
+    '''Runs extract() once and returns its throughput, latency and loss'''
+    controller = ConcurrencyController()
+
+    timer = perf_counter()
+    plants = extract(controller)
+    elapsed = perf_counter() - timer
+
+    return {
+        "plants": len(plants),
+        "seconds": elapsed,
+        "plants_per_second": len(plants) / elapsed if elapsed else 0.0,
+        "loss_rate": 1 - len(plants) / expected if expected else 0.0,
+        "requests": len(controller.latencies),
+        **get_percentiles(list(controller.latencies))
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_server_arguments(parser)
+    parser.add_argument("--runs", "-r", type=int, default=3,
+                        help="Number of extract runs; the first run also discovers plant IDs")
+    args = parser.parse_args()
+
+    stop = start_in_thread(make_app_from_arguments(args), port=args.port)
+    extract_short.BASE_URL = f"http://127.0.0.1:{args.port}"
+    expected_plants = len(get_live_ids(args.plants, args.gaps))
+
+    with tempfile.TemporaryDirectory() as registry_dir:
+        plant_registry.REGISTRY_PATH = path.join(registry_dir, "registry.json")
+
+        try:
+            for run in range(args.runs):
+                result = run_benchmark(expected_plants)
+                print(f"run {run}: {result['plants']}/{expected_plants} plants in "
+                      f"{result['seconds']:.2f}s | {result['plants_per_second']:.1f} plants/s | "
+                      f"{result['requests']} requests | p50 {result['p50'] * 1000:.0f}ms "
+                      f"p95 {result['p95'] * 1000:.0f}ms p99 {result['p99'] * 1000:.0f}ms | "
+                      f"loss {result['loss_rate']:.2%}")
+        finally:
+            stop()
@@ -0,0 +1,118 @@
+'''Compares the row-by-row executemany load against the bulk load.
+
+pymssql's executemany sends one statement per row, so the cost of a load is
+dominated by network round trips. This benchmark replays both paths against
+a cursor that waits a fixed round-trip time per statement.
+
+Usage: python benchmark_load.py --rows 100 1000 5000 --rtt 0.002'''
+import argparse
+from datetime import datetime as dt, timedelta
+from time import perf_counter, sleep
+
+from load_short import load, bulk_load
+
+
+class RoundTripCursor:
+    '''A cursor that sleeps for one round trip per statement sent'''
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.statements = 0
+        self.query = ""
+        self.params = ()
+        self.rowcount = -1
+
+    def execute(self, query: str, params: tuple = ()) -> None:
+        sleep(self.rtt)
+        self.statements += 1
+        self.query = query
+        self.params = params
+
+    def executemany(self, query: str, rows: list[tuple]) -> None:
+        for row in rows:
+            self.execute(query, row)
+
+    def fetchone(self) -> tuple:
+        return (self.statements,)
+
+    def fetchall(self) -> list[tuple]:
+        values = self.params
+        if "OUTPUT inserted.plant_id" in self.query:
+            return [(values[i + 3], values[i], values[i + 1], values[i + 2])
+                    for i in range(0, len(values), 6)]
+        if "OUTPUT inserted.location_id" not in self.query:
+            return []
+        return [(self.statements * 10_000 + i, values[i * 3], values[i * 3 + 1])
+                for i in range(len(values) // 3)]
+
+    def close(self) -> None:
+        pass
+
+
+class RoundTripConnection:
+    '''A connection whose commits also cost one round trip'''
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.round_trips = 0
+        self.cursors = []
+
+    def cursor(self) -> RoundTripCursor:
+        cursor = RoundTripCursor(self.rtt)
+        self.cursors.append(cursor)
+        return cursor
+
+    def commit(self) -> None:
+        sleep(self.rtt)
+        self.round_trips += 1
+
+    def rollback(self) -> None:
+        sleep(self.rtt)
+
+    @property
+    def total_round_trips(self) -> int:
+        return self.round_trips + sum(c.statements for c in self.cursors)
+
+
+def make_rows(num_readings: int) -> tuple[list, list, list]:
+    '''Returns plants, locations and readings for one load, with one new plant
+    and location for every 50 readings'''
+    now = dt.now().replace(microsecond=0)
+    num_new = max(1, num_readings // 50)
+
+    locations = [(-(i + 1), str(i / 100), str(i / 200), 1) for i in range(num_new)]
+    plants = [(1000 + i, -(i + 1), 1) for i in range(num_new)]
+    readings = [(now - timedelta(minutes=i // 50), 40.0, 20.0, i % 50, 1, now)
+                for i in range(num_readings)]
+
+    return plants, locations, readings
+
+
+def benchmark(num_readings: int, rtt: float) -> None:
+    '''Times both load paths for one number of readings and prints the result'''
+    plants, locations, readings = make_rows(num_readings)
+
+    results = {}
+    for name, loader in (("executemany", load), ("bulk", bulk_load)):
+        conn = RoundTripConnection(rtt)
+        timer = perf_counter()
+        loader(conn, plants, locations, readings)
+        results[name] = (perf_counter() - timer, conn.total_round_trips)
+
+    row_time, row_trips = results["executemany"]
+    bulk_time, bulk_trips = results["bulk"]
+    print(f"{num_readings:>7} readings | executemany {row_time:.3f}s ({row_trips} round trips)"
+          f" | bulk {bulk_time:.3f}s ({bulk_trips} round trips)"
+          f" | speedup {row_time / bulk_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", "-r", type=int, nargs="+", default=[100, 1_000, 5_000],
+                        help="Numbers of readings to load")
+    parser.add_argument("--rtt", type=float, default=0.002,
+                        help="Simulated database round-trip time in seconds")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        benchmark(rows, args.rtt)
@@ -0,0 +1,99 @@
+'''Compares the dict transform path against the typed record path.
+
+Usage: python benchmark_records.py --sizes 10000 100000'''
+import argparse
+import json
+import random
+from time import perf_counter
+
+from extract_short import validate_response
+from records import decode_plant, transform_record
+from transform_short import transform_plant, validate_plant
+
+NAMES = ["Rose", "Tulip", "Venus Flytrap", "Corpse Flower", "Orchid"]
+BOTANISTS = [("Jane Doe", "jane.doe@lnhm.co.uk"), ("John Smith", "john.smith@lnhm.co.uk"),
+             ("Ann Lee", "ann.lee@lnhm.co.uk")]
+
+
+def make_payloads(size: int) -> list[bytes]:
+    '''Return size encoded plant API responses'''
+    payloads = []
+    for plant_id in range(1, size + 1):
+        name, email = random.choice(BOTANISTS)
+        payloads.append(json.dumps({
+            "botanist": {"name": name, "email": email, "phone": "001-481-273-3691"},
+            "name": random.choice(NAMES),
+            "scientific_name": ["Rosa"],
+            "plant_id": plant_id,
+            "soil_moisture": round(random.uniform(10, 80), 3),
+            "temperature": round(random.uniform(10, 30), 3),
+            "last_watered": "Tue, 01 Oct 2024 13:54:32 GMT",
+            "recording_taken": "2024-10-02 10:00:00",
+            "origin_location": ["-19.32556", "-41.25528", "Resplendor", "BR", "America/Sao_Paulo"]
+        }).encode())
+    return payloads
+
+
+def make_reference(size: int) -> dict:
+    '''Return reference maps in which every plant already exists'''
+    botanists = {}
+    for botanist_id, (name, email) in enumerate(BOTANISTS):
+        first, last = name.split(" ")
+        botanists[(email, first, last)] = botanist_id
+    return {
+        "plant_ids": set(range(1, size + 1)),
+        "botanists": botanists,
+        "towns": {},
+        "species": {"scientific_name": {"Rosa": 1},
+                    "common_name": {n: i for i, n in enumerate(NAMES)}},
+        "coordinates": {},
+        "new_locations": 0
+    }
+
+
+def run_dict_path(payloads: list[bytes], reference: dict) -> list:
+    '''Decodes and transforms payloads as nested dictionaries'''
+    readings = []
+    for raw in payloads:
+        plant = json.loads(raw)
+        if validate_response(plant) and validate_plant(plant, reference["plant_ids"]):
+            readings.append(transform_plant(plant, reference)[2])
+    return readings
+
+
+def run_record_path(payloads: list[bytes], reference: dict) -> list:
+    '''Decodes and transforms payloads as typed records'''
+    readings = []
+    for raw in payloads:
+        record = decode_plant(raw)
+        if record is not None:
+            readings.append(transform_record(record, reference)[2])
+    return readings
+
+
+def benchmark(size: int) -> None:
+    '''Times both paths for one batch size and prints the result'''
+    payloads = make_payloads(size)
+
+    timer = perf_counter()
+    dict_readings = run_dict_path(payloads, make_reference(size))
+    dict_time = perf_counter() - timer
+
+    timer = perf_counter()
+    record_readings = run_record_path(payloads, make_reference(size))
+    record_time = perf_counter() - timer
+
+    assert dict_readings == record_readings
+
+    print(f"{size:>8} plants | dict {dict_time:.3f}s | records {record_time:.3f}s"
+          f" | speedup {dict_time / record_time:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", "-s", type=int, nargs="+", default=[10_000, 100_000],
+                        help="Numbers of plants to benchmark")
+    args = parser.parse_args()
+
+    for batch_size in args.sizes:
+        benchmark(batch_size)
@@ -0,0 +1,77 @@
+'''Measures spool write and replay throughput after a simulated outage.
+
+Each minute of the outage spools one batch of plants with a single fsync.
+Replay reads the spool back and loads it with one bulk load against a
+connection that waits a fixed round-trip time per statement, compared with
+loading each spooled minute separately.
+
+Usage: python benchmark_spool.py --minutes 60 1440 --plants 50 --rtt 0.002'''
+import argparse
+import logging
+import tempfile
+from time import perf_counter
+from unittest.mock import patch
+
+from benchmark_load import RoundTripConnection
+from benchmark_transform import make_batch, make_reference
+from pipeline_short import replay_spool, load_extracted
+from spool import Spool
+
+
+def spool_outage(spool: Spool, minutes: int, plants: int) -> list[list[dict]]:
+    '''Spools one batch per minute of the outage. Returns the batches.'''
+    batches = [make_batch(plants, plants) for _ in range(minutes)]
+    for minute, batch in enumerate(batches):
+        for plant in batch:
+            plant["recording_taken"] = f"2024-10-02 {minute // 60 % 24:02d}:{minute % 60:02d}:00"
+
+    timer = perf_counter()
+    for batch in batches:
+        spool.append(batch)
+    elapsed = perf_counter() - timer
+
+    size = spool.size()
+    print(f"{minutes:>5} minutes | spooled {minutes * plants} plants, {size / 1e6:.2f} MB"
+          f" in {elapsed:.3f}s ({minutes * plants / elapsed:,.0f} records/s)")
+    return batches
+
+
+def benchmark(minutes: int, plants: int, rtt: float) -> None:
+    '''Times a bulk replay against per-minute loads for one outage length'''
+    with tempfile.TemporaryDirectory() as directory, \
+            patch("transform_short.get_reference_data",
+                  side_effect=lambda cursor: make_reference(plants)):
+        spool = Spool(directory, max_size=1 << 40)
+        batches = spool_outage(spool, minutes, plants)
+
+        conn = RoundTripConnection(rtt)
+        timer = perf_counter()
+        loaded = replay_spool(conn, spool)
+        bulk_time = perf_counter() - timer
+        bulk_trips = conn.total_round_trips
+
+        conn = RoundTripConnection(rtt)
+        timer = perf_counter()
+        for batch in batches:
+            load_extracted(conn, batch)
+        minute_time = perf_counter() - timer
+
+    print(f"{'':>5}         | replay {loaded} readings in {bulk_time:.3f}s"
+          f" ({loaded / bulk_time:,.0f} readings/s, {bulk_trips} round trips)"
+          f" | per-minute loads {minute_time:.3f}s ({conn.total_round_trips} round trips)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", "-m", type=int, nargs="+", default=[60, 1_440],
+                        help="Outage lengths in minutes")
+    parser.add_argument("--plants", "-p", type=int, default=50,
+                        help="Plants read each minute")
+    parser.add_argument("--rtt", type=float, default=0.002,
+                        help="Simulated database round-trip time in seconds")
+    args = parser.parse_args()
+
+    logging.getLogger("spool").setLevel(logging.ERROR)
+
+    for outage in args.minutes:
+        benchmark(outage, args.plants, args.rtt)
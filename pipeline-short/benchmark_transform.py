@@ -0,0 +1,80 @@
+'''Compares the row-wise transform against the columnar transform.
+
+Usage: python benchmark_transform.py --sizes 50 5000 500000'''
+import argparse
+import random
+from copy import deepcopy
+from time import perf_counter
+from unittest.mock import MagicMock, patch
+
+from transform_columnar import transform_columnar
+from transform_short import transform_plant_data
+
+BOTANISTS = [("Gertrude Jekyll", "gertrude.jekyll@lnhm.co.uk"),
+             ("Carl Linnaeus", "carl.linnaeus@lnhm.co.uk"),
+             ("Eliza Andrews", "eliza.andrews@lnhm.co.uk")]
+
+
+def make_batch(size: int, num_plants: int = 50) -> list[dict]:
+    '''Return size readings spread over num_plants existing plants'''
+    return [{
+        "botanist": {"name": name, "email": email, "phone": "001-481-273-3691"},
+        "name": "Venus flytrap",
+        "scientific_name": ["Dionaea muscipula"],
+        "plant_id": i % num_plants + 1,
+        "soil_moisture": round(random.uniform(10, 80), 3),
+        "temperature": round(random.uniform(10, 30), 3),
+        "last_watered": "Tue, 01 Oct 2024 13:54:32 GMT",
+        "recording_taken": f"2024-10-02 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"
+    } for i, (name, email) in enumerate(random.choice(BOTANISTS) for _ in range(size))]
+
+
+def make_reference(num_plants: int = 50) -> dict:
+    '''Return reference maps containing every plant and botanist'''
+    botanists = {}
+    for botanist_id, (name, email) in enumerate(BOTANISTS, start=1):
+        first, last = name.split(" ")
+        botanists[(email, first, last)] = botanist_id
+    return {
+        "plant_ids": set(range(1, num_plants + 1)),
+        "botanists": botanists,
+        "towns": {},
+        "species": {"scientific_name": {}, "common_name": {}},
+        "coordinates": {},
+        "new_locations": 0
+    }
+
+
+def run_row_path(batch: list[dict]) -> tuple:
+    '''Runs transform_plant_data with the reference maps patched in'''
+    with patch("transform_short.get_reference_data", return_value=make_reference()):
+        return transform_plant_data(MagicMock(), batch)
+
+
+def benchmark(size: int) -> None:
+    '''Times both transforms for one batch size and prints the result'''
+    batch = make_batch(size)
+    row_batch = deepcopy(batch)
+
+    timer = perf_counter()
+    row_result = run_row_path(row_batch)
+    row_time = perf_counter() - timer
+
+    timer = perf_counter()
+    columnar_result = transform_columnar(batch, make_reference())
+    columnar_time = perf_counter() - timer
+
+    assert row_result == columnar_result
+
+    print(f"{size:>8} readings | row-wise {row_time:.4f}s | columnar {columnar_time:.4f}s"
+          f" | speedup {row_time / columnar_time:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", "-s", type=int, nargs="+", default=[50, 5_000, 500_000],
+                        help="Numbers of readings to benchmark")
+    args = parser.parse_args()
+
+    for batch_size in args.sizes:
+        benchmark(batch_size)
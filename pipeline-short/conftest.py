@@ -0,0 +1,40 @@
+# pylint: skip-file
+"""Test data shared by the short pipeline tests."""
+from copy import deepcopy
+
+
+def make_botanist(name="Jane Doe", email="jane@botany.com", phone="1"):
+    """Returns the botanist of a plants API response."""
+    return {"name": name, "phone": phone, "email": email}
+
+
+def make_plant(plant_id=1, **overrides):
+    """Returns a plants API response for a Rose kept by Jane Doe, with any
+    fields overridden."""
+    plant = {
+        "botanist": make_botanist(),
+        "name": "Rose",
+        "plant_id": plant_id,
+        "soil_moisture": 40.0,
+        "temperature": 20.0,
+        "last_watered": "Tue, 01 Oct 2024 13:54:32 GMT",
+        "recording_taken": "2024-10-02 10:00:00",
+        "origin_location": ["2.35", "48.85", "Paris", "FR", "Europe/Paris"]
+    }
+    plant.update(deepcopy(overrides))
+    return plant
+
+
+def make_reference(**overrides):
+    """Returns reference maps that know plant 1, Jane Doe, Paris and the Rose
+    species, with any maps overridden."""
+    reference = {
+        "plant_ids": {1},
+        "botanists": {("jane@botany.com", "Jane", "Doe"): 7},
+        "towns": {"Paris": 3},
+        "species": {"scientific_name": {}, "common_name": {"Rose": 2}},
+        "coordinates": {},
+        "new_locations": 0
+    }
+    reference.update(deepcopy(overrides))
+    return reference
@@ -1,10 +1,12 @@
+'''Queries that read and upsert the reference tables used by the short pipeline'''
 import logging
+from copy import deepcopy
 
 LOGGER = logging.getLogger(__name__)
 
 
 def get_all_plant_ids(cursor):
-    '''Returns a mapping of all plants to the most recent botanist'''
+    '''Returns a list of the IDs of every stored plant'''
 
     query = "SELECT plant_id from gamma.plants"
 
@@ -17,14 +19,7 @@ def get_all_plant_ids(cursor):
 def map_plant_id_to_most_recent_botanist(cursor):
     '''Returns a mapping of all plants to the most recent botanist'''
 
-    query = """SELECT r.plant_id, r.botanist_id
-    FROM gamma.recordings r
-    JOIN (
-        SELECT plant_id, MAX(time_taken) AS max_time
-        FROM gamma.recordings
-        GROUP BY plant_id
-    ) recent ON r.plant_id = recent.plant_id AND r.time_taken = recent.max_time
-    """
+    query = "SELECT plant_id, botanist_id FROM gamma.plant_latest_state"
 
     cursor.execute(query)
 
@@ -46,7 +41,7 @@ def map_botanist_details_to_id(cursor) -> dict:
 
 
 def map_town_name_to_id(cursor) -> dict:
-    '''Return a dictionary mapping country codes to country_id'''
+    '''Return a dictionary mapping town names to town_id'''
     cursor.execute("SELECT town_name, town_id FROM gamma.regions")
     rows = cursor.fetchall()
 
@@ -54,7 +49,7 @@ def map_town_name_to_id(cursor) -> dict:
 
 
 def map_species_names_to_species_id(cursor) -> dict:
-    '''Return a dictionary mapping scientific_name to species_id'''
+    '''Return dictionaries mapping scientific_name and common_name to species_id'''
 
     cursor.execute(
         "SELECT plant_species_id, scientific_name, common_name FROM gamma.plant_species")
@@ -76,7 +71,7 @@ def map_country_code_to_id(cursor) -> dict:
 
 
 def map_longitude_and_latitude_to_location_id(cursor) -> dict:
-    '''Return a dictionary mapping (longitude, latitude) tuples to origin_id'''
+    '''Return a dictionary mapping (longitude, latitude) tuples to location_id'''
     cursor.execute("SELECT longitude,latitude,location_id FROM gamma.origins")
     rows = cursor.fetchall()
     return {(row[0], row[1]): row[2] for row in rows}
@@ -95,3 +90,150 @@ def get_max_location_id(cursor) -> int:
     cursor.execute("SELECT MAX(location_id) FROM gamma.origins")
     row = cursor.fetchone()
     return row[0]
+
+
+def get_values_placeholders(num_rows: int, width: int) -> str:
+    '''Returns "(%s, ...), (%s, ...)" for num_rows rows of width values'''
+    row = "(" + ", ".join(["%s"] * width) + ")"
+    return ", ".join([row] * num_rows)
+
+
+def map_country_id_to_continent_id(cursor) -> dict:
+    '''Return a dictionary mapping country_id to the continent_id of its regions'''
+    cursor.execute(
+        "SELECT country_id, MIN(continent_id) FROM gamma.regions GROUP BY country_id")
+    rows = cursor.fetchall()
+
+    return {row[0]: row[1] for row in rows if row}
+
+
+def upsert_botanists(cursor, botanists: list[tuple]) -> dict:
+    '''Inserts (email, first_name, last_name, phone) rows for emails not already
+    stored in one statement, leaving the names of stored botanists unchanged.
+    Only the first row of each email is used. Returns email: botanist_id'''
+
+    rows = {}
+    for row in botanists:
+        rows.setdefault(row[0], row)
+    rows = list(rows.values())
+
+    cursor.execute(f"""
+    MERGE gamma.botanists WITH (HOLDLOCK) AS t
+    USING (VALUES {get_values_placeholders(len(rows), 4)})
+        AS s (email, first_name, last_name, phone)
+    ON t.email = s.email
+    WHEN MATCHED THEN
+        UPDATE SET t.email = t.email
+    WHEN NOT MATCHED THEN
+        INSERT (email, first_name, last_name, phone)
+        VALUES (s.email, s.first_name, s.last_name, s.phone)
+    OUTPUT inserted.botanist_id, inserted.email;
+    """, tuple(value for row in rows for value in row))
+
+    return {row[1]: row[0] for row in cursor.fetchall()}
+
+
+def upsert_species(cursor, species: list[tuple]) -> list[tuple]:
+    '''Inserts (common_name, scientific_name) rows not already stored in one
+    statement. Returns (plant_species_id, scientific_name, common_name) rows.'''
+
+    cursor.execute(f"""
+    MERGE gamma.plant_species WITH (HOLDLOCK) AS t
+    USING (VALUES {get_values_placeholders(len(species), 2)})
+        AS s (common_name, scientific_name)
+    ON t.scientific_name = s.scientific_name
+    WHEN MATCHED THEN
+        UPDATE SET t.common_name = t.common_name
+    WHEN NOT MATCHED THEN
+        INSERT (common_name, scientific_name) VALUES (s.common_name, s.scientific_name)
+    OUTPUT inserted.plant_species_id, inserted.scientific_name, inserted.common_name;
+    """, tuple(value for row in species for value in row))
+
+    return cursor.fetchall()
+
+
+def upsert_regions(cursor, regions: list[tuple]) -> dict:
+    '''Inserts (town_name, country_id, continent_id) rows not already stored in
+    one statement. Returns town_name: town_id'''
+
+    cursor.execute(f"""
+    MERGE gamma.regions WITH (HOLDLOCK) AS t
+    USING (VALUES {get_values_placeholders(len(regions), 3)})
+        AS s (town_name, country_id, continent_id)
+    ON t.town_name = s.town_name AND t.country_id = s.country_id
+    WHEN MATCHED THEN
+        UPDATE SET t.town_name = t.town_name
+    WHEN NOT MATCHED THEN
+        INSERT (town_name, country_id, continent_id)
+        VALUES (s.town_name, s.country_id, s.continent_id)
+    OUTPUT inserted.town_id, inserted.town_name;
+    """, tuple(value for row in regions for value in row))
+
+    return {row[1]: row[0] for row in cursor.fetchall()}
+
+
+def get_table_fingerprints(cursor, tables: list[str]) -> dict:
+    '''Returns a (row count, checksum) fingerprint for each table in one query'''
+
+    query = " UNION ALL ".join(
+        f"SELECT '{table}', COUNT(*), CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM {table}"
+        for table in tables)
+
+    cursor.execute(query)
+    rows = cursor.fetchall()
+
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+REFERENCE_LOADERS = {
+    "plant_ids": ("gamma.plants", get_all_plant_ids),
+    "botanists": ("gamma.botanists", map_botanist_details_to_id),
+    "towns": ("gamma.regions", map_town_name_to_id),
+    "species": ("gamma.plant_species", map_species_names_to_species_id),
+    "coordinates": ("gamma.origins", map_longitude_and_latitude_to_location_id)
+}
+
+
+class ReferenceCache:
+    '''Keeps reference maps between invocations and reloads only the ones whose
+    table fingerprint has changed'''
+
+    def __init__(self, loaders: dict = None):
+        self.loaders = loaders or REFERENCE_LOADERS
+        self.values = {}
+        self.fingerprints = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cursor) -> dict:
+        '''Returns a copy of every reference map, reloading stale ones'''
+        tables = sorted({table for table, _ in self.loaders.values()})
+        fingerprints = get_table_fingerprints(cursor, tables)
+
+        hits, misses = 0, 0
+        for name, (table, loader) in self.loaders.items():
+            fingerprint = fingerprints.get(table)
+            if name in self.values and fingerprint is not None \
+                    and self.fingerprints.get(table) == fingerprint:
+                hits += 1
+                continue
+
+            self.values[name] = loader(cursor)
+            misses += 1
+
+        self.fingerprints = fingerprints
+        self.hits += hits
+        self.misses += misses
+
+        LOGGER.info("Reference cache: %s hits, %s misses (%s/%s total)",
+                    hits, misses, self.hits, self.misses)
+
+        return deepcopy(self.values)
+
+    def clear(self) -> None:
+        '''Forgets every cached map'''
+        self.values = {}
+        self.fingerprints = {}
+
+
+REFERENCE_CACHE = ReferenceCache()
@@ -1,6 +1,10 @@
 '''Extraction of the data'''
 import logging
+import random
 
+from collections import deque
+from contextlib import nullcontext
+from os import environ as ENV
 from time import perf_counter
 
 import requests
@@ -8,6 +12,8 @@ import asyncio
 import aiohttp
 
 from logger import logger_setup
+from plant_registry import (load_registry, load_misses, save_registry, needs_discovery,
+                            get_discovery_ids, update_registry)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -15,6 +21,80 @@ BASE_URL = "http://data-eng-plants-api.herokuapp.com/"
 
 REQUIRED_FIELDS = ["botanist", "plant_id"]
 
+MAX_CONCURRENCY = int(ENV.get("MAX_CONCURRENCY", 64))
+MIN_CONCURRENCY = int(ENV.get("MIN_CONCURRENCY", 4))
+INITIAL_CONCURRENCY = int(ENV.get("INITIAL_CONCURRENCY", 16))
+TARGET_LATENCY = float(ENV.get("TARGET_LATENCY", 1.5))
+REQUEST_TIMEOUT = float(ENV.get("REQUEST_TIMEOUT", 10))
+RUN_DEADLINE = float(ENV.get("RUN_DEADLINE", 45))
+MAX_RETRIES = int(ENV.get("MAX_RETRIES", 3))
+RETRY_BASE_DELAY = float(ENV.get("RETRY_BASE_DELAY", 0.25))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+LATENCY_HISTORY = 100_000
+
+
+class ConcurrencyController:
+    '''Caps the number of in-flight requests and adapts the cap using AIMD.
+
+    Each successful request that comes back under the target latency grows
+    the limit by roughly one per window of requests; a failure or a slow
+    response shrinks it, at most once per window so that a burst of errors
+    only counts as one congestion signal.'''
+
+    def __init__(self, initial: int = INITIAL_CONCURRENCY,
+                 minimum: int = MIN_CONCURRENCY, maximum: int = MAX_CONCURRENCY,
+                 target_latency: float = TARGET_LATENCY, decrease: float = 0.5):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.target_latency = target_latency
+        self.decrease = decrease
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+        self._since_decrease = int(self.limit)
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        '''Wait until a request slot is available and take it'''
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, failed: bool) -> None:
+        '''Give back a request slot and feed its outcome to the controller'''
+        async with self._condition:
+            self.in_flight -= 1
+            self.record(latency, failed)
+            self._condition.notify_all()
+
+    def record(self, latency: float, failed: bool) -> None:
+        '''Adjusts the concurrency limit for one observed request'''
+        self.latencies.append(latency)
+        self._since_decrease += 1
+
+        if failed:
+            self.failures += 1
+        else:
+            self.successes += 1
+
+        if failed or latency > self.target_latency:
+            if self._since_decrease >= int(self.limit):
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._since_decrease = 0
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    @property
+    def error_rate(self) -> float:
+        '''Fraction of observed requests that failed'''
+        total = self.successes + self.failures
+        return self.failures / total if total else 0.0
+
 
 def get_url(id: int) -> str:
     '''Gets the API url'''
@@ -23,13 +103,19 @@ def get_url(id: int) -> str:
     return url
 
 
-def get_num_plants() -> int:
-    '''Return the number of plants on display.'''
+def get_num_plants() -> int | None:
+    '''Return the number of plants on display, or None if it is unknown
+    because the request failed.'''
     timer = perf_counter()
-    response = requests.get(BASE_URL, timeout=50).json()
+    try:
+        response = requests.get(BASE_URL, timeout=50).json()
+    except (requests.RequestException, ValueError) as err:
+        LOGGER.warning("Could not retrieve the number of plants: %s", err)
+        return None
+
+    num_plants = response.get("plants_on_display")
 
-    if response.get("success", False) is not False:
-        num_plants = response.get("plants_on_display")
+    if response.get("success", False) is not False and num_plants is not None:
         LOGGER.info("Number of plants on display is %s", num_plants)
 
         LOGGER.info("Time taken to retrieve plant count: %s",
@@ -37,7 +123,8 @@ def get_num_plants() -> int:
 
         return int(num_plants)
 
-    return 0
+    LOGGER.warning("Unsuccessful response for the number of plants")
+    return None
 
 
 def validate_response(response: dict) -> bool:
@@ -48,49 +135,145 @@ def validate_response(response: dict) -> bool:
     return True
 
 
-async def get_plant_data(session: aiohttp.ClientSession, plant_id: int) -> dict | None:
-    '''Return data from a plant_id endpoint asynchronously'''
-    async with session.get(get_url(plant_id)) as response:
-        if response.status == 200:
-            LOGGER.info("Retrieved data for plant %s", plant_id)
-            data = await response.json()
-            if validate_response(data):
-                return data
+def get_retry_delay(attempt: int) -> float:
+    '''Return a jittered exponential backoff delay for a retry attempt'''
+    return random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt)
 
-        LOGGER.warning("Unsuccessful response for plant %s", plant_id)
-        return None
 
+async def get_plant_data(session: aiohttp.ClientSession, plant_id: int,
+                         controller: ConcurrencyController | None = None) -> dict | None:
+    '''Return data from a plant_id endpoint asynchronously.
+
+    Timeouts, connection errors and 429/5xx responses are retried with
+    jittered backoff up to MAX_RETRIES times.'''
+    if controller is None:
+        controller = ConcurrencyController()
+
+    for attempt in range(MAX_RETRIES + 1):
+        await controller.acquire()
+        timer = perf_counter()
+        failed = False
+        retry = False
+        try:
+            async with session.get(get_url(plant_id)) as response:
+                if response.status == 200:
+                    LOGGER.info("Retrieved data for plant %s", plant_id)
+                    data = await response.json()
+                    if validate_response(data):
+                        return data
+                    return None
+
+                retry = failed = response.status in RETRY_STATUSES
+
+        except (asyncio.TimeoutError, aiohttp.ClientError) as err:
+            LOGGER.warning("Request for plant %s failed: %s", plant_id, err)
+            retry = failed = True
+
+        except ValueError as err:
+            LOGGER.warning("Malformed response for plant %s: %s", plant_id, err)
+
+        finally:
+            await controller.release(perf_counter() - timer, failed)
+
+        if not retry:
+            break
+
+        if attempt < MAX_RETRIES:
+            await asyncio.sleep(get_retry_delay(attempt))
+
+    LOGGER.warning("Unsuccessful response for plant %s", plant_id)
+    return None
+
+
+def get_session(max_concurrency: int = MAX_CONCURRENCY) -> aiohttp.ClientSession:
+    '''Return a client session with a per-request timeout and pooled connections'''
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    return aiohttp.ClientSession(timeout=timeout, connector=connector)
+
+
+async def fetch_all_plants(plant_ids: list[int], max_concurrency: int = MAX_CONCURRENCY,
+                           deadline: float = RUN_DEADLINE,
+                           controller: ConcurrencyController | None = None) -> list:
+    '''Fetch data for all plant endpoints asynchronously.
+
+    At most max_concurrency requests are in flight at once; any plant still
+    outstanding when the run deadline passes is dropped and logged.'''
+    return [plant async for plant in stream_plants(plant_ids, max_concurrency, deadline,
+                                                   controller=controller)]
 
-async def fetch_all_plants(num_plants: int) -> list:
-    '''Fetch data for all plant endpoints asynchronously'''
-    async with aiohttp.ClientSession() as session:
 
-        tasks = []
-        plant_id = 0
-        not_found_streak = 0
+async def stream_plants(plant_ids: list[int], max_concurrency: int = MAX_CONCURRENCY,
+                        deadline: float = RUN_DEADLINE,
+                        session: aiohttp.ClientSession | None = None,
+                        controller: ConcurrencyController | None = None):
+    '''Yield plant data asynchronously in the order responses arrive.
 
-        while len(tasks) < num_plants:
+    An existing session and controller can be passed in to keep connections
+    and the learned concurrency limit warm between runs.'''
+    if controller is None:
+        controller = ConcurrencyController(maximum=max_concurrency)
 
-            task = get_plant_data(session, plant_id)
+    session_context = nullcontext(session) if session is not None else get_session(
+        max_concurrency)
 
-            if task is not None:
-                not_found_streak = 0
-                tasks.append(task)
-            else:
-                not_found_streak += 1
+    async with session_context as session:
 
-            plant_id += 1
+        tasks = [asyncio.create_task(get_plant_data(session, plant_id, controller))
+                 for plant_id in plant_ids]
 
-        results = await asyncio.gather(*tasks)
-        return [result for result in results if result]
+        if not tasks:
+            return
 
+        try:
+            for next_done in asyncio.as_completed(tasks, timeout=deadline):
+                try:
+                    result = await next_done
+                except asyncio.TimeoutError:
+                    LOGGER.warning("Run deadline reached, %s plants not retrieved",
+                                   sum(not task.done() for task in tasks))
+                    break
+                except Exception as err:
+                    LOGGER.warning("Plant request failed: %s", err)
+                    continue
 
-def extract() -> list[dict]:
+                if result:
+                    yield result
+
+        finally:
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+            LOGGER.info("Final concurrency limit %s, error rate %s",
+                        round(controller.limit, 2), round(controller.error_rate, 3))
+
+
+def get_plant_ids(registry: set[int], num_plants: int | None) -> tuple[list[int], list[int]]:
+    '''Return the known plant IDs to request and any unknown IDs to probe'''
+    if needs_discovery(registry, num_plants):
+        LOGGER.info("Registry has %s plants but %s are on display, probing unknown IDs",
+                    len(registry), num_plants)
+        return sorted(registry), get_discovery_ids(registry, num_plants)
+
+    return sorted(registry), []
+
+
+def extract(controller: ConcurrencyController | None = None) -> list[dict]:
     '''Return a list of dictionaries with the extracted data'''
     timer = perf_counter()
     num_plants = get_num_plants()
+    registry = load_registry()
+
+    known_ids, probe_ids = get_plant_ids(registry, num_plants)
+
+    plant_data = asyncio.run(fetch_all_plants(known_ids + probe_ids,
+                                              controller=controller))
 
-    plant_data = asyncio.run(fetch_all_plants(num_plants))
+    if probe_ids:
+        misses = load_misses()
+        save_registry(update_registry(registry, probe_ids, plant_data, misses), misses=misses)
 
     LOGGER.info("Retrieved plant data. Time taken: %s",
                 str(round(perf_counter()-timer, 3)))
@@ -100,6 +283,30 @@ def extract() -> list[dict]:
     return []
 
 
+async def stream_extract(session: aiohttp.ClientSession | None = None,
+                         controller: ConcurrencyController | None = None):
+    '''Yield extracted plant data as it arrives, updating the plant registry
+    once the stream is exhausted'''
+    timer = perf_counter()
+    num_plants = await asyncio.to_thread(get_num_plants)
+    registry = load_registry()
+
+    known_ids, probe_ids = get_plant_ids(registry, num_plants)
+
+    found = []
+    async for plant in stream_plants(known_ids + probe_ids,
+                                     session=session, controller=controller):
+        found.append({"plant_id": plant["plant_id"]})
+        yield plant
+
+    if probe_ids:
+        misses = load_misses()
+        save_registry(update_registry(registry, probe_ids, found, misses), misses=misses)
+
+    LOGGER.info("Streamed plant data. Time taken: %s",
+                str(round(perf_counter()-timer, 3)))
+
+
 if __name__ == "__main__":
     logger_setup("log_extract.log", "logs")
     data = extract()
@@ -1,22 +1,111 @@
 '''Script for loading'''
+import json
 import logging
+from os import environ as ENV
+from time import perf_counter
 
 from dotenv import load_dotenv
 
+from database_functions import get_values_placeholders
+
 LOGGER = logging.getLogger(__name__)
 
+BATCH_SIZE = int(ENV.get("BATCH_SIZE", 100))
+BATCH_INTERVAL = float(ENV.get("BATCH_INTERVAL", 5))
+CHUNK_SIZE = int(ENV.get("LOAD_CHUNK_SIZE", 500))
+
+RECORDING_COLUMNS = ["time_taken", "soil_moisture", "temperature",
+                     "plant_id", "botanist_id", "last_watering"]
+
+HISTORY_SIZE = int(ENV.get("LATEST_HISTORY_SIZE", 10))
+
+LATEST_STATE_COLUMNS = ["plant_id", "time_taken", "soil_moisture", "temperature",
+                        "last_watering", "botanist_id", "history"]
+
+ROLLUP_METRICS = ["soil_moisture", "temperature"]
+
+ROLLUP_COLUMNS = ["plant_id", "period_start", "reading_count"] + [
+    f"{metric}_{stat}" for metric in ROLLUP_METRICS
+    for stat in ("min", "max", "sum", "sum_squares")]
+
+
+class MicroBatch:
+    '''Accumulates rows to insert and flushes them once the batch is large
+    enough or old enough'''
+
+    def __init__(self, max_size: int = BATCH_SIZE, max_age: float = BATCH_INTERVAL):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.plants = []
+        self.locations = []
+        self.readings = []
+        self.location_ids = {}
+        self.started = perf_counter()
+        self.flushed = 0
+
+    def add(self, plant: tuple | None, location: tuple | None, reading: tuple | None) -> None:
+        '''Adds the rows produced for one plant'''
+        if plant:
+            self.plants.append(plant)
+        if location:
+            self.locations.append(location)
+        if reading:
+            self.readings.append(reading)
+
+    def __len__(self) -> int:
+        return len(self.readings) + len(self.plants) + len(self.locations)
+
+    def is_ready(self) -> bool:
+        '''Return True if the batch should be flushed'''
+        if not len(self):
+            return False
+        return len(self) >= self.max_size or perf_counter() - self.started >= self.max_age
 
-def load(conn, plants_to_insert: list[tuple], locations_to_insert: list[tuple], readings_to_insert: list[tuple]):
-    '''Given a list of plants, locations and readings to insert, uses a connection to insert them.'''
+    def flush(self, conn) -> None:
+        '''Loads the accumulated rows and starts a new batch. Location IDs
+        assigned by earlier flushes are reused to resolve later plants.'''
+        if len(self):
+            self.location_ids = bulk_load(conn, self.plants, self.locations,
+                                          self.readings, self.location_ids)
+            self.flushed += len(self.readings)
+            LOGGER.info("Flushed batch of %s readings", len(self.readings))
 
+        self.plants, self.locations, self.readings = [], [], []
+        self.started = perf_counter()
+
+
+def resolve_location_ids(plants: list[tuple], location_ids: dict) -> list[tuple]:
+    '''Replaces provisional (negative) location IDs in plant rows with the
+    IDs the database assigned'''
+    resolved = []
+
+    for plant_id, location_id, species_id in plants:
+        if location_id < 0:
+            if location_id not in location_ids:
+                raise ValueError(f"No location inserted for plant {plant_id}")
+            location_id = location_ids[location_id]
+        resolved.append((plant_id, location_id, species_id))
+
+    return resolved
+
+
+def load(conn, plants_to_insert: list[tuple], locations_to_insert: list[tuple],
+         readings_to_insert: list[tuple], location_ids: dict | None = None) -> dict:
+    '''Given a list of plants, locations and readings to insert, uses a connection to insert them
+    row by row. Returns a mapping of provisional to inserted location IDs.
+
+    The pipeline loads with bulk_load. This row-by-row load is kept only as
+    the baseline that benchmark_load.py measures bulk_load against.'''
+
+    location_ids = dict(location_ids or {})
     cur = conn.cursor()
 
     if locations_to_insert:
-        insert_into_locations_table(cur, locations_to_insert)
+        location_ids.update(insert_into_locations_table(cur, locations_to_insert))
         conn.commit()
 
     if plants_to_insert:
-        insert_new_plants(cur, plants_to_insert)
+        insert_new_plants(cur, resolve_location_ids(plants_to_insert, location_ids))
         conn.commit()
 
     if readings_to_insert:
@@ -25,22 +114,304 @@ def load(conn, plants_to_insert: list[tuple], locations_to_insert: list[tuple],
 
     cur.close()
 
+    return location_ids
+
+
+def bulk_load(conn, plants_to_insert: list[tuple], locations_to_insert: list[tuple],
+              readings_to_insert: list[tuple], location_ids: dict | None = None,
+              chunk_size: int = CHUNK_SIZE) -> dict:
+    '''Inserts plants, locations and readings with multi-row statements in a
+    single transaction, updating each plant's latest state and hourly and
+    daily rollups in the same transaction.
+    Returns a mapping of provisional to inserted location IDs.'''
+
+    location_ids = dict(location_ids or {})
+    cur = conn.cursor()
+
+    try:
+        if locations_to_insert:
+            location_ids.update(
+                bulk_insert_locations(cur, locations_to_insert, chunk_size))
+
+        if plants_to_insert:
+            bulk_insert(cur, "gamma.plants", ["plant_id", "location_id", "plant_species_id"],
+                        resolve_location_ids(plants_to_insert, location_ids), chunk_size)
+
+        skipped = 0
+        if readings_to_insert:
+            inserted = bulk_insert_recordings(cur, readings_to_insert, chunk_size)
+            skipped = len(readings_to_insert) - len(inserted)
+            upsert_latest_state(cur, readings_to_insert, chunk_size)
+            upsert_rollups(cur, inserted, chunk_size)
+
+        conn.commit()
+
+        if skipped:
+            LOGGER.info("Skipped %s duplicate readings", skipped)
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        cur.close()
+
+    return location_ids
+
+
+def get_chunks(rows: list, chunk_size: int):
+    '''Yields consecutive slices of at most chunk_size rows'''
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+def bulk_insert(cursor, table: str, columns: list[str], rows: list[tuple],
+                chunk_size: int = CHUNK_SIZE) -> None:
+    '''Inserts rows with one multi-row VALUES statement per chunk'''
+    for chunk in get_chunks(rows, chunk_size):
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+            f"{get_values_placeholders(len(chunk), len(columns))}",
+            tuple(value for row in chunk for value in row))
+
+
+def deduplicate_recordings(recordings: list[tuple]) -> list[tuple]:
+    '''Returns the recordings with repeated (plant_id, time_taken) readings removed'''
+    seen = set()
+    unique = []
+
+    for recording in recordings:
+        key = (recording[3], recording[0])
+        if key not in seen:
+            seen.add(key)
+            unique.append(recording)
+
+    return unique
+
+
+def bulk_insert_recordings(cursor, recordings: list[tuple],
+                           chunk_size: int = CHUNK_SIZE) -> list[tuple]:
+    '''Inserts recordings that are not already stored for the same plant and
+    time, one anti-join statement per chunk. Returns the (plant_id, time_taken,
+    soil_moisture, temperature) rows actually inserted.'''
+    unique = deduplicate_recordings(recordings)
+    inserted = []
+
+    for chunk in get_chunks(unique, chunk_size):
+        cursor.execute(f"""
+        INSERT INTO gamma.recordings ({', '.join(RECORDING_COLUMNS)})
+        OUTPUT inserted.plant_id, inserted.time_taken,
+            inserted.soil_moisture, inserted.temperature
+        SELECT CAST(v.time_taken AS DATETIME), v.soil_moisture, v.temperature,
+            v.plant_id, v.botanist_id, CAST(v.last_watering AS DATETIME)
+        FROM (VALUES {get_values_placeholders(len(chunk), len(RECORDING_COLUMNS))})
+            AS v ({', '.join(RECORDING_COLUMNS)})
+        WHERE NOT EXISTS (
+            SELECT 1 FROM gamma.recordings r WITH (UPDLOCK, HOLDLOCK)
+            WHERE r.plant_id = v.plant_id
+            AND r.time_taken = CAST(v.time_taken AS DATETIME))
+        """, tuple(value for row in chunk for value in row))
+        inserted.extend(cursor.fetchall())
+
+    return inserted
+
+
+def get_hour(time_taken):
+    '''Return the start of the hour a reading was taken in'''
+    return time_taken.replace(minute=0, second=0, microsecond=0)
+
+
+def get_day(time_taken):
+    '''Return the date a reading was taken on'''
+    return time_taken.date()
+
+
+ROLLUP_PERIODS = {"gamma.hourly_rollups": get_hour,
+                  "gamma.daily_rollups": get_day}
+
+
+def get_rollups(recordings: list[tuple], get_period) -> list[tuple]:
+    '''Aggregates (plant_id, time_taken, soil_moisture, temperature) rows into
+    one row of count and min, max, sum and sum of squares per metric for
+    each plant and period'''
+    rollups = {}
+
+    for plant_id, time_taken, *values in recordings:
+        key = (plant_id, get_period(time_taken))
+        row = rollups.get(key)
+
+        if row is None:
+            row = [0]
+            for value in values:
+                row.extend([value, value, 0.0, 0.0])
+            rollups[key] = row
+
+        row[0] += 1
+        for i, value in enumerate(values):
+            stats = 1 + i * 4
+            row[stats] = min(row[stats], value)
+            row[stats + 1] = max(row[stats + 1], value)
+            row[stats + 2] += value
+            row[stats + 3] += value * value
+
+    return [(*key, *row) for key, row in rollups.items()]
+
+
+def get_rollup_update(column: str) -> str:
+    '''Return the MERGE assignment that combines a stored and a new statistic'''
+    if column.endswith("_min"):
+        return f"t.{column} = CASE WHEN s.{column} < t.{column} THEN s.{column} ELSE t.{column} END"
+    if column.endswith("_max"):
+        return f"t.{column} = CASE WHEN s.{column} > t.{column} THEN s.{column} ELSE t.{column} END"
+    return f"t.{column} = t.{column} + s.{column}"
+
+
+def upsert_rollups(cursor, recordings: list[tuple], chunk_size: int = CHUNK_SIZE) -> int:
+    '''Adds newly inserted (plant_id, time_taken, soil_moisture, temperature)
+    rows to the hourly and daily rollup tables, one MERGE per chunk of
+    periods. Returns the number of rollup rows written.'''
+    written = 0
+    updates = ", ".join(get_rollup_update(column) for column in ROLLUP_COLUMNS[2:])
+
+    for table, get_period in ROLLUP_PERIODS.items():
+        rows = get_rollups(recordings, get_period)
+
+        for chunk in get_chunks(rows, chunk_size):
+            cursor.execute(f"""
+            MERGE {table} WITH (HOLDLOCK) AS t
+            USING (VALUES {get_values_placeholders(len(chunk), len(ROLLUP_COLUMNS))})
+                AS s ({', '.join(ROLLUP_COLUMNS)})
+            ON t.plant_id = s.plant_id AND t.period_start = s.period_start
+            WHEN MATCHED THEN
+                UPDATE SET {updates}
+            WHEN NOT MATCHED THEN
+                INSERT ({', '.join(ROLLUP_COLUMNS)})
+                VALUES ({', '.join(f's.{column}' for column in ROLLUP_COLUMNS)});
+            """, tuple(value for row in chunk for value in row))
+
+        written += len(rows)
+
+    return written
+
+
+def format_time(value) -> str:
+    '''Return a timestamp in the ISO format SQL Server's FOR JSON produces'''
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def get_latest_states(cursor, plant_ids: list[int], chunk_size: int = CHUNK_SIZE) -> dict:
+    '''Returns plant_id: (last_watering, history) for the stored latest states
+    of the given plants, locking them until the transaction ends'''
+    states = {}
+
+    for chunk in get_chunks(sorted(plant_ids), chunk_size):
+        cursor.execute(f"""
+        SELECT plant_id, last_watering, history
+        FROM gamma.plant_latest_state WITH (UPDLOCK, HOLDLOCK)
+        WHERE plant_id IN ({', '.join(['%s'] * len(chunk))})
+        """, tuple(chunk))
+
+        for plant_id, last_watering, history in cursor.fetchall():
+            states[plant_id] = (last_watering, json.loads(history))
+
+    return states
+
+
+def merge_latest_state(plant_id: int, state: tuple | None, readings: list[tuple],
+                       history_size: int = HISTORY_SIZE) -> tuple:
+    '''Merges a plant's new readings into its stored (last_watering, history)
+    state. The history keeps the newest history_size readings, newest first,
+    so readings that arrive late or twice do not displace newer ones.
+    Returns a gamma.plant_latest_state row.'''
+    last_watering, stored = state or (None, [])
+
+    history = {entry["time_taken"]: entry for entry in stored}
+    for reading in readings:
+        time_taken = format_time(reading[0])
+        history[time_taken] = {"time_taken": time_taken, "soil_moisture": reading[1],
+                               "temperature": reading[2], "botanist_id": reading[4]}
+        if last_watering is None or reading[5] > last_watering:
+            last_watering = reading[5]
+
+    newest = sorted(history.values(), key=lambda e: e["time_taken"],
+                    reverse=True)[:history_size]
+    latest = newest[0]
+
+    return (plant_id, latest["time_taken"], latest["soil_moisture"], latest["temperature"],
+            last_watering, latest["botanist_id"], json.dumps(newest))
+
+
+def upsert_latest_state(cursor, recordings: list[tuple], chunk_size: int = CHUNK_SIZE,
+                        history_size: int = HISTORY_SIZE) -> int:
+    '''Updates gamma.plant_latest_state for every plant with new recordings,
+    one MERGE per chunk of plants. Returns the number of plants updated.'''
+    by_plant = {}
+    for recording in recordings:
+        by_plant.setdefault(recording[3], []).append(recording)
+
+    states = get_latest_states(cursor, list(by_plant), chunk_size)
+    rows = [merge_latest_state(plant_id, states.get(plant_id), readings, history_size)
+            for plant_id, readings in by_plant.items()]
+
+    for chunk in get_chunks(rows, chunk_size):
+        cursor.execute(f"""
+        MERGE gamma.plant_latest_state WITH (HOLDLOCK) AS t
+        USING (VALUES {get_values_placeholders(len(chunk), len(LATEST_STATE_COLUMNS))})
+            AS s ({', '.join(LATEST_STATE_COLUMNS)})
+        ON t.plant_id = s.plant_id
+        WHEN MATCHED THEN
+            UPDATE SET t.time_taken = CAST(s.time_taken AS DATETIME),
+                t.soil_moisture = s.soil_moisture, t.temperature = s.temperature,
+                t.last_watering = CAST(s.last_watering AS DATETIME),
+                t.botanist_id = s.botanist_id, t.history = s.history
+        WHEN NOT MATCHED THEN
+            INSERT ({', '.join(LATEST_STATE_COLUMNS)})
+            VALUES (s.plant_id, CAST(s.time_taken AS DATETIME), s.soil_moisture,
+                s.temperature, CAST(s.last_watering AS DATETIME), s.botanist_id, s.history);
+        """, tuple(value for row in chunk for value in row))
+
+    return len(rows)
+
+
+def bulk_insert_locations(cursor, locations: list[tuple], chunk_size: int = CHUNK_SIZE) -> dict:
+    '''Inserts (provisional_id, longitude, latitude, town_id) rows and returns
+    a mapping of provisional ID to the location_id the database assigned'''
+    location_ids = {}
+
+    for chunk in get_chunks(locations, chunk_size):
+        cursor.execute(
+            "INSERT INTO gamma.origins (longitude, latitude, town_id) "
+            "OUTPUT inserted.location_id, inserted.longitude, inserted.latitude VALUES "
+            f"{get_values_placeholders(len(chunk), 3)}",
+            tuple(value for row in chunk for value in row[1:]))
+
+        inserted = {(float(lon), float(lat)): location_id
+                    for location_id, lon, lat in cursor.fetchall()}
+
+        for provisional_id, lon, lat, _ in chunk:
+            location_ids[provisional_id] = inserted[(float(lon), float(lat))]
+
+    return location_ids
+
 
 def insert_new_recordings(cursor, recordings: list[tuple]):
     '''Given a list of tuples of the form
-      (time_taken, soil_moisture, temperature, plant_id, botanist_id)
-      insert the new recordings into the database.'''
+      (time_taken, soil_moisture, temperature, plant_id, botanist_id, last_watering)
+      insert the recordings not already stored for that plant and time.'''
 
     cursor.executemany("""
      INSERT INTO gamma.recordings
         (time_taken, soil_moisture,temperature,plant_id,botanist_id,last_watering)
-     VALUES
-        (%s,%s,%s,%s,%s,%s)
-     """, recordings)
+     SELECT %s,%s,%s,%s,%s,%s
+     WHERE NOT EXISTS (
+        SELECT 1 FROM gamma.recordings WITH (UPDLOCK, HOLDLOCK)
+        WHERE plant_id = %s AND time_taken = %s)
+     """, [(*r, r[3], r[0]) for r in deduplicate_recordings(recordings)])
 
 
-def insert_into_locations_table(cursor, locations: list[tuple]) -> int:
-    '''Bulk inserts into the locations table'''
+def insert_into_locations_table(cursor, locations: list[tuple]) -> dict:
+    '''Inserts (provisional_id, longitude, latitude, town_id) rows one at a time.
+    Returns a mapping of provisional ID to inserted location_id.'''
 
     query_insert = """
     INSERT INTO gamma.origins (longitude, latitude, town_id)
@@ -48,11 +419,17 @@ def insert_into_locations_table(cursor, locations: list[tuple]) -> int:
     VALUES (%s, %s, %s);
     """
 
-    cursor.executemany(query_insert, locations)
+    location_ids = {}
+    for provisional_id, lon, lat, town_id in locations:
+        cursor.execute(query_insert, (lon, lat, town_id))
+        location_ids[provisional_id] = cursor.fetchone()[0]
+
+    return location_ids
 
 
 def insert_new_plants(cursor, plant_data_to_insert: list[tuple]):
-    '''Using a list of tuples containing (plant_id, location_id, plant_species_id,last_watering), inserts many new plants.'''
+    '''Using a list of tuples containing (plant_id, location_id, plant_species_id),
+    inserts many new plants.'''
 
     cursor.executemany(
         """
@@ -0,0 +1,159 @@
+'''A local stand-in for the plants API, for offline testing and benchmarking.
+
+Usage: python mock_api.py --plants 1000 --port 8080'''
+import argparse
+import asyncio
+import json
+import random
+import threading
+from datetime import datetime as dt, timedelta
+
+from aiohttp import web
+
+DEFAULT_GAPS = [1, 7, 10, 13, 15, 18, 23, 24, 27, 37, 40, 43]
+
+BOTANISTS = [
+    {"email": "gertrude.jekyll@lnhm.co.uk", "name": "Gertrude Jekyll", "phone": "001-481-273-3691x127"},
+    {"email": "carl.linnaeus@lnhm.co.uk", "name": "Carl Linnaeus", "phone": "(146)994-1635x35992"},
+    {"email": "eliza.andrews@lnhm.co.uk", "name": "Eliza Andrews", "phone": "(846)669-6651x75948"}
+]
+
+SPECIES = [("Venus flytrap", ["Dionaea muscipula"]), ("Corpse flower", ["Amorphophallus titanum"]),
+           ("Rafflesia arnoldii", ["Rafflesia arnoldii"]), ("Black bat flower", ["Tacca chantrieri"]),
+           ("Pitcher plant", ["Sarracenia catesbaei"])]
+
+ORIGINS = [["-19.32556", "-41.25528", "Resplendor", "BR", "America/Sao_Paulo"],
+           ["33.95015", "-118.03917", "South Whittier", "US", "America/Los_Angeles"],
+           ["7.65649", "4.92235", "Efon-Alaaye", "NG", "Africa/Lagos"]]
+
+
+def get_live_ids(num_plants: int, gaps: list[int]) -> list[int]:
+    '''Return the first num_plants IDs, starting at 1, that are not gaps'''
+    gaps = set(gaps)
+    live_ids = []
+    plant_id = 1
+    while len(live_ids) < num_plants:
+        if plant_id not in gaps:
+            live_ids.append(plant_id)
+        plant_id += 1
+    return live_ids
+
+
+def make_plant(plant_id: int, rng: random.Random) -> dict:
+    '''Return a plant payload shaped like the real API response'''
+    common_name, scientific_name = SPECIES[plant_id % len(SPECIES)]
+    now = dt.now().replace(microsecond=0)
+    return {
+        "botanist": BOTANISTS[plant_id % len(BOTANISTS)],
+        "images": None,
+        "last_watered": (now - timedelta(hours=rng.randint(1, 48))).strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "name": common_name,
+        "origin_location": ORIGINS[plant_id % len(ORIGINS)],
+        "plant_id": plant_id,
+        "recording_taken": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "scientific_name": scientific_name,
+        "soil_moisture": round(rng.uniform(10, 90), 6),
+        "temperature": round(rng.uniform(10, 35), 6)
+    }
+
+
+def make_app(num_plants: int = 50, gaps: list[int] | None = None, latency: float = 0.05,
+             latency_sigma: float = 0.5, error_rate: float = 0.0, throttle_rate: float = 0.0,
+             malformed_rate: float = 0.0, seed: int | None = None) -> web.Application:
+    '''Return an aiohttp application serving / and /plants/{id}.
+
+    Response latency is log-normally distributed around the `latency` median
+    in seconds. error_rate, throttle_rate and malformed_rate are the chances
+    of a 500, a 429 or a corrupt body for each plant request.'''
+    rng = random.Random(seed)
+    live_ids = set(get_live_ids(num_plants, DEFAULT_GAPS if gaps is None else gaps))
+
+    async def get_index(request: web.Request) -> web.Response:
+        return web.json_response({"plants_on_display": num_plants, "success": True})
+
+    async def get_plant(request: web.Request) -> web.Response:
+        if latency > 0:
+            await asyncio.sleep(rng.lognormvariate(0, latency_sigma) * latency)
+
+        plant_id = int(request.match_info["plant_id"])
+        if plant_id not in live_ids:
+            return web.json_response({"error": "plant not found", "plant_id": plant_id}, status=404)
+
+        roll = rng.random()
+        if roll < throttle_rate:
+            return web.json_response({"error": "too many requests"}, status=429)
+        if roll < throttle_rate + error_rate:
+            return web.json_response({"error": "sensor fault"}, status=500)
+
+        plant = make_plant(plant_id, rng)
+        if roll < throttle_rate + error_rate + malformed_rate:
+            if rng.random() < 0.5:
+                return web.Response(text=json.dumps(plant)[:-20], content_type="application/json")
+            del plant["botanist"]
+
+        return web.json_response(plant)
+
+    app = web.Application()
+    app.router.add_get("/", get_index)
+    app.router.add_get("/plants/{plant_id:-?\\d+}", get_plant)
+    return app
+
+
+def start_in_thread(app: web.Application, host: str = "127.0.0.1", port: int = 8080):
+    '''Serves app from a background thread. Returns a function that stops it.'''
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    started = threading.Event()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, host, port).start())
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    started.wait()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return stop
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    '''Adds the mock API configuration options to a parser'''
+    parser.add_argument("--plants", "-n", type=int, default=50,
+                        help="Number of plants on display")
+    parser.add_argument("--gaps", type=int, nargs="*", default=DEFAULT_GAPS,
+                        help="Plant IDs that return 404")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Median response latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="Spread of the log-normal latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Chance of a 500 response")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="Chance of a 429 response")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Chance of a truncated or incomplete payload")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Random seed for reproducible runs")
+    parser.add_argument("--port", "-p", type=int, default=8080)
+
+
+def make_app_from_arguments(args: argparse.Namespace) -> web.Application:
+    '''Return a mock API application configured from parsed arguments'''
+    return make_app(args.plants, args.gaps, args.latency, args.latency_sigma,
+                    args.error_rate, args.throttle_rate, args.malformed_rate, args.seed)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    add_server_arguments(arg_parser)
+    arguments = arg_parser.parse_args()
+
+    web.run_app(make_app_from_arguments(arguments), host="127.0.0.1", port=arguments.port)
@@ -1,23 +1,278 @@
 '''Short term pipeline'''
+import argparse
+import asyncio
+import logging
+from os import environ as ENV
+from time import perf_counter
+
 import pymssql
-from transform_short import get_connection, transform_plant_data
-from extract_short import extract
-from load_short import load
+from transform_short import (get_connection, transform_plant_data, get_reference_data,
+                             validate_plant, transform_plant, resolve_new_locations,
+                             get_unknown_dimensions, resolve_dimensions)
+from extract_short import extract, stream_extract, get_session, ConcurrencyController
+from load_short import bulk_load, MicroBatch
+from logger import logger_setup
+from spool import Spool, read_segment
+
+LOGGER = logging.getLogger(__name__)
+
+STREAMING = ENV.get("PIPELINE_STREAMING", "false").lower() == "true"
+
+REFERENCE_REFRESH = float(ENV.get("REFERENCE_REFRESH", 600))
+
+SPOOL_ERRORS = (pymssql.Error, OSError)
+
+
+async def run_streaming(conn, session=None, reference: dict | None = None,
+                        controller: ConcurrencyController | None = None,
+                        spool: Spool | None = None) -> int:
+    '''Streams plants from the API through transform and into the database
+    in micro-batches. Reference data is loaded while requests are in flight
+    unless warm reference maps are passed in. If the database or connection
+    fails and a spool is given, the unloaded plants and the rest of the
+    stream are spooled before the error is raised. Other errors are raised
+    without spooling, as replaying the same plants would fail again.
+    Returns the number of readings loaded.'''
+    reference_task = None
+    if reference is None:
+        cursor = conn.cursor()
+        reference_task = asyncio.create_task(
+            asyncio.to_thread(get_reference_data, cursor))
+
+    batch = MicroBatch()
+    stream = stream_extract(session, controller)
+    pending = []
+
+    try:
+        async for plant in stream:
+            pending.append(plant)
+
+            if reference is None:
+                reference = await reference_task
+
+            if not validate_plant(plant, reference["plant_ids"]):
+                continue
+
+            if any(get_unknown_dimensions([plant], reference).values()):
+                await asyncio.to_thread(resolve_dimensions, conn, [plant], reference)
+
+            batch.add(*transform_plant(plant, reference))
+
+            if batch.is_ready():
+                await asyncio.to_thread(batch.flush, conn)
+                pending = []
+
+        if reference_task:
+            reference = await reference_task
+        await asyncio.to_thread(batch.flush, conn)
+        pending = []
+        resolve_new_locations(reference, batch.location_ids)
+    except SPOOL_ERRORS:
+        if spool is None:
+            raise
+        pending.extend([plant async for plant in stream])
+        await asyncio.to_thread(spool.append, pending)
+        raise
+    finally:
+        if reference_task and not reference_task.done():
+            reference_task.cancel()
+
+    return batch.flushed
+
+
+async def spool_stream(spool: Spool, session=None,
+                       controller: ConcurrencyController | None = None) -> int:
+    '''Extracts plants straight into the spool while the database is
+    unavailable. Returns the number of plants spooled.'''
+    plants = [plant async for plant in stream_extract(session, controller)]
+    return await asyncio.to_thread(spool.append, plants)
+
+
+def load_extracted(conn, extracted_data: list[dict], spool: Spool | None = None) -> int:
+    '''Transforms and bulk loads extracted plant data, spooling it if the
+    database or connection fails. Errors in the data itself are raised
+    without spooling. Returns the number of readings loaded.'''
+    try:
+        plants, locations, readings = transform_plant_data(conn, extracted_data)
+        bulk_load(conn, plants, locations, readings)
+    except SPOOL_ERRORS:
+        if spool is not None:
+            spool.append(extracted_data)
+        raise
+
+    return len(readings)
+
+
+def replay_spool(conn, spool: Spool) -> int:
+    '''Loads the spool one segment at a time, oldest first, deleting each
+    segment once it is loaded. A database failure stops the replay and leaves
+    the remaining segments in place. A segment that fails for any other
+    reason would fail on every run, so it is quarantined and the replay
+    moves on. Returns the number of readings loaded.'''
+    segments = spool.get_segments()
+    if not segments:
+        return 0
+
+    timer = perf_counter()
+    loaded = 0
+    for path in segments:
+        records = read_segment(path)
+        try:
+            loaded += load_extracted(conn, records) if records else 0
+        except SPOOL_ERRORS:
+            raise
+        except Exception as err:
+            LOGGER.error("Could not load spool segment %s: %s", path, err)
+            conn.rollback()
+            spool.quarantine(path)
+            continue
+        spool.remove([path])
+
+    LOGGER.info("Replayed %s spooled readings from %s segments in %ss", loaded,
+                len(segments), round(perf_counter() - timer, 3))
+    return loaded
+
+
+def try_replay_spool(conn, spool: Spool) -> int:
+    '''Replays the spool, logging rather than raising if it fails so the
+    current run still goes ahead'''
+    try:
+        return replay_spool(conn, spool)
+    except Exception as err:
+        LOGGER.error("Could not replay spool: %s", err)
+        return 0
+
+
+def get_next_tick(scheduled: float, interval: float, now: float) -> tuple[float, int]:
+    '''Return the next tick time after a tick scheduled at `scheduled` and
+    the number of ticks skipped because the previous tick overran'''
+    next_tick = scheduled + interval
+    skipped = 0
+
+    if now > next_tick:
+        skipped = int((now - next_tick) // interval) + 1
+        next_tick += skipped * interval
+
+    return next_tick, skipped
+
+
+def close_connection(conn) -> None:
+    '''Closes a connection, ignoring errors from one that is already broken'''
+    try:
+        conn.close()
+    except Exception as err:
+        LOGGER.warning("Error closing connection: %s", err)
+
+
+async def run_daemon(interval: float, refresh: float = REFERENCE_REFRESH,
+                     max_ticks: int | None = None, spool: Spool | None = None) -> None:
+    '''Runs the streaming pipeline every interval seconds, keeping the database
+    connection, HTTP connection pool and reference maps warm between ticks.
+    A tick that overruns the interval causes the missed ticks to be skipped
+    rather than run back to back. Ticks that cannot reach the database spool
+    their plants, which are replayed by the next tick that can.'''
+    if interval <= 0:
+        raise ValueError("Interval must be positive")
+
+    spool = spool or Spool()
+
+    conn = None
+    reference = None
+    loaded_at = 0.0
+    controller = ConcurrencyController()
+    ticks = 0
+
+    async with get_session() as session:
+        scheduled = perf_counter()
+
+        while max_ticks is None or ticks < max_ticks:
+            timer = perf_counter()
+
+            try:
+                if conn is None:
+                    try:
+                        conn = await asyncio.to_thread(get_connection)
+                    except Exception:
+                        await spool_stream(spool, session, controller)
+                        raise
+
+                if spool.get_segments():
+                    if await asyncio.to_thread(try_replay_spool, conn, spool):
+                        reference = None
+
+                if reference is None or timer - loaded_at >= refresh:
+                    reference = await asyncio.to_thread(get_reference_data, conn.cursor())
+                    loaded_at = timer
+
+                loaded = await run_streaming(conn, session, reference, controller, spool)
+                LOGGER.info("Tick %s loaded %s readings in %ss", ticks, loaded,
+                            round(perf_counter() - timer, 3))
+
+            except Exception as err:
+                LOGGER.error("Tick %s failed after %ss: %s", ticks,
+                             round(perf_counter() - timer, 3), err)
+                if conn is not None:
+                    close_connection(conn)
+                conn, reference = None, None
+
+            ticks += 1
+            scheduled, skipped = get_next_tick(scheduled, interval, perf_counter())
+            if skipped:
+                LOGGER.warning("Tick %s overran the %ss interval, skipping %s ticks",
+                               ticks - 1, interval, skipped)
+
+            if max_ticks is None or ticks < max_ticks:
+                await asyncio.sleep(max(0.0, scheduled - perf_counter()))
+
+    if conn is not None:
+        close_connection(conn)
 
 
 def lambda_handler(event=None, context=None):
-    '''Lambda handler. Connects to the database, extracts 
-    information from the API, '''
+    '''Lambda handler. Connects to the database, replays any spooled
+    plant data, then extracts, transforms and loads the current readings.
+    Readings that cannot be written to the database are spooled.'''
+    streaming = (event or {}).get("streaming", STREAMING)
+    spool = Spool()
+
+    try:
+        conn = get_connection()
+    except Exception as err:
+        try:
+            spooled = spool.append(extract())
+        except Exception as spool_err:
+            return {"statusCode": 400,
+                    "body": f"Failure. Could not extract data, {spool_err}"}
+        return {"statusCode": 400,
+                "body": f"Failure. Database unavailable, spooled {spooled} plants, {err}"}
+
     try:
-        with get_connection() as conn:
-            extracted_data = extract()
-            plants, locations, readings = transform_plant_data(
-                conn, extracted_data)
-            load(conn, plants, locations, readings)
+        with conn:
+            try_replay_spool(conn, spool)
+            if streaming:
+                asyncio.run(run_streaming(conn, spool=spool))
+            else:
+                load_extracted(conn, extract(), spool)
     except Exception as err:
         return {"statusCode": 400, 'body': f"Failure. Could not extract data, {err}"}
     return {'statusCode': 200, "body": "Success."}
 
 
+def parse_arguments() -> argparse.Namespace:
+    '''Parses command line arguments'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run continuously instead of once")
+    parser.add_argument("--interval", "-i", type=float, default=60,
+                        help="Seconds between runs in daemon mode")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    lambda_handler(None, None)
+    args = parse_arguments()
+
+    if args.daemon:
+        logger_setup("log_pipeline.log", "logs")
+        asyncio.run(run_daemon(args.interval))
+    else:
+        lambda_handler(None, None)
@@ -0,0 +1,101 @@
+'''Registry of plant IDs known to be live on the plants API'''
+import json
+import logging
+from datetime import datetime as dt
+from os import environ as ENV
+
+LOGGER = logging.getLogger(__name__)
+
+REGISTRY_PATH = ENV.get("PLANT_REGISTRY_PATH", "/tmp/plant_registry.json")
+
+DISCOVERY_MARGIN = int(ENV.get("DISCOVERY_MARGIN", 10))
+
+REGISTRY_MAX_MISSES = int(ENV.get("REGISTRY_MAX_MISSES", 3))
+
+
+def read_registry(path: str) -> dict:
+    '''Return the contents of the registry file, empty if there is no registry yet'''
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        LOGGER.info("No plant registry found at %s", path)
+    except (json.JSONDecodeError, OSError) as err:
+        LOGGER.warning("Could not read plant registry %s: %s", path, err)
+
+    return {}
+
+
+def load_registry(path: str | None = None) -> set[int]:
+    '''Return the set of known live plant IDs, empty if there is no registry yet'''
+    registry = read_registry(path or REGISTRY_PATH)
+    return {int(plant_id) for plant_id in registry.get("plant_ids", [])}
+
+
+def load_misses(path: str | None = None) -> dict[int, int]:
+    '''Return the number of discovery runs in a row each known plant ID has
+    been missing from'''
+    registry = read_registry(path or REGISTRY_PATH)
+    return {int(plant_id): int(count) for plant_id, count in registry.get("misses", {}).items()}
+
+
+def save_registry(plant_ids: set[int], path: str | None = None,
+                  misses: dict[int, int] | None = None) -> None:
+    '''Writes the set of live plant IDs and their miss counts to the registry file'''
+    path = path or REGISTRY_PATH
+    registry = {"plant_ids": sorted(plant_ids),
+                "misses": {str(plant_id): count for plant_id, count in sorted((misses or {}).items())},
+                "updated": dt.now().isoformat()}
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(registry, f)
+
+    LOGGER.info("Saved %s plant IDs to registry", len(plant_ids))
+
+
+def needs_discovery(registry: set[int], num_plants: int | None) -> bool:
+    '''Return True if the registry disagrees with the number of plants on
+    display. An unknown count never triggers discovery.'''
+    return num_plants is not None and len(registry) != num_plants
+
+
+def get_discovery_ids(registry: set[int], num_plants: int,
+                      margin: int = DISCOVERY_MARGIN) -> list[int]:
+    '''Return the unknown plant IDs worth probing.
+
+    Covers every ID below the larger of the plant count and the highest
+    known ID, plus a margin, skipping IDs already in the registry.'''
+    upper = max(num_plants, max(registry, default=-1) + 1) + margin
+    return [plant_id for plant_id in range(upper) if plant_id not in registry]
+
+
+def update_registry(registry: set[int], probed_ids: list[int], plant_data: list[dict],
+                    misses: dict[int, int] | None = None,
+                    max_misses: int = REGISTRY_MAX_MISSES) -> set[int]:
+    '''Return the registry updated with the results of a discovery run.
+
+    Probed IDs that returned a plant are added. A failed request does not
+    mean a plant has gone, so a known ID is only dropped once it has been
+    missing from max_misses discovery runs in a row. misses holds those
+    counts between runs and is updated in place.'''
+    misses = {} if misses is None else misses
+    found = {int(plant["plant_id"]) for plant in plant_data}
+
+    for plant_id in list(misses):
+        if plant_id in found or plant_id not in registry:
+            del misses[plant_id]
+
+    for plant_id in registry - found:
+        misses[plant_id] = misses.get(plant_id, 0) + 1
+
+    removed = {plant_id for plant_id, count in misses.items() if count >= max_misses}
+    for plant_id in removed:
+        del misses[plant_id]
+
+    added = (found & set(probed_ids)) - registry
+
+    if added or removed:
+        LOGGER.info("Registry discovery added %s and removed %s plant IDs",
+                    len(added), len(removed))
+
+    return (registry - removed) | (found & set(probed_ids))
@@ -0,0 +1,213 @@
+'''Typed records for plant readings, decoded from API bytes in one pass.
+
+This is an alternative to the dictionary path that the pipeline runs
+(extract_short, transform_short), kept for benchmark_records.py. It is not
+wired into the Lambda, whose spool and dimension upserts work on the
+dictionaries. Its validation matches validate_plant, so both paths produce
+the same rows for existing and new plants.'''
+import json
+import logging
+from datetime import datetime as dt
+
+from transform_short import add_new_location, validate_origin_data
+
+LOGGER = logging.getLogger(__name__)
+
+MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+          "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+
+READING_KEYS = ("botanist", "name", "plant_id", "soil_moisture",
+                "temperature", "last_watered", "recording_taken")
+
+
+class Botanist:
+    '''A botanist as reported by the API, with a normalised name'''
+    __slots__ = ("email", "first_name", "last_name", "phone")
+
+    def __init__(self, email: str, first_name: str, last_name: str, phone: str):
+        self.email = email
+        self.first_name = first_name
+        self.last_name = last_name
+        self.phone = phone
+
+    @property
+    def key(self) -> tuple:
+        '''Return the (email, first_name, last_name) lookup key'''
+        return (self.email, self.first_name, self.last_name)
+
+
+class Origin:
+    '''The origin location of a plant'''
+    __slots__ = ("longitude", "latitude", "town")
+
+    def __init__(self, longitude: str, latitude: str, town: str):
+        self.longitude = longitude
+        self.latitude = latitude
+        self.town = town
+
+
+class PlantReading:
+    '''A single validated reading for a plant'''
+    __slots__ = ("plant_id", "names", "soil_moisture", "temperature",
+                 "recording_taken", "last_watered", "botanist", "origin", "origin_valid")
+
+    def __init__(self, plant_id: int, names: tuple, soil_moisture: float,
+                 temperature: float, recording_taken: dt, last_watered: dt,
+                 botanist: Botanist, origin: Origin | None, origin_valid: bool = False):
+        self.plant_id = plant_id
+        self.names = names
+        self.soil_moisture = soil_moisture
+        self.temperature = temperature
+        self.recording_taken = recording_taken
+        self.last_watered = last_watered
+        self.botanist = botanist
+        self.origin = origin
+        self.origin_valid = origin_valid
+
+
+def parse_recording_taken(value: str) -> dt:
+    '''Parses a "%Y-%m-%d %H:%M:%S" timestamp'''
+    return dt.fromisoformat(value)
+
+
+def parse_last_watered(value: str) -> dt:
+    '''Parses a "%a, %d %b %Y %H:%M:%S %Z" timestamp, e.g.
+    "Tue, 01 Oct 2024 13:54:32 GMT", by position'''
+    try:
+        return dt(int(value[12:16]), MONTHS[value[8:11]], int(value[5:7]),
+                  int(value[17:19]), int(value[20:22]), int(value[23:25]))
+    except (KeyError, ValueError, IndexError):
+        return dt.strptime(value, "%a, %d %b %Y %H:%M:%S %Z")
+
+
+def decode_botanist(botanist: dict) -> Botanist | None:
+    '''Return a Botanist if the botanist data is complete and the email is valid'''
+    email = botanist.get("email")
+    name = botanist.get("name")
+    phone = botanist.get("phone")
+
+    if not (isinstance(email, str) and "@" in email) or name is None or phone is None:
+        return None
+
+    names = name.strip().split(" ")
+    if len(names) > 1:
+        return Botanist(email, names[0].strip().title(),
+                        " ".join(names[1:]).strip().title(), phone)
+
+    return Botanist(email, name, "", phone)
+
+
+def decode_origin(origin_location: list | None) -> Origin | None:
+    '''Return an Origin if the location has a longitude, latitude and town,
+    which transform_plant reads without further checks'''
+    if not isinstance(origin_location, list) or len(origin_location) < 3:
+        return None
+
+    return Origin(origin_location[0], origin_location[1], origin_location[2])
+
+
+def is_valid_origin_data(origin_data) -> bool:
+    '''Return True if a plant's origin_data passes the check validate_plant
+    applies to new plants'''
+    if not origin_data:
+        return False
+
+    try:
+        return validate_origin_data(origin_data)
+    except (TypeError, IndexError, KeyError):
+        return False
+
+
+def decode_plant(raw: bytes | str) -> PlantReading | None:
+    '''Decodes a plant API response straight into a validated PlantReading.
+    Returns None if the payload is malformed or missing required fields.'''
+    try:
+        plant = json.loads(raw)
+    except ValueError:
+        LOGGER.warning("Could not decode plant payload")
+        return None
+
+    if not isinstance(plant, dict) or not all(k in plant for k in READING_KEYS):
+        return None
+
+    botanist = plant["botanist"]
+    if not isinstance(botanist, dict):
+        return None
+
+    botanist = decode_botanist(botanist)
+    if botanist is None:
+        return None
+
+    try:
+        recording_taken = parse_recording_taken(plant["recording_taken"])
+        last_watered = parse_last_watered(plant["last_watered"])
+    except (TypeError, ValueError):
+        return None
+
+    names = (plant["name"].strip().title(),
+             *(name.strip().title() for name in plant.get("scientific_name", [])))
+
+    return PlantReading(plant["plant_id"], names, plant["soil_moisture"],
+                        plant["temperature"], recording_taken, last_watered,
+                        botanist, decode_origin(plant.get("origin_location")),
+                        is_valid_origin_data(plant.get("origin_data")))
+
+
+def get_record_species_id(record: PlantReading, all_names: dict) -> int:
+    '''Return the species ID for a record's common or scientific names'''
+    scientific, common = all_names["scientific_name"], all_names["common_name"]
+
+    for name in record.names:
+        if name in scientific:
+            return scientific[name]
+        if name in common:
+            return common[name]
+
+    raise ValueError("Species not available")
+
+
+def transform_record(record: PlantReading, reference: dict) -> tuple:
+    '''Transforms a PlantReading. Returns a (plant, location, reading) tuple
+    of rows to insert, any of which may be None.'''
+    botanist_id = reference["botanists"].get(record.botanist.key)
+    if botanist_id is None:
+        LOGGER.warning("Skipping plant %s with unknown botanist", record.plant_id)
+        return None, None, None
+
+    p_id = record.plant_id
+    reading = (record.recording_taken, record.soil_moisture, record.temperature,
+               p_id, botanist_id, record.last_watered)
+
+    if p_id in reference["plant_ids"]:
+        return None, None, reading
+
+    origin = record.origin
+    if not record.origin_valid:
+        LOGGER.warning("Skipping new plant %s without valid origin data", p_id)
+        return None, None, None
+    if origin is None:
+        LOGGER.warning("Skipping new plant %s with unknown origin", p_id)
+        return None, None, None
+
+    try:
+        species_id = get_record_species_id(record, reference["species"])
+    except ValueError:
+        LOGGER.warning("Skipping new plant %s with unknown species", p_id)
+        return None, None, None
+
+    location = None
+    location_id = reference["coordinates"].get((origin.longitude, origin.latitude))
+
+    if location_id is None:
+        town_id = reference["towns"].get(origin.town)
+
+        if not town_id:
+            LOGGER.warning("Skipping new plant %s with unknown town %s", p_id, origin.town)
+            return None, None, None
+
+        location = add_new_location(reference, origin.longitude, origin.latitude, town_id)
+        location_id = location[0]
+
+    reference["plant_ids"].add(p_id)
+
+    return (p_id, location_id, species_id), location, reading
@@ -0,0 +1,230 @@
+'''Local write-ahead spool for plant data that could not be written to the database.
+
+Records are appended to numbered segment files as a 4-byte length, a 4-byte
+CRC32 and a JSON payload. Each append writes the whole batch and fsyncs once,
+so a crash can at worst leave a torn record at the end of the newest segment,
+which is skipped when the spool is read back. Segments that can never be
+loaded are moved to a quarantine directory so they do not block the rest.'''
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from os import environ as ENV
+
+LOGGER = logging.getLogger(__name__)
+
+SPOOL_DIR = ENV.get("SPOOL_DIR", "/tmp/plant_spool")
+
+SEGMENT_SIZE = int(ENV.get("SPOOL_SEGMENT_SIZE", 4 * 1024 * 1024))
+
+MAX_SPOOL_SIZE = int(ENV.get("SPOOL_MAX_SIZE", 64 * 1024 * 1024))
+
+HEADER = struct.Struct(">II")
+
+SEGMENT_SUFFIX = ".seg"
+
+QUARANTINE_DIR = "quarantine"
+
+
+def encode_record(record: dict) -> bytes:
+    '''Return a record as a length and checksum prefixed JSON payload'''
+    payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def split_payloads(data: bytes) -> tuple[list[bytes], int]:
+    '''Return the intact payloads in segment data and the number of bytes
+    they cover, stopping at the first torn or corrupt record'''
+    payloads = []
+    offset = 0
+
+    while offset + HEADER.size <= len(data):
+        length, checksum = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        payload = data[start:start + length]
+
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break
+
+        payloads.append(payload)
+        offset = start + length
+
+    return payloads, offset
+
+
+def read_segment(path: str) -> list[dict]:
+    '''Return the records in a segment, skipping a torn or corrupt tail'''
+    with open(path, "rb") as f:
+        data = f.read()
+
+    payloads, end = split_payloads(data)
+    if end < len(data):
+        LOGGER.warning("Skipping %s torn bytes at the end of %s", len(data) - end, path)
+
+    return [json.loads(payload) for payload in payloads]
+
+
+def repair_segment(path: str) -> int:
+    '''Truncates a torn or corrupt tail so later appends stay readable.
+    Returns the size of the segment.'''
+    with open(path, "r+b") as f:
+        data = f.read()
+        _, end = split_payloads(data)
+        if end < len(data):
+            LOGGER.warning("Truncating %s torn bytes from %s", len(data) - end, path)
+            f.truncate(end)
+
+    return end
+
+
+def fsync_directory(directory: str) -> None:
+    '''Flushes a directory entry so newly created segments survive a crash'''
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Spool:
+    '''An append-only log of plant data split into numbered segments.
+    The oldest segments are dropped once the spool grows past max_size.
+    The end of the newest segment is checked for a torn record the first
+    time this instance appends to it.'''
+
+    def __init__(self, directory: str | None = None, segment_size: int = SEGMENT_SIZE,
+                 max_size: int = MAX_SPOOL_SIZE):
+        self.directory = directory or SPOOL_DIR
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.tail = None
+
+    def get_segments(self) -> list[str]:
+        '''Return the segment paths, oldest first'''
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+
+        return [os.path.join(self.directory, name)
+                for name in sorted(n for n in names if n.endswith(SEGMENT_SUFFIX))]
+
+    def size(self) -> int:
+        '''Return the total size of the spool in bytes'''
+        return sum(os.path.getsize(path) for path in self.get_segments())
+
+    def get_segment_path(self, number: int) -> str:
+        '''Return the path of a segment from its sequence number'''
+        return os.path.join(self.directory, f"{number:010d}{SEGMENT_SUFFIX}")
+
+    def append(self, records: list[dict]) -> int:
+        '''Appends records to the newest segment, starting new segments once
+        it is full, and fsyncs once per segment written.
+        Returns the number of records written.'''
+        if not records:
+            return 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self.get_segments()
+
+        if segments:
+            number = int(os.path.basename(segments[-1])[:-len(SEGMENT_SUFFIX)])
+            path = segments[-1]
+            if self.tail and self.tail[0] == path:
+                written = self.tail[1]
+            else:
+                written = repair_segment(path)
+        else:
+            number, path, written = 1, self.get_segment_path(1), 0
+
+        f = open(path, "ab")
+        if not segments:
+            fsync_directory(self.directory)
+        try:
+            for record in records:
+                encoded = encode_record(record)
+
+                if written and written + len(encoded) > self.segment_size:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+                    number += 1
+                    path = self.get_segment_path(number)
+                    f = open(path, "ab")
+                    fsync_directory(self.directory)
+                    written = 0
+
+                f.write(encoded)
+                written += len(encoded)
+
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+
+        self.tail = (path, written)
+
+        LOGGER.warning("Spooled %s records to %s", len(records), self.directory)
+        self.enforce_limit()
+
+        return len(records)
+
+    def enforce_limit(self) -> int:
+        '''Deletes the oldest segments until the spool fits within max_size,
+        always keeping the newest. Returns the number of segments dropped.'''
+        segments = self.get_segments()
+        sizes = [os.path.getsize(path) for path in segments]
+        total = sum(sizes)
+        dropped = 0
+
+        while total > self.max_size and dropped < len(segments) - 1:
+            os.remove(segments[dropped])
+            total -= sizes[dropped]
+            dropped += 1
+
+        if dropped:
+            LOGGER.error("Spool over %s bytes, dropped %s oldest segments",
+                         self.max_size, dropped)
+
+        return dropped
+
+    def read(self) -> tuple[list[str], list[dict]]:
+        '''Return the current segments and their records, oldest first'''
+        segments = self.get_segments()
+        records = []
+
+        for path in segments:
+            records.extend(read_segment(path))
+
+        return segments, records
+
+    def quarantine(self, path: str) -> str:
+        '''Moves a segment that cannot be loaded out of the spool into its
+        quarantine directory, where it is kept for inspection but never
+        replayed. Returns the new path.'''
+        directory = os.path.join(self.directory, QUARANTINE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, f"{time.time_ns()}-{os.path.basename(path)}")
+        os.replace(path, target)
+        fsync_directory(self.directory)
+
+        if self.tail and self.tail[0] == path:
+            self.tail = None
+
+        LOGGER.error("Quarantined spool segment %s as %s", path, target)
+        return target
+
+    def remove(self, segments: list[str]) -> None:
+        '''Deletes segments once their records have been loaded'''
+        for path in segments:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -1,8 +1,10 @@
 # pylint: skip-file
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from database_functions import (get_all_plant_ids, map_plant_id_to_most_recent_botanist,
                                 map_botanist_details_to_id, map_town_name_to_id,
-                                map_species_names_to_species_id)
+                                map_species_names_to_species_id, get_table_fingerprints,
+                                ReferenceCache, upsert_botanists, upsert_species,
+                                upsert_regions)
 
 
 def test_get_all_plant_ids():
@@ -76,3 +78,103 @@ def test_map_species_names_to_species_id():
             "Common Two": 2
         }
     }
+
+
+def test_get_table_fingerprints():
+    """Tests that every table is fingerprinted in one query."""
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [("gamma.plants", 3, 123), ("gamma.regions", 2, -5)]
+
+    result = get_table_fingerprints(cursor, ["gamma.plants", "gamma.regions"])
+
+    query = cursor.execute.call_args[0][0]
+    assert query.count("UNION ALL") == 1
+    assert "CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM gamma.regions" in query
+    assert result == {"gamma.plants": (3, 123), "gamma.regions": (2, -5)}
+
+
+def make_cache():
+    """Returns a reference cache over two tables and the mocks that load them."""
+    plants_loader = MagicMock(return_value=[1, 2])
+    towns_loader = MagicMock(return_value={"TownA": 1})
+    cache = ReferenceCache({"plant_ids": ("gamma.plants", plants_loader),
+                            "towns": ("gamma.regions", towns_loader)})
+    return cache, plants_loader, towns_loader
+
+
+@patch("database_functions.get_table_fingerprints")
+def test_reference_cache_reuses_unchanged_tables(mock_fingerprints):
+    """Tests that tables whose fingerprint is unchanged are not reloaded."""
+    cache, plants_loader, towns_loader = make_cache()
+    mock_fingerprints.return_value = {"gamma.plants": (2, 1), "gamma.regions": (1, 1)}
+
+    cache.get(MagicMock())
+    result = cache.get(MagicMock())
+
+    assert result == {"plant_ids": [1, 2], "towns": {"TownA": 1}}
+    assert plants_loader.call_count == 1
+    assert towns_loader.call_count == 1
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+@patch("database_functions.get_table_fingerprints")
+def test_reference_cache_reloads_changed_tables(mock_fingerprints):
+    """Tests that only the tables whose fingerprint changed are reloaded."""
+    cache, plants_loader, towns_loader = make_cache()
+    mock_fingerprints.side_effect = [
+        {"gamma.plants": (2, 1), "gamma.regions": (1, 1)},
+        {"gamma.plants": (3, 7), "gamma.regions": (1, 1)}
+    ]
+
+    cache.get(MagicMock())
+    cache.get(MagicMock())
+
+    assert plants_loader.call_count == 2
+    assert towns_loader.call_count == 1
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+@patch("database_functions.get_table_fingerprints")
+def test_reference_cache_returns_copies(mock_fingerprints):
+    """Tests that changes to a returned map do not leak into the cache."""
+    cache, plants_loader, towns_loader = make_cache()
+    mock_fingerprints.return_value = {"gamma.plants": (2, 1), "gamma.regions": (1, 1)}
+
+    cache.get(MagicMock())["towns"]["TownB"] = 2
+
+    assert cache.get(MagicMock())["towns"] == {"TownA": 1}
+
+
+def test_upsert_botanists_single_statement():
+    """Tests that botanists are deduplicated by email and upserted in one statement."""
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(7, "a@b.com"), (8, "c@d.com")]
+
+    botanists = upsert_botanists(cursor, [("a@b.com", "Ann", "Lee", "1"),
+                                          ("c@d.com", "Bo", "Kim", "2"),
+                                          ("a@b.com", "Anne", "Lee", "1")])
+
+    cursor.execute.assert_called_once()
+    query, params = cursor.execute.call_args[0]
+    assert "MERGE gamma.botanists" in query
+    assert "first_name = s.first_name" not in query
+    assert params == ("a@b.com", "Ann", "Lee", "1", "c@d.com", "Bo", "Kim", "2")
+    assert botanists == {"a@b.com": 7, "c@d.com": 8}
+
+
+def test_upsert_species_returns_rows():
+    """Tests that upserted species are returned with their IDs."""
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(3, "Tulipa", "Tulip")]
+
+    assert upsert_species(cursor, [("Tulip", "Tulipa")]) == [(3, "Tulipa", "Tulip")]
+    assert cursor.execute.call_args[0][1] == ("Tulip", "Tulipa")
+
+
+def test_upsert_regions_maps_towns():
+    """Tests that upserted regions are returned as a map of town to ID."""
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(5, "Lyon")]
+
+    assert upsert_regions(cursor, [("Lyon", 10, 4)]) == {"Lyon": 5}
+    assert "MERGE gamma.regions" in cursor.execute.call_args[0][0]
@@ -1,10 +1,13 @@
 # pylint: skip-file
 """A file to test the functions in extract.py"""
 
+import asyncio
 from unittest.mock import patch
 import pytest
+import requests
 
-from extract_short import get_url, validate_response, get_num_plants
+from extract_short import (get_url, validate_response, get_num_plants, get_plant_data,
+                           get_retry_delay, get_plant_ids, ConcurrencyController)
 
 
 MOCK_BASE_URL = "https://api.example.com"
@@ -51,3 +54,183 @@ def test_get_num_plants_success(mock_get):
     num_plants = get_num_plants()
 
     assert num_plants == 49
+
+
+@patch("extract_short.requests.get")
+@patch("extract_short.BASE_URL", MOCK_BASE_URL)
+def test_get_num_plants_failure_is_unknown(mock_get):
+    """Tests that a failed plant count is None rather than 0."""
+
+    mock_get.return_value.json.return_value = {"success": False}
+
+    assert get_num_plants() is None
+
+
+@patch("extract_short.requests.get", side_effect=requests.ConnectionError("down"))
+@patch("extract_short.BASE_URL", MOCK_BASE_URL)
+def test_get_num_plants_connection_error_is_unknown(mock_get):
+    """Tests that a plant count request that cannot connect is None."""
+
+    assert get_num_plants() is None
+
+
+def test_get_plant_ids_unknown_count_skips_discovery():
+    """Tests that an unknown plant count requests only the known plants."""
+    assert get_plant_ids({4, 2}, None) == ([2, 4], [])
+
+
+class FakeResponse:
+    """Minimal stand-in for an aiohttp response."""
+
+    def __init__(self, status, payload=None):
+        self.status = status
+        self.payload = payload
+
+    async def json(self):
+        return self.payload
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FakeSession:
+    """Returns queued responses (or raises queued errors) in order."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def test_controller_additive_increase():
+    """Tests that fast successful requests grow the limit by about one per window."""
+    controller = ConcurrencyController(initial=4, minimum=1, maximum=10,
+                                       target_latency=1.0)
+    for _ in range(4):
+        controller.record(0.1, False)
+
+    assert 4.9 < controller.limit < 5.1
+
+
+def test_controller_multiplicative_decrease_on_failure():
+    """Tests that a failed request halves the limit."""
+    controller = ConcurrencyController(initial=8, minimum=2, maximum=10)
+    controller.record(0.1, True)
+
+    assert controller.limit == 4
+    assert controller.error_rate == 1.0
+
+
+def test_controller_decrease_on_slow_response():
+    """Tests that a response slower than the target latency halves the limit."""
+    controller = ConcurrencyController(initial=8, minimum=2, maximum=10,
+                                       target_latency=1.0)
+    controller.record(5.0, False)
+
+    assert controller.limit == 4
+
+
+def test_controller_respects_bounds():
+    """Tests that the limit stays between its minimum and maximum."""
+    controller = ConcurrencyController(initial=2, minimum=2, maximum=3)
+    controller.record(0.1, True)
+    assert controller.limit == 2
+
+    for _ in range(50):
+        controller.record(0.1, False)
+    assert controller.limit == 3
+
+
+@patch("extract_short.get_retry_delay", return_value=0)
+def test_get_plant_data_retries_server_errors(mock_delay):
+    """Tests that 5xx responses are retried until the plant is returned."""
+    session = FakeSession([FakeResponse(503), FakeResponse(500),
+                           FakeResponse(200, {"plant_id": 1, "botanist": {"name": "A"}})])
+
+    data = asyncio.run(get_plant_data(session, 1, ConcurrencyController()))
+
+    assert data["plant_id"] == 1
+    assert session.calls == 3
+
+
+@patch("extract_short.get_retry_delay", return_value=0)
+def test_get_plant_data_retries_timeouts(mock_delay):
+    """Tests that a timed out request is retried."""
+    session = FakeSession([asyncio.TimeoutError(),
+                           FakeResponse(200, {"plant_id": 1, "botanist": {"name": "A"}})])
+
+    data = asyncio.run(get_plant_data(session, 1, ConcurrencyController()))
+
+    assert data["plant_id"] == 1
+    assert session.calls == 2
+
+
+@patch("extract_short.get_retry_delay", return_value=0)
+def test_get_plant_data_does_not_retry_not_found(mock_delay):
+    """Tests that a 404 response is not retried."""
+    session = FakeSession([FakeResponse(404)])
+
+    assert asyncio.run(get_plant_data(session, 1)) is None
+    assert session.calls == 1
+
+
+@patch("extract_short.MAX_RETRIES", 2)
+@patch("extract_short.get_retry_delay", return_value=0)
+def test_get_plant_data_gives_up_after_max_retries(mock_delay):
+    """Tests that a plant is given up on after MAX_RETRIES retries."""
+    session = FakeSession([FakeResponse(500)] * 3)
+
+    assert asyncio.run(get_plant_data(session, 1)) is None
+    assert session.calls == 3
+
+
+def test_get_retry_delay_is_bounded():
+    """Tests that each retry delay stays within its exponential bound."""
+    for attempt in range(4):
+        assert 0 <= get_retry_delay(attempt) <= 0.25 * 2 ** attempt
+
+
+def test_get_plant_ids_registry_matches():
+    """Tests that only the known plants are requested when the registry matches the count."""
+    assert get_plant_ids({4, 2, 9}, 3) == ([2, 4, 9], [])
+
+
+@patch("extract_short.get_discovery_ids", return_value=[0, 1])
+def test_get_plant_ids_registry_disagrees(mock_discovery):
+    """Tests that unknown IDs are probed when the registry disagrees with the count."""
+    assert get_plant_ids({2}, 3) == ([2], [0, 1])
+
+
+def test_controller_decreases_once_per_window():
+    """Tests that a burst of failures only halves the limit once per window."""
+    controller = ConcurrencyController(initial=8, minimum=1, maximum=10)
+    controller.record(0.1, True)
+    controller.record(0.1, True)
+    controller.record(0.1, True)
+
+    assert controller.limit == 4
+    assert controller.failures == 3
+
+
+class MalformedResponse(FakeResponse):
+    async def json(self):
+        raise ValueError("Expecting value")
+
+
+def test_get_plant_data_malformed_payload_releases_slot():
+    """Tests that a malformed payload is not retried and frees its concurrency slot."""
+    controller = ConcurrencyController(initial=4, minimum=1)
+    session = FakeSession([MalformedResponse(200)])
+
+    assert asyncio.run(get_plant_data(session, 1, controller)) is None
+    assert controller.in_flight == 0
+    assert session.calls == 1
@@ -0,0 +1,284 @@
+# pylint: skip-file
+import json
+from datetime import datetime as dt
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from load_short import (MicroBatch, load, bulk_load, resolve_location_ids,
+                        get_values_placeholders, bulk_insert, deduplicate_recordings,
+                        bulk_insert_recordings, insert_new_recordings, merge_latest_state,
+                        upsert_latest_state, get_rollups, get_hour, get_day, upsert_rollups)
+
+
+def test_micro_batch_add_skips_missing_rows():
+    """Tests that a micro-batch keeps readings and skips missing plant and location rows."""
+    batch = MicroBatch(max_size=10, max_age=60)
+    batch.add(None, None, ("reading",))
+    batch.add(("plant",), ("location",), ("reading",))
+
+    assert batch.readings == [("reading",), ("reading",)]
+    assert batch.plants == [("plant",)]
+    assert batch.locations == [("location",)]
+    assert len(batch) == 4
+
+
+def test_micro_batch_ready_on_size():
+    """Tests that a micro-batch is ready once it holds max_size readings."""
+    batch = MicroBatch(max_size=2, max_age=60)
+    assert batch.is_ready() is False
+
+    batch.add(None, None, ("reading",))
+    assert batch.is_ready() is False
+
+    batch.add(None, None, ("reading",))
+    assert batch.is_ready() is True
+
+
+def test_micro_batch_ready_on_age():
+    """Tests that a non-empty micro-batch is ready once it reaches max_age."""
+    batch = MicroBatch(max_size=100, max_age=0)
+    assert batch.is_ready() is False
+
+    batch.add(None, None, ("reading",))
+    assert batch.is_ready() is True
+
+
+@patch("load_short.bulk_load", return_value={-1: 12})
+def test_micro_batch_flush(mock_load):
+    """Tests that flushing bulk loads the batch once and empties it."""
+    conn = MagicMock()
+    batch = MicroBatch()
+    batch.add(("plant",), None, ("reading",))
+
+    batch.flush(conn)
+
+    mock_load.assert_called_once_with(conn, [("plant",)], [], [("reading",)], {})
+    assert len(batch) == 0
+    assert batch.flushed == 1
+    assert batch.location_ids == {-1: 12}
+
+
+@patch("load_short.bulk_load")
+def test_micro_batch_flush_empty(mock_load):
+    """Tests that flushing an empty batch loads nothing."""
+    MicroBatch().flush(MagicMock())
+
+    mock_load.assert_not_called()
+
+
+def test_resolve_location_ids():
+    """Tests that provisional location IDs are replaced by inserted ones."""
+    plants = [(1, 5, 2), (2, -1, 3)]
+
+    assert resolve_location_ids(plants, {-1: 40}) == [(1, 5, 2), (2, 40, 3)]
+
+
+def test_resolve_location_ids_missing():
+    """Tests that an unresolved provisional location ID raises a ValueError."""
+    with pytest.raises(ValueError):
+        resolve_location_ids([(2, -1, 3)], {})
+
+
+def test_get_values_placeholders():
+    """Tests the placeholders for a multi-row VALUES clause."""
+    assert get_values_placeholders(2, 3) == "(%s, %s, %s), (%s, %s, %s)"
+
+
+def test_bulk_insert_chunks_rows():
+    """Tests that rows are inserted in one statement per chunk."""
+    cursor = MagicMock()
+    rows = [(i, i * 10) for i in range(5)]
+
+    bulk_insert(cursor, "gamma.t", ["a", "b"], rows, chunk_size=2)
+
+    assert cursor.execute.call_count == 3
+    query, params = cursor.execute.call_args_list[0][0]
+    assert query == "INSERT INTO gamma.t (a, b) VALUES (%s, %s), (%s, %s)"
+    assert params == (0, 0, 1, 10)
+
+
+def test_bulk_load_single_transaction():
+    """Tests that a bulk load inserts everything and commits once."""
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    cursor.fetchall.side_effect = [[(40, 2.35, 48.85)],
+                                   [(5, dt(2024, 10, 2, 10), 1.0, 2.0)], []]
+
+    location_ids = bulk_load(conn, [(5, -1, 2)], [(-1, "2.35", "48.85", 3)],
+                             [(dt(2024, 10, 2, 10), 1.0, 2.0, 5, 7, dt(2024, 10, 1))])
+
+    assert location_ids == {-1: 40}
+    assert cursor.execute.call_count == 7
+    assert "OUTPUT inserted.location_id" in cursor.execute.call_args_list[0][0][0]
+    assert cursor.execute.call_args_list[1][0][1] == (5, 40, 2)
+    assert "MERGE gamma.plant_latest_state" in cursor.execute.call_args_list[4][0][0]
+    assert "MERGE gamma.hourly_rollups" in cursor.execute.call_args_list[5][0][0]
+    assert "MERGE gamma.daily_rollups" in cursor.execute.call_args_list[6][0][0]
+    conn.commit.assert_called_once()
+    conn.rollback.assert_not_called()
+
+
+def test_bulk_load_skips_rollups_for_duplicates():
+    """Tests that readings that were already stored are not added to the rollups."""
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    cursor.fetchall.side_effect = [[], []]
+
+    bulk_load(conn, [], [], [(dt(2024, 10, 2, 10), 1.0, 2.0, 5, 7, dt(2024, 10, 1))])
+
+    queries = [c[0][0] for c in cursor.execute.call_args_list]
+    assert not any("rollups" in query for query in queries)
+
+
+def test_bulk_load_rolls_back_on_failure():
+    """Tests that a failed bulk load is rolled back and raised."""
+    conn = MagicMock()
+    conn.cursor.return_value.execute.side_effect = Exception("insert failed")
+
+    with pytest.raises(Exception, match="insert failed"):
+        bulk_load(conn, [], [], [("time", 1, 2, 5, 7, "watered")])
+
+    conn.commit.assert_not_called()
+    conn.rollback.assert_called_once()
+
+
+def test_load_resolves_locations_row_by_row():
+    """Tests that the row-by-row load returns the inserted location IDs."""
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    cursor.fetchone.return_value = (41,)
+
+    location_ids = load(conn, [(5, -1, 2)], [(-1, "2.35", "48.85", 3)], [])
+
+    assert location_ids == {-1: 41}
+    cursor.executemany.assert_called_once()
+    assert cursor.executemany.call_args[0][1] == [(5, 41, 2)]
+
+
+def test_deduplicate_recordings():
+    """Tests that repeated readings for a plant and time are dropped."""
+    recordings = [("t1", 1, 2, 5, 7, "w"), ("t1", 3, 4, 5, 7, "w"), ("t1", 1, 2, 6, 7, "w")]
+
+    assert deduplicate_recordings(recordings) == [recordings[0], recordings[2]]
+
+
+def test_bulk_insert_recordings_returns_inserted_rows():
+    """Tests that only the readings actually inserted are returned."""
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(5, "t2", 1, 2)]
+    recordings = [("t1", 1, 2, 5, 7, "w"), ("t1", 1, 2, 5, 7, "w"), ("t2", 1, 2, 5, 7, "w")]
+
+    inserted = bulk_insert_recordings(cursor, recordings)
+
+    query = cursor.execute.call_args[0][0]
+    assert "WHERE NOT EXISTS" in query
+    assert "r.plant_id = v.plant_id" in query
+    assert "OUTPUT inserted.plant_id" in query
+    assert len(cursor.execute.call_args[0][1]) == 12
+    assert inserted == [(5, "t2", 1, 2)]
+
+
+def test_insert_new_recordings_is_anti_join():
+    """Tests that readings are inserted with an anti-join on stored ones."""
+    cursor = MagicMock()
+
+    insert_new_recordings(cursor, [("t1", 1, 2, 5, 7, "w"), ("t1", 1, 2, 5, 7, "w")])
+
+    query, rows = cursor.executemany.call_args[0]
+    assert "WHERE NOT EXISTS" in query
+    assert rows == [("t1", 1, 2, 5, 7, "w", 5, "t1")]
+
+
+def test_merge_latest_state_new_plant():
+    """Tests the latest state of a plant with no stored state."""
+    row = merge_latest_state(5, None, [(dt(2024, 10, 2, 10, 1), 41.0, 21.0, 5, 7,
+                                        dt(2024, 10, 2, 9)),
+                                       (dt(2024, 10, 2, 10, 0), 40.0, 20.0, 5, 6,
+                                        dt(2024, 10, 2, 8))])
+
+    assert row[:6] == (5, "2024-10-02T10:01:00", 41.0, 21.0, dt(2024, 10, 2, 9), 7)
+    assert [e["time_taken"] for e in json.loads(row[6])] == ["2024-10-02T10:01:00",
+                                                             "2024-10-02T10:00:00"]
+
+
+def test_merge_latest_state_keeps_newest_and_ignores_late_readings():
+    """Tests that merging keeps the newest reading and history and ignores late and repeated
+    readings."""
+    stored = [{"time_taken": f"2024-10-02T10:0{i}:00", "soil_moisture": i,
+               "temperature": 20.0, "botanist_id": 7} for i in (3, 2, 1)]
+    late = (dt(2024, 10, 2, 9, 0), 10.0, 20.0, 5, 8, dt(2024, 10, 1))
+    repeat = (dt(2024, 10, 2, 10, 2), 2, 20.0, 5, 7, dt(2024, 10, 1))
+
+    row = merge_latest_state(5, (dt(2024, 10, 2), stored), [late, repeat], history_size=3)
+
+    assert row[1] == "2024-10-02T10:03:00"
+    assert row[4] == dt(2024, 10, 2)
+    assert [e["soil_moisture"] for e in json.loads(row[6])] == [3, 2, 1]
+
+
+def test_upsert_latest_state_one_merge_per_chunk():
+    """Tests that the latest states are read and merged with one statement per chunk."""
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(5, dt(2024, 10, 1), json.dumps(
+        [{"time_taken": "2024-10-02T09:00:00", "soil_moisture": 1.0,
+          "temperature": 2.0, "botanist_id": 7}]))]
+    recordings = [(dt(2024, 10, 2, 10), 40.0, 20.0, 5, 7, dt(2024, 10, 2)),
+                  (dt(2024, 10, 2, 10), 40.0, 20.0, 6, 7, dt(2024, 10, 2))]
+
+    assert upsert_latest_state(cursor, recordings, history_size=5) == 2
+
+    select, merge = cursor.execute.call_args_list
+    assert "WITH (UPDLOCK, HOLDLOCK)" in select[0][0]
+    assert select[0][1] == (5, 6)
+    assert "MERGE gamma.plant_latest_state" in merge[0][0]
+    params = merge[0][1]
+    assert len(params) == 14
+    assert len(json.loads(params[6])) == 2
+    assert len(json.loads(params[13])) == 1
+
+
+def test_get_rollups_hourly():
+    """Tests that readings are rolled up per plant and hour."""
+    recordings = [(5, dt(2024, 10, 2, 10, 1), 40.0, 20.0),
+                  (5, dt(2024, 10, 2, 10, 59), 20.0, 22.0),
+                  (5, dt(2024, 10, 2, 11, 0), 30.0, 21.0),
+                  (6, dt(2024, 10, 2, 10, 5), 50.0, 19.0)]
+
+    rollups = get_rollups(recordings, get_hour)
+
+    assert rollups[0] == (5, dt(2024, 10, 2, 10), 2, 20.0, 40.0, 60.0, 2000.0,
+                          20.0, 22.0, 42.0, 884.0)
+    assert [r[:3] for r in rollups[1:]] == [(5, dt(2024, 10, 2, 11), 1),
+                                            (6, dt(2024, 10, 2, 10), 1)]
+
+
+def test_get_rollups_daily():
+    """Tests that readings are rolled up per plant and day."""
+    recordings = [(5, dt(2024, 10, 2, 10), 40.0, 20.0), (5, dt(2024, 10, 2, 23), 20.0, 22.0)]
+
+    assert [r[:3] for r in get_rollups(recordings, get_day)] == [(5, dt(2024, 10, 2).date(), 2)]
+
+
+def test_upsert_rollups_merges_each_table():
+    """Tests that the hourly and daily rollups are each merged."""
+    cursor = MagicMock()
+
+    written = upsert_rollups(cursor, [(5, dt(2024, 10, 2, 10), 40.0, 20.0),
+                                      (5, dt(2024, 10, 2, 11), 30.0, 21.0)])
+
+    assert written == 3
+    hourly, daily = cursor.execute.call_args_list
+    assert "MERGE gamma.hourly_rollups" in hourly[0][0]
+    assert "t.reading_count = t.reading_count + s.reading_count" in hourly[0][0]
+    assert "CASE WHEN s.soil_moisture_min < t.soil_moisture_min" in hourly[0][0]
+    assert len(hourly[0][1]) == 22
+    assert len(daily[0][1]) == 11
+
+
+def test_upsert_rollups_nothing_inserted():
+    """Tests that nothing is merged when no readings were inserted."""
+    cursor = MagicMock()
+
+    assert upsert_rollups(cursor, []) == 0
+    cursor.execute.assert_not_called()
@@ -0,0 +1,69 @@
+# pylint: skip-file
+import socket
+
+import pytest
+import requests
+
+from mock_api import get_live_ids, make_app, start_in_thread
+
+
+def get_free_port():
+    """Returns a local port that is free to bind."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def mock_api_url(request):
+    """Starts the mock API with the parametrised options and yields its URL."""
+    port = get_free_port()
+    stop = start_in_thread(make_app(**request.param), port=port)
+    yield f"http://127.0.0.1:{port}"
+    stop()
+
+
+def test_get_live_ids_skips_gaps():
+    """Tests that the live plant IDs skip the gaps and keep the plant count."""
+    assert get_live_ids(4, [2, 3]) == [1, 4, 5, 6]
+
+
+@pytest.mark.parametrize("mock_api_url", [{"num_plants": 3, "gaps": [2], "latency": 0}],
+                         indirect=True)
+def test_mock_api_index_and_plants(mock_api_url):
+    """Tests that the mock API serves the plant count and plant responses."""
+    index = requests.get(mock_api_url, timeout=5).json()
+    assert index == {"plants_on_display": 3, "success": True}
+
+    plant = requests.get(f"{mock_api_url}/plants/3", timeout=5).json()
+    assert plant["plant_id"] == 3
+    assert set(plant["botanist"]) == {"email", "name", "phone"}
+
+    assert requests.get(f"{mock_api_url}/plants/2", timeout=5).status_code == 404
+    assert requests.get(f"{mock_api_url}/plants/5", timeout=5).status_code == 404
+
+
+@pytest.mark.parametrize("mock_api_url", [{"num_plants": 3, "latency": 0, "throttle_rate": 1}],
+                         indirect=True)
+def test_mock_api_throttles(mock_api_url):
+    """Tests that the mock API can throttle requests with a 429."""
+    assert requests.get(f"{mock_api_url}/plants/2", timeout=5).status_code == 429
+
+
+@pytest.mark.parametrize("mock_api_url", [{"num_plants": 3, "latency": 0, "error_rate": 1}],
+                         indirect=True)
+def test_mock_api_errors(mock_api_url):
+    """Tests that the mock API can fail requests with a 500."""
+    assert requests.get(f"{mock_api_url}/plants/2", timeout=5).status_code == 500
+
+
+@pytest.mark.parametrize("mock_api_url", [{"num_plants": 20, "latency": 0, "malformed_rate": 1,
+                                           "seed": 3}], indirect=True)
+def test_mock_api_malformed(mock_api_url):
+    """Tests that the mock API can return malformed payloads."""
+    for plant_id in range(1, 5):
+        response = requests.get(f"{mock_api_url}/plants/{plant_id}", timeout=5)
+        try:
+            assert "botanist" not in response.json()
+        except ValueError:
+            pass
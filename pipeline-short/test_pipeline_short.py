@@ -0,0 +1,272 @@
+# pylint: skip-file
+import asyncio
+import os
+import pymssql
+import pytest
+from unittest.mock import MagicMock, patch
+
+from pipeline_short import (run_streaming, lambda_handler, get_next_tick, run_daemon,
+                            replay_spool, load_extracted)
+from spool import Spool
+from conftest import make_plant, make_reference
+
+
+def fake_stream(plants):
+    """Returns a stand-in for stream_extract that yields the given plants."""
+    async def stream(session=None, controller=None):
+        for plant in plants:
+            yield plant
+    return stream
+
+
+@patch("pipeline_short.get_reference_data", return_value=make_reference(plant_ids={1, 2, 3}))
+@patch("load_short.bulk_load")
+def test_run_streaming_flushes_in_micro_batches(mock_load, mock_reference):
+    """Tests that streamed plants are loaded each time the micro-batch is ready."""
+    plants = [make_plant(i) for i in (1, 2, 3)]
+
+    with patch("pipeline_short.stream_extract", fake_stream(plants)), \
+            patch("pipeline_short.MicroBatch.is_ready", side_effect=[False, True, False]):
+        loaded = asyncio.run(run_streaming(MagicMock()))
+
+    assert loaded == 3
+    assert mock_load.call_count == 2
+    assert len(mock_load.call_args_list[0][0][3]) == 2
+    assert len(mock_load.call_args_list[1][0][3]) == 1
+
+
+@patch("pipeline_short.get_reference_data", return_value=make_reference(plant_ids={1, 2, 3}))
+@patch("load_short.bulk_load")
+def test_run_streaming_skips_invalid_plants(mock_load, mock_reference):
+    """Tests that invalid plants are dropped from the stream without failing it."""
+    plants = [make_plant(1), {"plant_id": 2, "botanist": {}}]
+
+    with patch("pipeline_short.stream_extract", fake_stream(plants)):
+        loaded = asyncio.run(run_streaming(MagicMock()))
+
+    assert loaded == 1
+
+
+@patch("pipeline_short.get_reference_data", return_value=make_reference(plant_ids={1, 2, 3}))
+@patch("load_short.bulk_load")
+def test_run_streaming_no_plants(mock_load, mock_reference):
+    """Tests that an empty stream loads nothing but still reads the reference data."""
+    with patch("pipeline_short.stream_extract", fake_stream([])):
+        loaded = asyncio.run(run_streaming(MagicMock()))
+
+    assert loaded == 0
+    mock_load.assert_not_called()
+    mock_reference.assert_called_once()
+
+
+@patch("pipeline_short.run_streaming")
+@patch("pipeline_short.extract")
+@patch("pipeline_short.get_connection")
+def test_lambda_handler_streaming_mode(mock_connection, mock_extract, mock_run_streaming):
+    """Tests that the streaming event runs the streaming pipeline instead of extract."""
+    async def run(conn, spool=None):
+        return 0
+    mock_run_streaming.side_effect = run
+
+    with patch("pipeline_short.Spool", return_value=Spool("/nonexistent/spool")):
+        response = lambda_handler({"streaming": True})
+
+    assert response["statusCode"] == 200
+    mock_run_streaming.assert_called_once()
+    mock_extract.assert_not_called()
+
+
+@patch("pipeline_short.extract", return_value=[make_plant(1), make_plant(2)])
+@patch("pipeline_short.get_connection", side_effect=Exception("no db"))
+def test_lambda_handler_failure_spools_extracted_plants(mock_connection, mock_extract, tmp_path):
+    """Tests that a failed load spools the extracted plants and reports them."""
+    spool = Spool(str(tmp_path))
+
+    with patch("pipeline_short.Spool", return_value=spool):
+        response = lambda_handler({})
+
+    assert response["statusCode"] == 400
+    assert "spooled 2 plants" in response["body"]
+    assert spool.read()[1] == [make_plant(1), make_plant(2)]
+
+
+@patch("pipeline_short.extract", side_effect=Exception("no api"))
+@patch("pipeline_short.get_connection", side_effect=Exception("no db"))
+def test_lambda_handler_failure_without_data(mock_connection, mock_extract, tmp_path):
+    """Tests that a run with no API data fails without spooling anything."""
+    with patch("pipeline_short.Spool", return_value=Spool(str(tmp_path))):
+        response = lambda_handler({})
+
+    assert response["statusCode"] == 400
+    assert "no api" in response["body"]
+
+
+@patch("pipeline_short.transform_plant_data", return_value=([], [], [("reading",)]))
+@patch("pipeline_short.bulk_load", side_effect=pymssql.OperationalError("load failed"))
+def test_load_extracted_spools_on_failure(mock_load, mock_transform, tmp_path):
+    """Tests that a database failure spools the batch before raising."""
+    spool = Spool(str(tmp_path))
+
+    with pytest.raises(pymssql.OperationalError, match="load failed"):
+        load_extracted(MagicMock(), [make_plant(1)], spool)
+
+    assert spool.read()[1] == [make_plant(1)]
+
+
+@patch("pipeline_short.transform_plant_data", side_effect=ValueError("bad data"))
+@patch("pipeline_short.bulk_load")
+def test_load_extracted_does_not_spool_data_errors(mock_load, mock_transform, tmp_path):
+    """Tests that a batch the transform rejects is not spooled to fail again."""
+    spool = Spool(str(tmp_path))
+
+    with pytest.raises(ValueError, match="bad data"):
+        load_extracted(MagicMock(), [make_plant(1)], spool)
+
+    assert spool.get_segments() == []
+
+
+@patch("pipeline_short.transform_plant_data", return_value=([], [], [("r",), ("r",)]))
+@patch("pipeline_short.bulk_load")
+def test_replay_spool_loads_segments_oldest_first(mock_load, mock_transform, tmp_path):
+    """Tests that each segment is loaded in order and deleted once loaded."""
+    spool = Spool(str(tmp_path), segment_size=200)
+    spool.append([make_plant(1), make_plant(2)])
+    spool.append([make_plant(3)])
+    segments = len(spool.get_segments())
+
+    assert replay_spool(MagicMock(), spool) == 2 * segments
+
+    assert mock_load.call_count == segments
+    assert [p["plant_id"] for call in mock_transform.call_args_list
+            for p in call[0][1]] == [1, 2, 3]
+    assert spool.get_segments() == []
+
+
+@patch("pipeline_short.bulk_load")
+def test_replay_spool_quarantines_malformed_segment(mock_load, tmp_path):
+    """Tests that a spooled reading the transform cannot parse is quarantined
+    and the segments after it still replay."""
+    def transform(conn, plants):
+        for plant in plants:
+            if plant["recording_taken"] == "2024/10/02 10:00":
+                raise ValueError("time data does not match format")
+        return [], [], [("r",)] * len(plants)
+
+    spool = Spool(str(tmp_path), segment_size=200)
+    bad = make_plant(1)
+    bad["recording_taken"] = "2024/10/02 10:00"
+    spool.append([bad])
+    spool.append([make_plant(2)])
+    assert len(spool.get_segments()) == 2
+
+    with patch("pipeline_short.transform_plant_data", side_effect=transform):
+        assert replay_spool(MagicMock(), spool) == 1
+        assert spool.get_segments() == []
+
+        spool.append([make_plant(3)])
+        assert replay_spool(MagicMock(), spool) == 1
+
+    quarantined = os.listdir(tmp_path / "quarantine")
+    assert len(quarantined) == 1
+
+
+@patch("pipeline_short.transform_plant_data", return_value=([], [], []))
+@patch("pipeline_short.bulk_load", side_effect=pymssql.OperationalError("still down"))
+def test_replay_spool_failure_keeps_spool(mock_load, mock_transform, tmp_path):
+    """Tests that a database failure during replay keeps the spool for the next run."""
+    spool = Spool(str(tmp_path))
+    spool.append([make_plant(1)])
+
+    with pytest.raises(pymssql.OperationalError, match="still down"):
+        replay_spool(MagicMock(), spool)
+
+    assert spool.read()[1] == [make_plant(1)]
+
+
+def test_replay_spool_empty(tmp_path):
+    """Tests that an empty spool is not replayed."""
+    conn = MagicMock()
+
+    assert replay_spool(conn, Spool(str(tmp_path))) == 0
+    conn.cursor.assert_not_called()
+
+
+@patch("pipeline_short.get_reference_data", return_value=make_reference(plant_ids={1, 2, 3}))
+@patch("load_short.bulk_load", side_effect=pymssql.OperationalError("db down"))
+def test_run_streaming_spools_pending_and_remaining_plants(mock_load, mock_reference, tmp_path):
+    """Tests that a database failure spools the pending batch and the rest of the stream."""
+    spool = Spool(str(tmp_path))
+    plants = [make_plant(i) for i in (1, 2, 3)]
+
+    with patch("pipeline_short.stream_extract", fake_stream(plants)), \
+            patch("pipeline_short.MicroBatch.is_ready", side_effect=[True, False, False]), \
+            pytest.raises(pymssql.OperationalError, match="db down"):
+        asyncio.run(run_streaming(MagicMock(), spool=spool))
+
+    assert [p["plant_id"] for p in spool.read()[1]] == [1, 2, 3]
+
+
+def test_get_next_tick_on_time():
+    """Tests that a run finishing within its interval waits for the next tick."""
+    assert get_next_tick(0, 60, 10) == (60, 0)
+
+
+def test_get_next_tick_overrun_skips_missed_ticks():
+    """Tests that an overrunning run skips the ticks it missed."""
+    assert get_next_tick(0, 60, 130) == (180, 2)
+
+
+def test_get_next_tick_exact_boundary():
+    """Tests that a run ending on a tick boundary does not skip that tick."""
+    assert get_next_tick(0, 60, 60) == (60, 0)
+
+
+@patch("pipeline_short.get_reference_data", return_value=make_reference(plant_ids={1, 2, 3}))
+@patch("pipeline_short.get_connection")
+def test_run_daemon_reuses_connection_and_reference(mock_connection, mock_reference):
+    """Tests that the daemon keeps one connection and reference cache across ticks."""
+    async def run(conn, session, reference, controller, spool=None):
+        assert reference is not None
+        return 0
+
+    with patch("pipeline_short.run_streaming", side_effect=run) as mock_run:
+        asyncio.run(run_daemon(0.001, refresh=3600, max_ticks=3,
+                               spool=Spool("/nonexistent/spool")))
+
+    assert mock_run.call_count == 3
+    mock_connection.assert_called_once()
+    mock_reference.assert_called_once()
+
+
+@patch("pipeline_short.get_reference_data", return_value=make_reference(plant_ids={1, 2, 3}))
+@patch("pipeline_short.get_connection")
+def test_run_daemon_reconnects_after_failure(mock_connection, mock_reference):
+    """Tests that the daemon closes and reopens its connection after a failed tick."""
+    async def run(conn, session, reference, controller, spool=None):
+        raise Exception("connection lost")
+
+    with patch("pipeline_short.run_streaming", side_effect=run):
+        asyncio.run(run_daemon(0.001, refresh=3600, max_ticks=2,
+                               spool=Spool("/nonexistent/spool")))
+
+    assert mock_connection.call_count == 2
+    assert mock_connection.return_value.close.call_count == 2
+
+
+@patch("pipeline_short.get_reference_data", return_value=make_reference(plant_ids={1, 2, 3}))
+@patch("pipeline_short.get_connection", side_effect=[Exception("no db"), MagicMock()])
+def test_run_daemon_spools_while_down_and_replays_when_back(mock_connection, mock_reference,
+                                                            tmp_path):
+    """Tests that the daemon spools while the database is down and replays once it is back."""
+    spool = Spool(str(tmp_path))
+
+    async def run(conn, session, reference, controller, spool=None):
+        return 0
+
+    with patch("pipeline_short.stream_extract", fake_stream([make_plant(1)])), \
+            patch("pipeline_short.run_streaming", side_effect=run), \
+            patch("pipeline_short.replay_spool", return_value=1) as mock_replay:
+        asyncio.run(run_daemon(0.001, refresh=3600, max_ticks=2, spool=spool))
+
+    mock_replay.assert_called_once()
+    assert spool.read()[1] == [make_plant(1)]
@@ -0,0 +1,95 @@
+# pylint: skip-file
+from plant_registry import (load_registry, load_misses, save_registry, needs_discovery,
+                            get_discovery_ids, update_registry)
+
+
+def test_load_registry_missing_file(tmp_path):
+    """Tests that a missing registry file loads as empty."""
+    assert load_registry(str(tmp_path / "missing.json")) == set()
+
+
+def test_load_registry_corrupt_file(tmp_path):
+    """Tests that a corrupt registry file loads as empty."""
+    path = tmp_path / "registry.json"
+    path.write_text("not json")
+
+    assert load_registry(str(path)) == set()
+
+
+def test_save_and_load_registry(tmp_path):
+    """Tests that saved plant IDs are loaded back."""
+    path = str(tmp_path / "registry.json")
+    save_registry({3, 1, 2}, path)
+
+    assert load_registry(path) == {1, 2, 3}
+
+
+def test_needs_discovery():
+    """Tests that discovery is needed only when the registry size and plant count differ."""
+    assert needs_discovery({1, 2, 3}, 3) is False
+    assert needs_discovery({1, 2}, 3) is True
+    assert needs_discovery(set(), 3) is True
+
+
+def test_get_discovery_ids_empty_registry():
+    """Tests that an empty registry probes every ID up to the count plus the margin."""
+    assert get_discovery_ids(set(), 3, margin=2) == [0, 1, 2, 3, 4]
+
+
+def test_get_discovery_ids_skips_known_ids():
+    """Tests that known IDs are not probed again."""
+    assert get_discovery_ids({0, 2, 5}, 4, margin=1) == [1, 3, 4, 6]
+
+
+def test_needs_discovery_unknown_count():
+    """Tests that a failed plant count does not trigger discovery."""
+    assert needs_discovery({1, 2}, None) is False
+    assert needs_discovery(set(), None) is False
+
+
+def test_save_and_load_misses(tmp_path):
+    """Tests that miss counts survive a save and load."""
+    path = str(tmp_path / "registry.json")
+    save_registry({1, 2}, path, misses={2: 1})
+
+    assert load_registry(path) == {1, 2}
+    assert load_misses(path) == {2: 1}
+
+
+def test_load_misses_old_registry(tmp_path):
+    """Tests that a registry written without miss counts has none."""
+    path = tmp_path / "registry.json"
+    path.write_text('{"plant_ids": [1, 2]}')
+
+    assert load_misses(str(path)) == {}
+
+
+def test_update_registry_adds_found_and_drops_missing():
+    """Tests that found plants are added and a known plant is dropped once it
+    reaches the miss limit."""
+    registry = {1, 2, 3}
+    plant_data = [{"plant_id": 1}, {"plant_id": 3}, {"plant_id": 7}]
+
+    assert update_registry(registry, [7, 8], plant_data, max_misses=1) == {1, 3, 7}
+
+
+def test_update_registry_keeps_plant_until_missed_in_a_row():
+    """Tests that one failed fetch does not drop a known plant, and that a
+    plant is dropped only after max_misses runs in a row without it."""
+    registry = {1, 2, 3}
+    misses = {}
+
+    registry = update_registry(registry, [8], [{"plant_id": 1}, {"plant_id": 3}], misses, 3)
+    assert registry == {1, 2, 3}
+    assert misses == {2: 1}
+
+    registry = update_registry(registry, [8], [{"plant_id": 1}, {"plant_id": 3}], misses, 3)
+    assert misses == {2: 2}
+
+    registry = update_registry(registry, [8], [{"plant_id": 1}, {"plant_id": 2}], misses, 3)
+    assert registry == {1, 2, 3}
+    assert misses == {3: 1}
+
+    registry = update_registry(registry, [8], [{"plant_id": 1}], misses, 2)
+    assert registry == {1, 2}
+    assert misses == {2: 1}
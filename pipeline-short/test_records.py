@@ -0,0 +1,126 @@
+# pylint: skip-file
+import json
+from datetime import datetime as dt
+
+import pytest
+
+from records import (decode_plant, parse_last_watered, decode_origin,
+                     decode_botanist, transform_record)
+from transform_short import transform_plant, validate_plant
+from conftest import make_botanist, make_plant, make_reference
+
+
+def transform_row_path(plant, reference):
+    """Returns the rows the dictionary path produces for a plant, validating it first."""
+    if not validate_plant(plant, reference["plant_ids"]):
+        return None, None, None
+    return transform_plant(plant, reference)
+
+
+def test_parse_last_watered():
+    """Tests that an API watering time is parsed."""
+    assert parse_last_watered("Tue, 01 Oct 2024 13:54:32 GMT") == dt(2024, 10, 1, 13, 54, 32)
+
+
+def test_parse_last_watered_invalid():
+    """Tests that an unparseable watering time raises a ValueError."""
+    with pytest.raises(ValueError):
+        parse_last_watered("yesterday")
+
+
+def test_decode_plant():
+    """Tests that a response is decoded into a record with normalised names."""
+    plant = make_plant(name=" rose ", scientific_name=["rosa"], botanist=make_botanist("jane doe"))
+    record = decode_plant(json.dumps(plant).encode())
+
+    assert record.plant_id == 1
+    assert record.names == ("Rose", "Rosa")
+    assert record.botanist.key == ("jane@botany.com", "Jane", "Doe")
+    assert record.recording_taken == dt(2024, 10, 2, 10)
+    assert record.origin.town == "Paris"
+
+
+def test_decode_plant_malformed():
+    """Tests that malformed JSON or a non-object response decodes to None."""
+    assert decode_plant(b"{not json") is None
+    assert decode_plant(b"[]") is None
+
+
+def test_decode_plant_missing_keys():
+    """Tests that a response missing a required key decodes to None."""
+    plant = make_plant()
+    del plant["temperature"]
+
+    assert decode_plant(json.dumps(plant)) is None
+
+
+def test_decode_plant_invalid_email():
+    """Tests that a response with an invalid botanist email decodes to None."""
+    plant = make_plant(botanist=make_botanist(email="jane"))
+
+    assert decode_plant(json.dumps(plant)) is None
+
+
+def test_decode_botanist_single_name():
+    """Tests that a botanist with one name has an empty last name."""
+    assert decode_botanist({"name": "Jane", "phone": "1", "email": "j@b.com"}).key == \
+        ("j@b.com", "Jane", "")
+
+
+def test_decode_origin_invalid():
+    """Tests that a missing, short or non-list origin decodes to None."""
+    assert decode_origin(None) is None
+    assert decode_origin(["2.35", "48.85"]) is None
+    assert decode_origin("Paris") is None
+
+
+def test_transform_record_matches_dict_path():
+    """Tests that a known plant's record gives the same rows as the dictionary path."""
+    plant = make_plant()
+
+    record_rows = transform_record(decode_plant(json.dumps(plant)), make_reference())
+    dict_rows = transform_plant(plant, make_reference())
+
+    assert record_rows == dict_rows
+
+
+def test_transform_record_new_plant():
+    """Tests that a new plant's record gives its plant, new location and reading."""
+    reference = make_reference()
+    plant, location, reading = transform_record(
+        decode_plant(json.dumps(make_plant(5, origin_data=ORIGIN_DATA))), reference)
+
+    assert plant == (5, -1, 2)
+    assert location == (-1, "2.35", "48.85", 3)
+    assert reading[3] == 5
+
+
+ORIGIN_DATA = ["200", "100", "Paris", "FR", "Europe/Paris"]
+
+
+@pytest.mark.parametrize("overrides", [
+    {},
+    {"origin_data": ORIGIN_DATA},
+    {"origin_data": ["2.35", "48.85", "Paris", "FR", "Europe/Paris"]},
+    {"origin_data": ORIGIN_DATA[:3]},
+    {"origin_data": ORIGIN_DATA, "origin_location": ["2.35", "48.85"]},
+    {"origin_data": ORIGIN_DATA, "origin_location": ["2.35", "48.85", "Lyon"]},
+    {"origin_data": ORIGIN_DATA, "name": "Tulip", "scientific_name": []},
+])
+def test_transform_record_matches_dict_path_for_new_plants(overrides):
+    """Tests that new plants give the same rows and reference updates on both paths."""
+    plant = make_plant(5, **overrides)
+    record = decode_plant(json.dumps(plant))
+
+    record_reference, dict_reference = make_reference(), make_reference()
+    assert transform_record(record, record_reference) == \
+        transform_row_path(plant, dict_reference)
+    assert record_reference == dict_reference
+
+
+def test_transform_record_unknown_botanist():
+    """Tests that a record with an unknown botanist is skipped."""
+    plant = make_plant(botanist=make_botanist("Ann Lee", "ann@b.com"))
+
+    assert transform_record(decode_plant(json.dumps(plant)), make_reference()) == \
+        (None, None, None)
@@ -0,0 +1,102 @@
+# pylint: skip-file
+import os
+
+from spool import Spool, encode_record, read_segment, HEADER
+
+
+def make_record(i):
+    """Returns a small spooled plant record."""
+    return {"plant_id": i, "soil_moisture": 40.5, "recording_taken": "2024-10-02 10:00:00"}
+
+
+def test_encode_record_is_length_prefixed():
+    """Tests that an encoded record starts with the length of its payload."""
+    encoded = encode_record(make_record(1))
+    length, _ = HEADER.unpack_from(encoded)
+
+    assert length == len(encoded) - HEADER.size
+
+
+def test_append_and_read_round_trip(tmp_path):
+    """Tests that appended records are read back in order from one segment."""
+    spool = Spool(str(tmp_path))
+
+    assert spool.append([make_record(1), make_record(2)]) == 2
+    assert spool.append([make_record(3)]) == 1
+
+    segments, records = spool.read()
+    assert len(segments) == 1
+    assert records == [make_record(1), make_record(2), make_record(3)]
+
+
+def test_append_nothing_creates_no_segment(tmp_path):
+    """Tests that appending no records creates no segment."""
+    spool = Spool(str(tmp_path / "spool"))
+
+    assert spool.append([]) == 0
+    assert spool.get_segments() == []
+
+
+def test_append_rolls_over_full_segments(tmp_path):
+    """Tests that a full segment rolls over to a new one."""
+    record_size = len(encode_record(make_record(1)))
+    spool = Spool(str(tmp_path), segment_size=record_size * 2)
+
+    spool.append([make_record(i) for i in range(5)])
+
+    segments, records = spool.read()
+    assert len(segments) == 3
+    assert [r["plant_id"] for r in records] == [0, 1, 2, 3, 4]
+
+
+def test_spool_drops_oldest_segments_over_limit(tmp_path):
+    """Tests that the oldest segments are dropped once the spool is over its limit."""
+    record_size = len(encode_record(make_record(1)))
+    spool = Spool(str(tmp_path), segment_size=record_size, max_size=record_size * 2)
+
+    spool.append([make_record(i) for i in range(5)])
+
+    assert [r["plant_id"] for r in spool.read()[1]] == [3, 4]
+    assert spool.size() <= record_size * 2
+
+
+def test_torn_tail_is_skipped_and_repaired(tmp_path):
+    """Tests that a torn record at the end of a segment is skipped and truncated."""
+    spool = Spool(str(tmp_path))
+    spool.append([make_record(1), make_record(2)])
+    path = spool.get_segments()[0]
+
+    with open(path, "ab") as f:
+        f.write(encode_record(make_record(3))[:-4])
+
+    assert read_segment(path) == [make_record(1), make_record(2)]
+
+    restarted = Spool(str(tmp_path))
+    restarted.append([make_record(4)])
+    assert [r["plant_id"] for r in restarted.read()[1]] == [1, 2, 4]
+
+
+def test_corrupt_record_stops_read(tmp_path):
+    """Tests that reading stops at a record whose checksum does not match."""
+    spool = Spool(str(tmp_path))
+    spool.append([make_record(1), make_record(2)])
+    path = spool.get_segments()[0]
+
+    with open(path, "r+b") as f:
+        f.seek(os.path.getsize(path) - 2)
+        f.write(b"xx")
+
+    assert read_segment(path) == [make_record(1)]
+
+
+def test_remove_deletes_replayed_segments(tmp_path):
+    """Tests that replayed segments are deleted and removing them twice is harmless."""
+    spool = Spool(str(tmp_path))
+    spool.append([make_record(1)])
+    segments, _ = spool.read()
+
+    spool.remove(segments)
+    spool.remove(segments)
+
+    assert spool.get_segments() == []
+    assert spool.read() == ([], [])
@@ -1,7 +1,11 @@
 # pylint: skip-file
 import pytest
-from unittest.mock import patch
-from transform_short import split_name, validate_latitude, validate_longitude, get_botanist_id, get_species_id, validate_plant
+import pymssql
+from unittest.mock import patch, MagicMock
+from transform_short import (split_name, validate_latitude, validate_longitude, get_botanist_id,
+                             get_species_id, validate_plant, transform_plant,
+                             get_unknown_dimensions, get_region_rows, resolve_dimensions)
+from conftest import make_plant, make_reference
 
 
 @patch("transform_short.is_valid_email", return_value=True)
@@ -186,3 +190,183 @@ def test_split_name_special_characters():
 def test_split_name_hyphenated_last_name():
     """Test for a hyphenated last name."""
     assert split_name("John Smith-Jones") == ["John", "Smith-Jones"]
+
+
+def test_transform_plant_existing_plant():
+    """Tests that a known plant only gives a reading."""
+    plant, location, reading = transform_plant(make_plant(1), make_reference())
+
+    assert plant is None
+    assert location is None
+    assert reading[1:5] == (40.0, 20.0, 1, 7)
+
+
+def test_transform_plant_new_plant_new_location():
+    """Tests that a new plant gives its plant, a provisional location and a reading."""
+    reference = make_reference()
+    plant, location, reading = transform_plant(make_plant(5), reference)
+
+    assert plant == (5, -1, 2)
+    assert location == (-1, "2.35", "48.85", 3)
+    assert reading is not None
+    assert reference["new_locations"] == 1
+    assert 5 in reference["plant_ids"]
+
+
+def test_transform_plant_reuses_new_location():
+    """Tests that new plants at the same coordinates share one new location."""
+    reference = make_reference()
+    transform_plant(make_plant(5), reference)
+    plant, location, reading = transform_plant(make_plant(6), reference)
+
+    assert plant == (6, -1, 2)
+    assert location is None
+
+
+def test_transform_plant_unknown_botanist_is_skipped():
+    """Tests that a plant with an unknown botanist is skipped."""
+    plant = make_plant(1)
+    plant["botanist"]["email"] = "new@botany.com"
+
+    assert transform_plant(plant, make_reference()) == (None, None, None)
+
+
+@pytest.mark.parametrize("field, value", [("recording_taken", "2024/10/02 10:00"),
+                                          ("last_watered", "2024-10-01 13:54:32"),
+                                          ("recording_taken", None)])
+def test_transform_plant_invalid_time_is_skipped(field, value):
+    """Tests that a reading with an unparseable time is skipped, not raised."""
+    plant = make_plant(5)
+    plant[field] = value
+    reference = make_reference()
+
+    assert transform_plant(plant, reference) == (None, None, None)
+    assert 5 not in reference["plant_ids"]
+
+
+def test_transform_plant_new_plant_unknown_town_is_skipped():
+    """Tests that a new plant in an unknown town is skipped."""
+    plant = make_plant(5)
+    plant["origin_location"][2] = "Lyon"
+
+    assert transform_plant(plant, make_reference()) == (None, None, None)
+
+
+def test_get_unknown_dimensions():
+    """Tests that the botanists, species and towns missing from the reference are found."""
+    new_botanist = make_plant(1)
+    new_botanist["botanist"] = {"name": "ann lee", "phone": "2", "email": "ann@botany.com"}
+    new_species = make_plant(5)
+    new_species["name"] = "Tulip"
+    new_species["scientific_name"] = ["Tulipa"]
+    new_species["origin_location"] = ["1", "2", "Lyon", "FR", "Europe/Paris"]
+
+    unknown = get_unknown_dimensions([make_plant(1), new_botanist, new_species],
+                                     make_reference())
+
+    assert unknown == {"botanists": [("ann@botany.com", "Ann", "Lee", "2")],
+                       "species": [("Tulip", "Tulipa")],
+                       "towns": [("Lyon", "FR", "Europe/Paris")]}
+
+
+def test_get_unknown_dimensions_existing_plants_only_need_botanists():
+    """Tests that known plants only need their botanist resolved."""
+    plant = make_plant(1)
+    plant["name"] = "Tulip"
+    plant["origin_location"][2] = "Lyon"
+
+    assert get_unknown_dimensions([plant], make_reference()) == \
+        {"botanists": [], "species": [], "towns": []}
+
+
+@patch("transform_short.map_country_id_to_continent_id", return_value={10: 4})
+@patch("transform_short.map_continent_name_to_id", return_value={"Europe": 4, "Asia": 3})
+@patch("transform_short.map_country_code_to_id", return_value={"FR": 10, "JP": 11})
+def test_get_region_rows(mock_countries, mock_continents, mock_country_continents):
+    """Tests that towns are given their country and continent, skipping unknown countries."""
+    rows = get_region_rows(None, [("Lyon", "FR", "Europe/Paris"), ("Kyoto", "JP", "Asia/Tokyo"),
+                                  ("Quito", "EC", "America/Guayaquil")])
+
+    assert rows == [("Lyon", 10, 4), ("Kyoto", 11, 3)]
+
+
+@patch("transform_short.get_region_rows", return_value=[("Lyon", 10, 4)])
+@patch("transform_short.upsert_regions", return_value={"Lyon": 8})
+@patch("transform_short.upsert_species", return_value=[(9, "Tulipa", "tulip")])
+@patch("transform_short.upsert_botanists", return_value={"ann@botany.com": 12})
+def test_resolve_dimensions_updates_reference(mock_botanists, mock_species, mock_regions,
+                                              mock_region_rows):
+    """Tests that upserted dimensions are added to the reference."""
+    conn = MagicMock()
+    reference = make_reference()
+    new_plant = make_plant(5)
+    new_plant["botanist"] = {"name": "Ann Lee", "phone": "2", "email": "ann@botany.com"}
+    new_plant["name"] = "Tulip"
+    new_plant["scientific_name"] = ["Tulipa"]
+    new_plant["origin_location"] = ["1", "2", "Lyon", "FR", "Europe/Paris"]
+
+    resolved = resolve_dimensions(conn, [new_plant], reference)
+
+    assert resolved == {"botanists": 1, "species": 1, "towns": 1}
+    assert conn.commit.call_count == 3
+    plant, location, reading = transform_plant(new_plant, reference)
+    assert plant == (5, -1, 9)
+    assert location == (-1, "1", "2", 8)
+    assert reading[4] == 12
+
+
+@patch("transform_short.upsert_botanists", return_value={"jane@botany.com": 7, "ann@botany.com": 12})
+def test_resolve_dimensions_maps_every_name_variant(mock_botanists):
+    """Tests that every name variant of an upserted botanist maps to its ID."""
+    conn = MagicMock()
+    reference = make_reference()
+    variants = [make_plant(1), make_plant(1), make_plant(1)]
+    variants[0]["botanist"] = {"name": "Jane Doe-Smith", "phone": "1", "email": "jane@botany.com"}
+    variants[1]["botanist"] = {"name": "Ann Lee", "phone": "2", "email": "ann@botany.com"}
+    variants[2]["botanist"] = {"name": "Annie Lee", "phone": "2", "email": "ann@botany.com"}
+
+    resolve_dimensions(conn, variants, reference)
+
+    assert [row[:3] for row in mock_botanists.call_args[0][1]] == [
+        ("jane@botany.com", "Jane", "Doe-Smith"), ("ann@botany.com", "Ann", "Lee"),
+        ("ann@botany.com", "Annie", "Lee")]
+    assert [transform_plant(plant, reference)[2][4] for plant in variants] == [7, 12, 12]
+
+
+@patch("transform_short.upsert_species", return_value=[(9, "Tulipa", "tulip")])
+@patch("transform_short.upsert_botanists",
+       side_effect=pymssql.IntegrityError("Violation of UNIQUE KEY constraint on phone"))
+def test_resolve_dimensions_failed_table_skips_its_plants(mock_botanists, mock_species):
+    """Tests that a failed upsert only skips the plants that need that table."""
+    conn = MagicMock()
+    reference = make_reference()
+    new_botanist = make_plant(1)
+    new_botanist["botanist"] = {"name": "Ann Lee", "phone": "1", "email": "ann@botany.com"}
+    new_species = make_plant(5)
+    new_species["name"] = "Tulip"
+    new_species["scientific_name"] = ["Tulipa"]
+
+    resolved = resolve_dimensions(conn, [new_botanist, new_species], reference)
+
+    assert resolved == {"botanists": 0, "species": 1, "towns": 0}
+    conn.rollback.assert_called_once()
+    assert transform_plant(new_botanist, reference) == (None, None, None)
+    assert transform_plant(new_species, reference)[0] == (5, -1, 9)
+
+
+def test_get_unknown_dimensions_skips_species_without_scientific_name():
+    """Tests that a species without a scientific name is not added."""
+    plant = make_plant(5)
+    plant["name"] = "Tulip"
+
+    assert get_unknown_dimensions([plant], make_reference())["species"] == []
+    assert transform_plant(plant, make_reference()) == (None, None, None)
+
+
+def test_resolve_dimensions_nothing_unknown():
+    """Tests that nothing is upserted when every dimension is known."""
+    conn = MagicMock()
+
+    assert resolve_dimensions(conn, [make_plant(1)], make_reference()) == \
+        {"botanists": 0, "species": 0, "towns": 0}
+    conn.cursor.assert_not_called()
@@ -0,0 +1,109 @@
+# pylint: skip-file
+from copy import deepcopy
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from transform_columnar import transform_columnar, split_names, transform_plant_data_columnar
+from transform_short import transform_plant_data
+from conftest import make_botanist, make_plant, make_reference
+
+import pandas as pd
+
+
+KNOWN = {"plant_ids": {1, 2, 3},
+         "botanists": {("jane@botany.com", "Jane", "Doe"): 7,
+                       ("ann@botany.com", "Ann", "Lee Smith"): 8,
+                       ("solo@botany.com", "Solo", ""): 9}}
+
+
+def make_batch():
+    """Returns a batch of known, new and invalid plants covering the row path's rules."""
+    missing_keys = make_plant(2)
+    del missing_keys["temperature"]
+    missing_phone = make_plant(3)
+    del missing_phone["botanist"]["phone"]
+
+    return [
+        make_plant(1),
+        make_plant(2, botanist=make_botanist("  ann   lee smith ", "ann@botany.com")),
+        make_plant(3, botanist=make_botanist("Solo", "solo@botany.com"),
+                   last_watered="Wed, 02 Oct 2024 01:02:03 UTC"),
+        missing_keys,
+        missing_phone,
+        make_plant(1, botanist=make_botanist(email="not-an-email")),
+        make_plant(5),
+        make_plant(6, origin_data=["200", "100", "Paris", "FR", "Europe/Paris"]),
+        make_plant(7, origin_data=["200", "100", "Paris", "FR", "Europe/Paris"]),
+    ]
+
+
+def run_row_path(batch, reference):
+    """Returns the rows transform_plant_data produces for a batch with the given reference."""
+    conn = MagicMock()
+    with patch("transform_short.get_reference_data", return_value=reference):
+        return transform_plant_data(conn, batch)
+
+
+def test_columnar_matches_row_path():
+    """Tests that the columnar transform gives the same rows as the row path."""
+    batch = make_batch()
+
+    expected = run_row_path(deepcopy(batch), make_reference(**KNOWN))
+    result = transform_columnar(deepcopy(batch), make_reference(**KNOWN))
+
+    assert result == expected
+    assert len(result[2]) == 5
+    assert result[0] == [(6, -1, 2), (7, -1, 2)]
+
+
+def test_columnar_skips_unknown_botanist_like_row_path():
+    """Tests that a plant with an unknown botanist is skipped on both paths."""
+    batch = [make_plant(1, botanist=make_botanist(email="new@botany.com")), make_plant(2)]
+
+    expected = run_row_path(deepcopy(batch), make_reference(**KNOWN))
+    result = transform_columnar(deepcopy(batch), make_reference(**KNOWN))
+
+    assert result == expected
+    assert [r[3] for r in result[2]] == [2]
+
+
+def test_columnar_skips_new_plant_with_unknown_town():
+    """Tests that a new plant in an unknown town is skipped on both paths."""
+    batch = [make_plant(6, origin_data=["200", "100", "Paris", "FR", "Europe/Paris"],
+                        origin_location=["1", "2", "Lyon", "FR", "Europe/Paris"]),
+             make_plant(1)]
+
+    expected = run_row_path(deepcopy(batch), make_reference(**KNOWN))
+    result = transform_columnar(deepcopy(batch), make_reference(**KNOWN))
+
+    assert result == expected
+    assert result[0] == []
+    assert [r[3] for r in result[2]] == [1]
+
+
+def test_columnar_empty_batch():
+    """Tests that an empty batch gives no rows."""
+    assert transform_columnar([], make_reference(**KNOWN)) == ([], [], [])
+
+
+def test_columnar_no_valid_plants():
+    """Tests that a batch without valid plants gives no rows."""
+    assert transform_columnar([{"plant_id": 1}], make_reference(**KNOWN)) == ([], [], [])
+
+
+def test_split_names():
+    """Tests that botanist names are split into title-cased first and last names."""
+    first, last = split_names(pd.Series(["john doe", " John  Michael Doe ", "Solo"]))
+
+    assert first.tolist() == ["John", "John", "Solo"]
+    assert last.tolist() == ["Doe", "Michael Doe", ""]
+
+
+@patch("transform_columnar.get_reference_data", return_value=make_reference(**KNOWN))
+def test_transform_plant_data_columnar(mock_reference):
+    """Tests that the columnar entry point reads the reference data and transforms the batch."""
+    plants, locations, readings = transform_plant_data_columnar(MagicMock(), [make_plant(1)])
+
+    assert (plants, locations) == ([], [])
+    assert readings[0][1:5] == (40.0, 20.0, 1, 7)
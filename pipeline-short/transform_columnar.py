@@ -0,0 +1,148 @@
+'''Columnar transform of a batch of extracted plants using pandas'''
+import logging
+
+import pandas as pd
+
+from transform_short import (get_reference_data, transform_plant, validate_origin_data,
+                             clean_plants, resolve_dimensions)
+
+LOGGER = logging.getLogger(__name__)
+
+PLANT_KEYS = ["botanist", "name", "plant_id", "soil_moisture",
+              "temperature", "last_watered", "recording_taken"]
+
+BOTANIST_KEYS = ["name", "phone", "email"]
+
+
+def to_frame(extracted_data: list[dict]) -> pd.DataFrame:
+    '''Returns the extracted plants as a DataFrame with one column per key'''
+    frame = pd.DataFrame.from_records(extracted_data)
+
+    for key in PLANT_KEYS + ["origin_data"]:
+        if key not in frame:
+            frame[key] = None
+
+    botanists = pd.DataFrame.from_records(
+        [b if isinstance(b, dict) else {} for b in frame["botanist"]], index=frame.index)
+
+    for key in BOTANIST_KEYS:
+        frame[f"botanist_{key}"] = botanists[key] if key in botanists else None
+
+    return frame
+
+
+def get_valid_mask(frame: pd.DataFrame, plant_ids: set[int]) -> pd.Series:
+    '''Returns a boolean mask of the plants that pass validate_plant'''
+    has_keys = frame[PLANT_KEYS].notna().all(axis=1)
+    has_botanist = frame[[f"botanist_{k}" for k in BOTANIST_KEYS]].notna().all(axis=1)
+
+    emails = frame["botanist_email"]
+    valid_email = emails.map(lambda e: isinstance(e, str)).astype(bool) & \
+        emails.astype("string").str.contains("@", regex=False).fillna(False).astype(bool)
+
+    valid = has_keys & has_botanist & valid_email
+    existing = frame["plant_id"].isin(plant_ids)
+
+    new = valid & ~existing
+    if new.any():
+        origin_data = frame.loc[new, "origin_data"]
+        valid_origin = origin_data.map(
+            lambda o: bool(o) and isinstance(o, list) and validate_origin_data(o))
+        valid.loc[new] = valid_origin.astype(bool)
+
+    return valid
+
+
+def split_names(names: pd.Series) -> tuple[pd.Series, pd.Series]:
+    '''Vectorised split_name. Returns first and last name columns'''
+    parts = names.str.strip().str.split(" ", n=1, expand=True)
+    if 1 not in parts:
+        parts[1] = None
+
+    has_last = parts[1].notna()
+    first = parts[0].str.strip().str.title().where(has_last, names)
+    last = parts[1].str.strip().str.title().where(has_last, "")
+
+    return first, last
+
+
+def parse_last_watered(values: pd.Series) -> pd.Series:
+    '''Parses "%a, %d %b %Y %H:%M:%S %Z" timestamps, dropping the zone name'''
+    return pd.to_datetime(values.str.rsplit(" ", n=1).str[0],
+                          format="%a, %d %b %Y %H:%M:%S")
+
+
+def transform_columnar(extracted_data: list[dict], reference: dict) -> tuple[list, list, list]:
+    '''Transforms a batch of extracted plants column by column.
+
+    Validation, name splitting, timestamp parsing, the existing-plant check
+    and the botanist lookup run as vectorised operations over the whole
+    batch. The rare new plants then go through transform_plant in order so
+    that new location IDs are allocated exactly as in the row-wise path.'''
+    if not extracted_data:
+        return [], [], []
+
+    frame = to_frame(extracted_data)
+    frame = frame[get_valid_mask(frame, reference["plant_ids"])]
+
+    if frame.empty:
+        return [], [], []
+
+    first, last = split_names(frame["botanist_name"])
+    keys = pd.DataFrame({"email": frame["botanist_email"], "first": first, "last": last})
+
+    botanists = pd.DataFrame(
+        [(*key, botanist_id) for key, botanist_id in reference["botanists"].items()],
+        columns=["email", "first", "last", "botanist_id"])
+
+    botanist_ids = keys.merge(botanists, how="left", on=["email", "first", "last"],
+                              validate="many_to_one")["botanist_id"].to_numpy()
+
+    known_botanist = pd.notna(botanist_ids)
+    if not known_botanist.all():
+        LOGGER.warning("Skipping %s plants with unknown botanists", (~known_botanist).sum())
+        frame = frame[known_botanist]
+        botanist_ids = botanist_ids[known_botanist]
+        if frame.empty:
+            return [], [], []
+
+    recording_taken = pd.to_datetime(frame["recording_taken"], format="%Y-%m-%d %H:%M:%S")
+    last_watered = parse_last_watered(frame["last_watered"])
+
+    readings = list(zip(
+        recording_taken.dt.to_pydatetime().tolist(),
+        frame["soil_moisture"].tolist(),
+        frame["temperature"].tolist(),
+        frame["plant_id"].astype(int).tolist(),
+        botanist_ids.astype(int).tolist(),
+        last_watered.dt.to_pydatetime().tolist()))
+
+    plants_to_insert = []
+    locations_to_insert = []
+    skipped = set()
+
+    new_plants = ~frame["plant_id"].isin(reference["plant_ids"])
+    for position in new_plants.to_numpy().nonzero()[0]:
+        plant, location, reading = transform_plant(
+            extracted_data[frame.index[position]], reference)
+        if plant:
+            plants_to_insert.append(plant)
+        if location:
+            locations_to_insert.append(location)
+        if reading is None:
+            skipped.add(position)
+
+    if skipped:
+        readings = [r for position, r in enumerate(readings) if position not in skipped]
+
+    return plants_to_insert, locations_to_insert, readings
+
+
+def transform_plant_data_columnar(conn, extracted_data: list[dict]):
+    '''Columnar equivalent of transform_plant_data'''
+    curr = conn.cursor()
+    reference = get_reference_data(curr)
+
+    resolve_dimensions(conn, clean_plants(extracted_data, reference["plant_ids"]), reference)
+
+    return transform_columnar(extracted_data, reference)
@@ -9,10 +9,15 @@ from dotenv import load_dotenv
 
 from logger import logger_setup
 
-from database_functions import map_botanist_details_to_id, map_longitude_and_latitude_to_location_id, map_species_names_to_species_id, map_town_name_to_id, get_all_plant_ids, get_max_location_id
+from database_functions import (REFERENCE_CACHE, upsert_botanists, upsert_species, upsert_regions,
+                                map_country_code_to_id, map_continent_name_to_id,
+                                map_country_id_to_continent_id)
 
 LOGGER = logging.getLogger(__name__)
 
+TIMEZONE_CONTINENTS = {"Africa": "Africa", "Antarctica": "Antarctica", "Asia": "Asia",
+                       "Europe": "Europe", "Australia": "Oceania", "Pacific": "Oceania"}
+
 
 def get_connection():
     """Connects to an RDS database using pyodbc."""
@@ -104,7 +109,7 @@ def get_species_id(plant_data: dict, all_names: dict) -> int:
     raise ValueError("Species not available")
 
 
-def validate_plant(plant: dict, all_plant_ids: list[int]) -> bool:
+def validate_plant(plant: dict, all_plant_ids: set[int]) -> bool:
     '''Validates a plant extracted from the API'''
 
     valid_keys = ["botanist", "name", "plant_id",
@@ -130,77 +135,252 @@ def validate_plant(plant: dict, all_plant_ids: list[int]) -> bool:
     return valid_email and valid_botanist and valid_location
 
 
-def clean_plants(plants: list[dict], existing_ids: list[int]):
-    return list(filter(lambda x: validate_plant(x, existing_ids), plants))
+def get_unknown_dimensions(plants: list[dict], reference: dict) -> dict:
+    '''Collects the botanists, species and towns referenced by validated plants
+    that are missing from the reference maps. Every spelling of a botanist's
+    name is kept, so each can be mapped to the stored botanist.'''
 
+    botanists, species, towns = {}, {}, {}
 
-def transform_plant_data(conn, extracted_data: list[dict]):
-    '''Transforms the extracted plant data. Returns lists containing the data that needs to be bulk inserted into the database.
-    '''
-    curr = conn.cursor()
+    for p in plants:
+        botanist = p["botanist"]
+        names = split_name(botanist["name"])
+        key = (botanist["email"], names[0], names[1])
+        if key not in reference["botanists"]:
+            botanists[key] = (*key, botanist["phone"])
 
-    locations_to_insert = []
-    plants_to_insert = []
-    readings_to_insert = []
+        if p["plant_id"] in reference["plant_ids"]:
+            continue
 
-    all_ids = get_all_plant_ids(curr)
+        try:
+            get_species_id(p, reference["species"])
+        except ValueError:
+            scientific_names = p.get("scientific_name")
+            if not scientific_names:
+                LOGGER.warning("Not adding a species for new plant %s without a scientific name",
+                               p["plant_id"])
+                continue
+            species[scientific_names[0].strip()] = (p["name"].strip(), scientific_names[0].strip())
 
-    plants = clean_plants(extracted_data, all_ids)
+        origin_location = p.get("origin_location") or []
+        if len(origin_location) >= 5 \
+                and (origin_location[0], origin_location[1]) not in reference["coordinates"] \
+                and origin_location[2] not in reference["towns"]:
+            towns[origin_location[2]] = tuple(origin_location[2:5])
 
-    botanists = map_botanist_details_to_id(curr)
-    towns = map_town_name_to_id(curr)
-    species = map_species_names_to_species_id(curr)
-    coord_map = map_longitude_and_latitude_to_location_id(curr)
+    return {"botanists": list(botanists.values()), "species": list(species.values()),
+            "towns": list(towns.values())}
 
-    next_location_id = get_max_location_id(curr) + 1
 
-    for p in plants:
-        p_id = p["plant_id"]
+def get_region_rows(cursor, towns: list[tuple]) -> list[tuple]:
+    '''Returns (town_name, country_id, continent_id) rows for new towns given as
+    (town_name, country_code, timezone). The continent is taken from other towns
+    in the same country, or else from the timezone.'''
 
-        try:
-            botanist_id = get_botanist_id(p["botanist"], botanists)
-        except KeyError:
+    countries = map_country_code_to_id(cursor)
+    continents = map_continent_name_to_id(cursor)
+    country_continents = map_country_id_to_continent_id(cursor)
 
+    rows = []
+    for town, country_code, timezone in towns:
+        country_id = countries.get(country_code)
+        continent_id = country_continents.get(country_id) or continents.get(
+            TIMEZONE_CONTINENTS.get(str(timezone).split("/")[0]))
+
+        if country_id is None or continent_id is None:
+            LOGGER.warning("Cannot resolve country or continent for town %s", town)
             continue
 
+        rows.append((town, country_id, continent_id))
+
+    return rows
+
+
+def resolve_regions(cursor, towns: list[tuple]) -> dict:
+    '''Upserts the new towns whose country and continent can be resolved.
+    Returns town_name: town_id'''
+
+    regions = get_region_rows(cursor, towns)
+    return upsert_regions(cursor, regions) if regions else {}
+
+
+def upsert_dimension(conn, name: str, upsert, rows: list[tuple]):
+    '''Runs one table's upsert in its own transaction. Returns its result, or
+    None if the database rejects it, so the plants that need those rows are
+    skipped instead of failing the batch.'''
+
+    try:
+        result = upsert(conn.cursor(), rows)
+        conn.commit()
+    except pymssql.Error as err:
+        conn.rollback()
+        LOGGER.error("Cannot resolve new %s, skipping the plants that need them: %s", name, err)
+        return None
+
+    return result
+
+
+def resolve_dimensions(conn, plants: list[dict], reference: dict) -> dict:
+    '''Upserts every unknown botanist, species and town referenced by a batch of
+    validated plants, one statement per table, and adds their surrogate keys
+    to the reference maps. Returns the number of entities resolved per table.'''
+
+    unknown = get_unknown_dimensions(plants, reference)
+    resolved = {name: len(rows) for name, rows in unknown.items()}
+
+    if not any(resolved.values()):
+        return resolved
+
+    if unknown["botanists"]:
+        botanist_ids = upsert_dimension(conn, "botanists", upsert_botanists, unknown["botanists"])
+        if botanist_ids is None:
+            resolved["botanists"] = 0
+        else:
+            for email, first_name, last_name, _ in unknown["botanists"]:
+                if email in botanist_ids:
+                    reference["botanists"][(email, first_name, last_name)] = botanist_ids[email]
+
+    if unknown["species"]:
+        species = upsert_dimension(conn, "species", upsert_species, unknown["species"])
+        if species is None:
+            resolved["species"] = 0
+        for species_id, scientific_name, common_name in species or []:
+            reference["species"]["scientific_name"][scientific_name.strip().title()] = species_id
+            reference["species"]["common_name"][common_name.strip().title()] = species_id
+
+    if unknown["towns"]:
+        towns = upsert_dimension(conn, "towns", resolve_regions, unknown["towns"])
+        if towns is None:
+            resolved["towns"] = 0
+        else:
+            reference["towns"].update(towns)
+
+    LOGGER.info("Resolved new dimensions: %s", resolved)
+    return resolved
+
+
+def clean_plants(plants: list[dict], existing_ids: set[int]):
+    return list(filter(lambda x: validate_plant(x, existing_ids), plants))
+
+
+def get_reference_data(cursor) -> dict:
+    '''Returns the reference maps needed to transform plant data'''
+
+    cached = REFERENCE_CACHE.get(cursor)
+
+    return {
+        "plant_ids": set(cached["plant_ids"]),
+        "botanists": cached["botanists"],
+        "towns": cached["towns"],
+        "species": cached["species"],
+        "coordinates": cached["coordinates"],
+        "new_locations": 0
+    }
+
+
+def add_new_location(reference: dict, lon: str, lat: str, town_id: int) -> tuple:
+    '''Registers a new location under a provisional negative ID, which the
+    loader swaps for the ID the database assigns. Returns the location row.'''
+
+    reference["new_locations"] += 1
+    location_id = -reference["new_locations"]
+    reference["coordinates"][(lon, lat)] = location_id
+
+    return (location_id, lon, lat, town_id)
+
+
+def resolve_new_locations(reference: dict, location_ids: dict) -> None:
+    '''Replaces provisional location IDs in the coordinate map with the IDs
+    the database assigned, so the map can be reused by later runs'''
+
+    coordinates = reference["coordinates"]
+    for key, location_id in coordinates.items():
+        if location_id in location_ids:
+            coordinates[key] = location_ids[location_id]
+
+
+def transform_plant(p: dict, reference: dict) -> tuple:
+    '''Transforms a single validated plant. Returns a (plant, location, reading)
+    tuple of rows to insert, any of which may be None. A reading with an
+    unparseable time is skipped, as is a new plant whose species or town
+    cannot be resolved, along with its reading.'''
+
+    p_id = p["plant_id"]
+
+    try:
+        botanist_id = get_botanist_id(p["botanist"], reference["botanists"])
+    except (KeyError, ValueError):
+        LOGGER.warning("Skipping plant %s with unknown botanist", p_id)
+        return None, None, None
+
+    try:
         recording_taken = dt.strptime(
             p["recording_taken"], '%Y-%m-%d %H:%M:%S')
 
         last_watered = dt.strptime(
             p["last_watered"], "%a, %d %b %Y %H:%M:%S %Z")
+    except (TypeError, ValueError):
+        LOGGER.warning("Skipping plant %s with invalid recording or watering time", p_id)
+        return None, None, None
 
-        readings_to_insert += [(recording_taken,
-                                p["soil_moisture"], p["temperature"], p_id, botanist_id, last_watered)]
+    reading = (recording_taken, p["soil_moisture"],
+               p["temperature"], p_id, botanist_id, last_watered)
 
-        if p_id not in all_ids:
+    if p_id in reference["plant_ids"]:
+        return None, None, reading
 
-            try:
-                species_id = get_species_id(p, species)
-            except KeyError:
-                continue
+    origin_location = p.get("origin_location")
 
-            origin_location = p["origin_location"]
-            lon, lat = origin_location[0], origin_location[1]
-            town = origin_location[2]
+    try:
+        species_id = get_species_id(p, reference["species"])
+        lon, lat, town = origin_location[0], origin_location[1], origin_location[2]
+    except (KeyError, ValueError, TypeError, IndexError):
+        LOGGER.warning("Skipping new plant %s with unknown species or origin", p_id)
+        return None, None, None
+
+    location = None
+    location_id = reference["coordinates"].get((lon, lat))
+
+    if location_id is None:
+
+        town_id = reference["towns"].get(town)
 
-            try:
+        if not town_id:
+            LOGGER.warning("Skipping new plant %s with unknown town %s", p_id, town)
+            return None, None, None
 
-                location_id = coord_map[(lon, lat)]
+        location = add_new_location(reference, lon, lat, town_id)
+        location_id = location[0]
 
-            except KeyError:
+    reference["plant_ids"].add(p_id)
 
-                town_id = towns.get(town)
+    return (p_id, location_id, species_id), location, reading
+
+
+def transform_plant_data(conn, extracted_data: list[dict]):
+    '''Transforms the extracted plant data. Returns lists containing the data that needs to be bulk inserted into the database.
+    '''
+    curr = conn.cursor()
 
-                if not town_id:
-                    continue
+    locations_to_insert = []
+    plants_to_insert = []
+    readings_to_insert = []
 
-                locations_to_insert += [(lon, lat, town_id)]
+    reference = get_reference_data(curr)
 
-                location_id = next_location_id
+    plants = clean_plants(extracted_data, reference["plant_ids"])
 
-                next_location_id += 1
+    resolve_dimensions(conn, plants, reference)
 
-            plants_to_insert += [(p_id, location_id, species_id)]
+    for p in plants:
+        plant, location, reading = transform_plant(p, reference)
+
+        if reading:
+            readings_to_insert.append(reading)
+        if location:
+            locations_to_insert.append(location)
+        if plant:
+            plants_to_insert.append(plant)
 
     return plants_to_insert, locations_to_insert, readings_to_insert
 
@@ -0,0 +1,97 @@
+'''Times the anomaly detector on one reading per plant per tick, against
+scoring each reading in a Python loop, and reports how many of the injected
+spikes and drifts it flags and how many steady readings it flags by mistake.
+
+Usage: python benchmark_anomaly.py --plants 100000 --ticks 60'''
+
+import argparse
+from datetime import datetime, timedelta
+from time import perf_counter
+import numpy as np
+from main import AnomalyDetector, ANOMALY_ALPHA, ANOMALY_SIGMA, ANOMALY_MIN_STD
+
+
+def make_tick(rng, plants: int, tick: int, baseline: np.ndarray,
+              spike_rate: float) -> tuple[np.ndarray, np.ndarray]:
+    '''Returns one noisy reading per plant for a tick, with a fraction of the
+    plants spiking, and which plants spiked.'''
+    values = baseline + rng.normal(0, (2, 1), (plants, 2))
+    values[:, 0] += np.sin(tick / 30) * 3
+    spiked = rng.random(plants) < spike_rate
+    values[spiked, 0] += rng.choice([-1, 1], spiked.sum()) * 25
+    return values, spiked
+
+
+def score_in_python(states: dict, plant_ids: list, values: list, warmup: int) -> list[bool]:
+    '''Scores one reading per plant, updating each plant's state in a loop.'''
+    flags = []
+    for plant_id, readings in zip(plant_ids, values):
+        count, means, variances = states.get(plant_id, (0, [0.0, 0.0], [0.0, 0.0]))
+        diffs = [value - mean for value, mean in zip(readings, means)]
+        flags.append(count >= warmup and any(
+            abs(diff) > ANOMALY_SIGMA * max(variance ** 0.5, floor)
+            for diff, variance, floor in zip(diffs, variances, ANOMALY_MIN_STD)))
+        if count:
+            means = [mean + ANOMALY_ALPHA * diff for mean, diff in zip(means, diffs)]
+            variances = [(1 - ANOMALY_ALPHA) * (variance + ANOMALY_ALPHA * diff ** 2)
+                         for variance, diff in zip(variances, diffs)]
+        else:
+            means = list(readings)
+        states[plant_id] = (count + 1, means, variances)
+    return flags
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plants', '-p', type=int, default=100_000, help='Plants read each tick')
+    parser.add_argument('--ticks', '-t', type=int, default=60, help='Minutes of readings')
+    parser.add_argument('--warmup', '-w', type=int, default=20,
+                        help='Readings before a plant can be flagged')
+    parser.add_argument('--spike-rate', type=float, default=0.001,
+                        help='Fraction of readings that spike')
+    parser.add_argument('--python-plants', type=int, default=10_000,
+                        help='Plants scored by the Python loop, which is scaled up')
+    args = parser.parse_args()
+
+    generator = np.random.default_rng(0)
+    plant_ids = np.arange(1, args.plants + 1)
+    baselines = np.column_stack([generator.uniform(20, 60, args.plants),
+                                 generator.uniform(15, 30, args.plants)])
+    start = datetime(2024, 10, 3)
+    detector = AnomalyDetector(warmup=args.warmup)
+    python_states = {}
+    vector_time = python_time = 0.0
+    spikes = caught = false_alarms = steady = 0
+
+    for minute in range(args.ticks):
+        readings, spiked = make_tick(generator, args.plants, minute, baselines, args.spike_rate)
+        times = np.full(args.plants, np.datetime64(start + timedelta(minutes=minute), 's'))
+
+        timer = perf_counter()
+        flags = detector.update(plant_ids, times, readings)
+        vector_time += perf_counter() - timer
+
+        timer = perf_counter()
+        python_flags = score_in_python(python_states, plant_ids[:args.python_plants].tolist(),
+                                       readings[:args.python_plants].tolist(), args.warmup)
+        python_time += perf_counter() - timer
+        assert python_flags == flags[:args.python_plants].tolist()
+
+        if minute >= args.warmup:
+            spikes += spiked.sum()
+            caught += (flags & spiked).sum()
+            steady += (~spiked).sum()
+            false_alarms += (flags & ~spiked).sum()
+
+    python_per_tick = python_time / args.ticks * args.plants / args.python_plants
+    print(f'{args.plants:,} plants, {args.ticks} ticks')
+    print(f'{"vectorised (NumPy)":<20} | {vector_time / args.ticks * 1000:9.2f} ms per tick'
+          f' | {args.plants * args.ticks / vector_time:13,.0f} readings/s')
+    print(f'{"per reading (Python)":<20} | {python_per_tick * 1000:9.2f} ms per tick'
+          f' | {args.plants / python_per_tick:13,.0f} readings/s')
+    print(f'{caught:,} of {spikes:,} spikes flagged,'
+          f' {false_alarms:,} of {steady:,} steady readings flagged')
+    state_bytes = sum(array.nbytes for array in (detector.plant_ids, detector.readings,
+                                                 detector.last_times, detector.means,
+                                                 detector.variances, detector.anomalous))
+    print(f'state: {state_bytes / args.plants:.0f} bytes per plant')
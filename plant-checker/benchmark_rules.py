@@ -0,0 +1,115 @@
+'''Times three ways of flagging a batch of readings against per-species
+threshold rules with per-plant overrides: looking up each reading's bounds in
+Python, evaluating each rule over the batch in turn, and the checker's single
+compiled NumPy pass. All three must flag the same readings.
+
+Usage: python benchmark_rules.py --plants 10000 --rules 500 --readings 100000'''
+
+import argparse
+from time import perf_counter
+import numpy as np
+from main import Thresholds, DEFAULT_THRESHOLDS
+
+
+def make_rules(plants: int, rules: int, species: int, seed: int = 0) -> tuple[list, list]:
+    '''Returns synthetic plants spread over the species, and rules split
+    evenly between species rules and plant overrides, each setting a random
+    subset of the bounds.'''
+    rng = np.random.default_rng(seed)
+    plant_rows = [{'plant_id': plant_id, 'plant_species_id': int(rng.integers(1, species + 1))}
+                  for plant_id in range(1, plants + 1)]
+    targets = ([('plant_species_id', int(species_id)) for species_id in
+                rng.choice(np.arange(1, species + 1), min(rules // 2, species), replace=False)]
+               + [('plant_id', int(plant_id)) for plant_id in
+                  rng.choice(np.arange(1, plants + 1), rules - min(rules // 2, species),
+                             replace=False)])
+    rule_rows = []
+    for column, target in targets:
+        rule = {'plant_species_id': None, 'plant_id': None, column: target}
+        low_moisture, low_temperature = rng.uniform(5, 30), rng.uniform(5, 20)
+        bounds = {'soil_moisture_min': low_moisture,
+                  'soil_moisture_max': low_moisture + rng.uniform(30, 60),
+                  'temperature_min': low_temperature,
+                  'temperature_max': low_temperature + rng.uniform(10, 25)}
+        for bound, value in bounds.items():
+            rule[bound] = round(value, 1) if rng.random() < 0.7 else None
+        rule_rows.append(rule)
+    return plant_rows, rule_rows
+
+
+def flag_per_reading(plants: list, rules: list, plant_ids, moisture, temperature) -> list:
+    '''Flags each reading by resolving its plant's bounds from dictionaries.'''
+    species = {plant['plant_id']: plant['plant_species_id'] for plant in plants}
+    species_rules = {rule['plant_species_id']: rule for rule in rules if rule['plant_id'] is None}
+    plant_rules = {rule['plant_id']: rule for rule in rules if rule['plant_id'] is not None}
+    flags = []
+    for plant_id, soil_moisture, temp in zip(plant_ids, moisture, temperature):
+        bounds = dict(DEFAULT_THRESHOLDS)
+        for rule in (species_rules.get(species.get(plant_id)), plant_rules.get(plant_id)):
+            if rule:
+                bounds.update({bound: rule[bound] for bound in DEFAULT_THRESHOLDS
+                               if rule[bound] is not None})
+        flags.append(not (bounds['soil_moisture_min'] <= soil_moisture
+                          <= bounds['soil_moisture_max']
+                          and bounds['temperature_min'] <= temp <= bounds['temperature_max']))
+    return flags
+
+
+def flag_per_rule(plants: list, rules: list, plant_ids, moisture, temperature) -> np.ndarray:
+    '''Flags the readings by applying the defaults, then each species rule,
+    then each plant rule as a separate pass over the batch.'''
+    species_of = np.zeros(max(plant['plant_id'] for plant in plants) + 1, dtype=np.int64)
+    for plant in plants:
+        species_of[plant['plant_id']] = plant['plant_species_id']
+    reading_species = species_of[np.clip(plant_ids, 0, len(species_of) - 1)]
+    bounds = {bound: np.full(len(plant_ids), value) for bound, value in DEFAULT_THRESHOLDS.items()}
+    ordered = ([rule for rule in rules if rule['plant_id'] is None]
+               + [rule for rule in rules if rule['plant_id'] is not None])
+    for rule in ordered:
+        if rule['plant_id'] is None:
+            matched = reading_species == rule['plant_species_id']
+        else:
+            matched = plant_ids == rule['plant_id']
+        for bound in DEFAULT_THRESHOLDS:
+            if rule[bound] is not None:
+                bounds[bound][matched] = rule[bound]
+    return ((moisture < bounds['soil_moisture_min']) | (moisture > bounds['soil_moisture_max'])
+            | (temperature < bounds['temperature_min'])
+            | (temperature > bounds['temperature_max']))
+
+
+def time_call(function, *args):
+    '''Returns a function's result and the seconds it took.'''
+    timer = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - timer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plants', '-p', type=int, default=10_000, help='Plants in the museum')
+    parser.add_argument('--rules', '-r', type=int, default=500, help='Threshold rules')
+    parser.add_argument('--species', '-s', type=int, default=400, help='Plant species')
+    parser.add_argument('--readings', '-n', type=int, default=100_000,
+                        help='Readings flagged per batch')
+    args = parser.parse_args()
+
+    plant_rows, rule_rows = make_rules(args.plants, args.rules, args.species)
+    generator = np.random.default_rng(1)
+    readings = (generator.integers(1, args.plants + 1, args.readings),
+                generator.uniform(0, 100, args.readings).round(2),
+                generator.uniform(0, 45, args.readings).round(2))
+    print(f'{args.plants:,} plants, {len(rule_rows)} rules, {args.readings:,} readings')
+
+    thresholds, compile_time = time_call(Thresholds, plant_rows, rule_rows)
+    compiled, compiled_time = time_call(thresholds.flag, *readings)
+    per_rule, per_rule_time = time_call(flag_per_rule, plant_rows, rule_rows, *readings)
+    per_reading, per_reading_time = time_call(flag_per_reading, plant_rows, rule_rows,
+                                              *(column.tolist() for column in readings))
+
+    assert (compiled == per_rule).all() and compiled.tolist() == per_reading
+    print(f'{compiled.sum():,} readings flagged by every method')
+    print(f'{"per reading (Python)":<22} | {per_reading_time:8.4f}s')
+    print(f'{"per rule (NumPy)":<22} | {per_rule_time:8.4f}s')
+    print(f'{"compiled (NumPy)":<22} | {compiled_time:8.4f}s'
+          f' | compiled once in {compile_time:.4f}s')
@@ -1,12 +1,50 @@
 '''Checks and alerts whether the plant conditions are optimal'''
 #pylint: disable=E0611,W0613,W0612
 from os import environ as ENV
+import json
 import logging
-from datetime import datetime as dt
+from datetime import datetime as dt, timedelta
+from functools import lru_cache
+from hashlib import sha256
+import numpy as np
 from dotenv import load_dotenv
 from pymssql import connect
 from boto3 import client
 
+ALERT_RULE = 'out_of_range'
+
+ANOMALY_RULE = 'anomaly'
+
+RULE_DESCRIPTIONS = {ALERT_RULE: 'Abnormal abiotic conditions',
+                     ANOMALY_RULE: 'Unusual readings for this plant'}
+
+ALERT_COOLDOWN = timedelta(minutes=int(ENV.get('ALERT_COOLDOWN_MINUTES', 240)))
+
+ALERT_RESOLVE_AFTER = timedelta(minutes=int(ENV.get('ALERT_RESOLVE_MINUTES', 15)))
+
+ALERT_CHUNK_SIZE = 500
+
+ATTENTION_READINGS = 3
+
+WATERMARK_OVERLAP = int(ENV.get('WATERMARK_OVERLAP', 1000))
+
+READ_CHUNK_SIZE = 10000
+
+ANOMALY_METRICS = ['soil_moisture', 'temperature']
+
+ANOMALY_ALPHA = float(ENV.get('ANOMALY_ALPHA', 0.05))
+
+ANOMALY_SIGMA = float(ENV.get('ANOMALY_SIGMA', 4))
+
+ANOMALY_WARMUP = 30
+
+ANOMALY_MIN_STD = (1.0, 0.5)
+
+ANOMALY_CHUNK_SIZE = 250
+
+DEFAULT_THRESHOLDS = {'soil_moisture_min': 15.0, 'soil_moisture_max': 70.0,
+                      'temperature_min': 15.0, 'temperature_max': 35.0}
+
 def get_date() -> str:
     '''Returns current time'''
     return dt.now().strftime('%A %d %B %Y @ %H:%M:%S ')
@@ -20,50 +58,483 @@ def get_connection():
                    database=ENV["DB_NAME"],
                    as_dict=True)
 
-def get_affected_plants() -> list[int]:
-    '''Returns a list of plants that require attention'''
-    q = '''WITH LastThreeRecordings AS (
-        SELECT plant_id, soil_moisture, temperature, 
-        ROW_NUMBER() OVER (PARTITION BY plant_id ORDER BY time_taken DESC) AS row_num
-        FROM gamma.recordings)
-        SELECT plant_id FROM LastThreeRecordings
-        WHERE row_num <= 3
-        GROUP BY plant_id
-        HAVING COUNT(*) = 3
-        AND SUM(
-        CASE WHEN (soil_moisture > 70 OR soil_moisture < 15
-        OR temperature > 35 OR temperature < 15)
-           THEN 1 ELSE 0 
-        END) = 3;'''
+def get_rule_values(rules: list[dict], column: str) -> np.ndarray:
+    '''Returns one threshold column of a list of rules, NaN where unset'''
+    return np.array([np.nan if rule[column] is None else rule[column] for rule in rules],
+                    dtype=float)
+
+
+class Thresholds:
+    '''Every plant's accepted ranges, compiled from the threshold rules into
+    arrays aligned with the sorted plant ids. Each bound comes from the plant's
+    own rule if it sets it, else its species' rule, else DEFAULT_THRESHOLDS.
+    Plants missing from the arrays use the defaults. The fingerprint covers
+    only plants with custom bounds, so adding a plant without rules keeps it.'''
+
+    def __init__(self, plants: list[dict], rules: list[dict]):
+        plants = sorted(plants, key=lambda plant: plant['plant_id'])
+        self.plant_ids = np.array([plant['plant_id'] for plant in plants], dtype=np.int64)
+        species_ids = np.array([plant['plant_species_id'] for plant in plants], dtype=np.int64)
+        self.bounds = {column: np.full(len(plants) + 1, default)
+                       for column, default in DEFAULT_THRESHOLDS.items()}
+
+        species_rules = [rule for rule in rules if rule['plant_id'] is None]
+        plant_rules = [rule for rule in rules if rule['plant_id'] is not None]
+        self.apply_rules(species_ids, species_rules, 'plant_species_id')
+        self.apply_rules(self.plant_ids, plant_rules, 'plant_id')
+
+        custom = np.zeros(len(plants), dtype=bool)
+        for column, default in DEFAULT_THRESHOLDS.items():
+            custom |= self.bounds[column][:-1] != default
+        digest = sha256(self.plant_ids[custom].tobytes())
+        for column in DEFAULT_THRESHOLDS:
+            digest.update(self.bounds[column][:-1][custom].tobytes())
+        self.fingerprint = digest.hexdigest()
+
+    def apply_rules(self, keys: np.ndarray, rules: list[dict], key_column: str) -> None:
+        '''Overrides the bounds of every plant whose key matches a rule'''
+        if not rules or not len(keys):
+            return
+        rule_keys = np.array([rule[key_column] for rule in rules], dtype=np.int64)
+        order = np.argsort(rule_keys)
+        rule_keys = rule_keys[order]
+        positions = np.minimum(np.searchsorted(rule_keys, keys), len(rule_keys) - 1)
+        matched = rule_keys[positions] == keys
+        for column in DEFAULT_THRESHOLDS:
+            values = get_rule_values(rules, column)[order][positions]
+            use = matched & ~np.isnan(values)
+            self.bounds[column][:-1][use] = values[use]
+
+    def get_positions(self, plant_ids: np.ndarray) -> np.ndarray:
+        '''Returns each plant's index into the bounds, the last for unknown plants'''
+        if not len(self.plant_ids):
+            return np.zeros(len(plant_ids), dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.plant_ids, plant_ids),
+                               len(self.plant_ids) - 1)
+        return np.where(self.plant_ids[positions] == plant_ids, positions, len(self.plant_ids))
+
+    def flag(self, plant_ids, soil_moisture, temperature) -> np.ndarray:
+        '''Returns whether each reading is outside its plant's accepted range,
+        in one vectorised pass'''
+        positions = self.get_positions(np.asarray(plant_ids, dtype=np.int64))
+        soil_moisture = np.asarray(soil_moisture, dtype=float)
+        temperature = np.asarray(temperature, dtype=float)
+        return ((soil_moisture < self.bounds['soil_moisture_min'][positions])
+                | (soil_moisture > self.bounds['soil_moisture_max'][positions])
+                | (temperature < self.bounds['temperature_min'][positions])
+                | (temperature > self.bounds['temperature_max'][positions]))
+
+
+def load_thresholds(cur) -> Thresholds:
+    '''Returns the thresholds compiled from gamma.threshold_rules'''
+    cur.execute('''SELECT plant_id, plant_species_id FROM gamma.plants;''')
+    plants = cur.fetchall()
+    cur.execute('''SELECT plant_species_id, plant_id, soil_moisture_min, soil_moisture_max,
+            temperature_min, temperature_max
+        FROM gamma.threshold_rules;''')
+    return Thresholds(plants, cur.fetchall())
+
+
+def format_time(time_taken) -> str:
+    '''Returns a reading time as a string that sorts in time order'''
+    return time_taken.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def push_flag(history: list[list], time_taken: str, flag: bool,
+              size: int = ATTENTION_READINGS) -> bool:
+    '''Adds a reading's out-of-range flag to a plant's [time_taken, flag]
+    history, newest first, keeping only the newest size readings. A reading
+    already in the history, or older than every reading of a full one, is
+    ignored, so reading the same recordings twice changes nothing.
+    Returns True if the history changed.'''
+    position = len(history)
+    for i, (entry_time, _) in enumerate(history):
+        if entry_time == time_taken:
+            return False
+        if entry_time < time_taken:
+            position = i
+            break
+    if position >= size:
+        return False
+    history.insert(position, [time_taken, int(flag)])
+    del history[size:]
+    return True
+
+
+def flags_need_attention(history: list[list], readings: int = ATTENTION_READINGS) -> bool:
+    '''Returns True if a plant's last readings, newest first, were all flagged'''
+    return len(history) >= readings and all(flag for _, flag in history[:readings])
+
+
+def load_checker_state(cur) -> tuple[int, str | None, dict[int, list]]:
+    '''Returns the recording_id watermark, the fingerprint of the thresholds
+    the flags were computed with and each plant's flag history'''
+    cur.execute('''SELECT recording_id, rules_hash FROM gamma.plant_checker_watermark;''')
+    row = cur.fetchone()
+    cur.execute('''SELECT plant_id, flag_history FROM gamma.plant_checker_state;''')
+    states = {state['plant_id']: json.loads(state['flag_history']) for state in cur.fetchall()}
+    if not row:
+        return 0, None, states
+    return row['recording_id'], row['rules_hash'], states
+
+
+def get_last_recording_id(cur) -> int:
+    '''Returns the last recording_id issued, which only moves backwards when
+    the recordings table is truncated'''
+    cur.execute('''SELECT IDENT_CURRENT('gamma.recordings') AS recording_id;''')
+    return int(cur.fetchone()['recording_id'] or 0)
+
+
+def read_new_readings(cur, after: int):
+    '''Yields the recordings with a recording_id above after, as lists of
+    up to READ_CHUNK_SIZE rows'''
+    cur.execute('''SELECT recording_id, plant_id, time_taken, soil_moisture, temperature
+        FROM gamma.recordings
+        WHERE recording_id > %s
+        ORDER BY recording_id;''', (after,))
+    while rows := cur.fetchmany(READ_CHUNK_SIZE):
+        yield rows
+
+
+def update_checker_state(states: dict[int, list], chunks, thresholds: Thresholds | None = None,
+                         size: int = ATTENTION_READINGS) -> tuple[set[int], int]:
+    '''Adds chunks of new readings to the plants' flag histories, flagging
+    each chunk against the thresholds in one vectorised pass.
+    Returns the plants whose history changed and the highest recording_id read.'''
+    thresholds = thresholds or Thresholds([], [])
+    changed = set()
+    newest = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        flags = thresholds.flag([reading['plant_id'] for reading in chunk],
+                                [reading['soil_moisture'] for reading in chunk],
+                                [reading['temperature'] for reading in chunk])
+        for reading, flag in zip(chunk, flags.tolist()):
+            history = states.setdefault(reading['plant_id'], [])
+            if push_flag(history, format_time(reading['time_taken']), flag, size):
+                changed.add(reading['plant_id'])
+        newest = max(newest, max(reading['recording_id'] for reading in chunk))
+    return changed, newest
+
+
+def save_checker_state(cur, states: dict[int, list], changed: set[int], watermark: int,
+                       rules_hash: str, reset: bool = False) -> None:
+    '''Writes the changed plants' flag histories, one MERGE per chunk, and the
+    new watermark with the thresholds' fingerprint. A reset first clears the
+    state of every plant.'''
+    if reset:
+        cur.execute('''DELETE FROM gamma.plant_checker_state;''')
+    rows = [(plant_id, json.dumps(states[plant_id])) for plant_id in sorted(changed)]
+    for start in range(0, len(rows), ALERT_CHUNK_SIZE):
+        chunk = rows[start:start + ALERT_CHUNK_SIZE]
+        values = ', '.join(['(%s, %s)'] * len(chunk))
+        cur.execute(f'''MERGE gamma.plant_checker_state WITH (HOLDLOCK) AS t
+        USING (VALUES {values}) AS s (plant_id, flag_history)
+        ON t.plant_id = s.plant_id
+        WHEN MATCHED THEN UPDATE SET t.flag_history = s.flag_history
+        WHEN NOT MATCHED THEN INSERT (plant_id, flag_history)
+            VALUES (s.plant_id, s.flag_history);''',
+                    tuple(value for row in chunk for value in row))
+    cur.execute('''MERGE gamma.plant_checker_watermark WITH (HOLDLOCK) AS t
+        USING (VALUES (1, %s, %s)) AS s (watermark_id, recording_id, rules_hash)
+        ON t.watermark_id = s.watermark_id
+        WHEN MATCHED THEN UPDATE SET t.recording_id = s.recording_id,
+            t.rules_hash = s.rules_hash
+        WHEN NOT MATCHED THEN INSERT (watermark_id, recording_id, rules_hash)
+            VALUES (s.watermark_id, s.recording_id, s.rules_hash);''', (watermark, rules_hash))
+
+
+class AnomalyDetector:
+    '''Each plant's exponentially weighted mean and variance of soil moisture
+    and temperature, held in arrays aligned with the sorted plant ids. A
+    reading is anomalous when either metric is more than sigma standard
+    deviations from its plant's mean, once the plant has warmup readings.
+    Each plant keeps its reading count, newest reading time and whether that
+    reading was anomalous. Readings no newer than a plant's newest are
+    ignored, so reading the same recordings twice changes nothing.'''
+
+    def __init__(self, alpha: float = ANOMALY_ALPHA, sigma: float = ANOMALY_SIGMA,
+                 warmup: int = ANOMALY_WARMUP, min_std: tuple = ANOMALY_MIN_STD):
+        self.alpha = alpha
+        self.sigma = sigma
+        self.warmup = warmup
+        self.min_std = np.array(min_std, dtype=float)
+        self.plant_ids = np.empty(0, dtype=np.int64)
+        self.readings = np.empty(0, dtype=np.int64)
+        self.last_times = np.empty(0, dtype='datetime64[s]')
+        self.means = np.empty((0, len(ANOMALY_METRICS)))
+        self.variances = np.empty((0, len(ANOMALY_METRICS)))
+        self.anomalous = np.empty(0, dtype=bool)
+        self.changed = set()
+
+    @classmethod
+    def from_rows(cls, rows: list[dict], **kwargs) -> 'AnomalyDetector':
+        '''Returns a detector holding the state stored in gamma.plant_anomaly_state'''
+        detector = cls(**kwargs)
+        rows = sorted(rows, key=lambda row: row['plant_id'])
+        detector.plant_ids = np.array([row['plant_id'] for row in rows], dtype=np.int64)
+        detector.readings = np.array([row['readings'] for row in rows], dtype=np.int64)
+        detector.last_times = np.array([row['last_time_taken'] for row in rows],
+                                       dtype='datetime64[s]')
+        shape = (len(rows), len(ANOMALY_METRICS))
+        detector.means = np.array([[row[f'{metric}_mean'] for metric in ANOMALY_METRICS]
+                                   for row in rows], dtype=float).reshape(shape)
+        detector.variances = np.array([[row[f'{metric}_var'] for metric in ANOMALY_METRICS]
+                                       for row in rows], dtype=float).reshape(shape)
+        detector.anomalous = np.array([row['anomalous'] for row in rows], dtype=bool)
+        return detector
+
+    def add_plants(self, plant_ids: np.ndarray) -> None:
+        '''Adds empty state for the plants not seen before'''
+        if len(self.plant_ids):
+            positions = np.minimum(np.searchsorted(self.plant_ids, plant_ids),
+                                   len(self.plant_ids) - 1)
+            plant_ids = plant_ids[self.plant_ids[positions] != plant_ids]
+        if not len(plant_ids):
+            return
+        new = np.unique(plant_ids)
+        order = np.argsort(np.concatenate([self.plant_ids, new]), kind='stable')
+        metrics = (len(new), len(ANOMALY_METRICS))
+        self.plant_ids = np.concatenate([self.plant_ids, new])[order]
+        self.readings = np.concatenate([self.readings, np.zeros(len(new), dtype=np.int64)])[order]
+        self.last_times = np.concatenate([self.last_times, np.full(len(new), np.datetime64('NaT'),
+                                                                   dtype='datetime64[s]')])[order]
+        self.means = np.concatenate([self.means, np.zeros(metrics)])[order]
+        self.variances = np.concatenate([self.variances, np.zeros(metrics)])[order]
+        self.anomalous = np.concatenate([self.anomalous, np.zeros(len(new), dtype=bool)])[order]
+
+    def step(self, positions: np.ndarray, times: np.ndarray, values: np.ndarray) -> np.ndarray:
+        '''Scores and adds one reading for each of a set of distinct plants.
+        Returns whether each reading was anomalous.'''
+        readings = self.readings[positions]
+        means, variances = self.means[positions], self.variances[positions]
+        seen = (readings > 0)[:, None]
+        diff = values - means
+        flags = ((readings >= self.warmup)
+                 & (diff * diff > self.sigma ** 2 * np.maximum(variances, self.min_std ** 2))
+                 .any(axis=1))
+        increment = self.alpha * diff
+        self.means[positions] = np.where(seen, means + increment, values)
+        self.variances[positions] = np.where(
+            seen, (1 - self.alpha) * (variances + diff * increment), 0)
+        self.readings[positions] = readings + 1
+        self.last_times[positions] = times
+        self.anomalous[positions] = flags
+        return flags
+
+    def update(self, plant_ids, times, values) -> np.ndarray:
+        '''Adds a batch of readings for any number of plants, with values
+        holding a column per metric. Each plant's readings are applied in time
+        order, one reading of every plant per vectorised step.
+        Returns whether each reading was anomalous.'''
+        plant_ids = np.asarray(plant_ids, dtype=np.int64)
+        times = np.asarray(times, dtype='datetime64[s]')
+        values = np.asarray(values, dtype=float).reshape(len(plant_ids), len(ANOMALY_METRICS))
+        flags = np.zeros(len(plant_ids), dtype=bool)
+        if not len(plant_ids):
+            return flags
+
+        self.add_plants(plant_ids)
+        positions = np.searchsorted(self.plant_ids, plant_ids)
+        order = np.lexsort((times, positions))
+        keep = ~(times[order] <= self.last_times[positions[order]])
+        keep &= ~np.isnan(values[order]).any(axis=1)
+        keep[1:] &= ~((positions[order][1:] == positions[order][:-1])
+                      & (times[order][1:] == times[order][:-1]))
+        order = order[keep]
+        if not len(order):
+            return flags
+
+        ordered = positions[order]
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        ranks = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        for rank in range(ranks.max() + 1):
+            batch = order[ranks == rank]
+            flags[batch] = self.step(positions[batch], times[batch], values[batch])
+
+        self.changed.update(self.plant_ids[ordered[starts]].tolist())
+        return flags
+
+    def track(self, chunks):
+        '''Yields chunks of recordings unchanged, adding each one to the detector'''
+        for chunk in chunks:
+            self.update([reading['plant_id'] for reading in chunk],
+                        [reading['time_taken'] for reading in chunk],
+                        [[reading[metric] for metric in ANOMALY_METRICS] for reading in chunk])
+            yield chunk
+
+    def get_anomalous(self) -> list[int]:
+        '''Returns the plants whose newest reading was anomalous'''
+        return self.plant_ids[self.anomalous].tolist()
+
+    def to_rows(self, plant_ids) -> list[tuple]:
+        '''Returns the stored state of the given plants'''
+        rows = []
+        for position in np.searchsorted(self.plant_ids, sorted(plant_ids)):
+            rows.append((int(self.plant_ids[position]), int(self.readings[position]),
+                         self.last_times[position].item(),
+                         *[float(value) for pair in zip(self.means[position],
+                                                        self.variances[position])
+                           for value in pair],
+                         bool(self.anomalous[position])))
+        return rows
+
+
+def load_anomaly_state(cur) -> AnomalyDetector:
+    '''Returns the anomaly detector with each plant's stored state'''
+    cur.execute('''SELECT plant_id, readings, last_time_taken, soil_moisture_mean,
+            soil_moisture_var, temperature_mean, temperature_var, anomalous
+        FROM gamma.plant_anomaly_state;''')
+    return AnomalyDetector.from_rows(cur.fetchall())
+
+
+def save_anomaly_state(cur, detector: AnomalyDetector) -> None:
+    '''Writes the state of the plants that had new readings, one MERGE per chunk'''
+    rows = detector.to_rows(detector.changed)
+    for start in range(0, len(rows), ANOMALY_CHUNK_SIZE):
+        chunk = rows[start:start + ANOMALY_CHUNK_SIZE]
+        values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(chunk))
+        cur.execute(f'''MERGE gamma.plant_anomaly_state WITH (HOLDLOCK) AS t
+        USING (VALUES {values}) AS s (plant_id, readings, last_time_taken, soil_moisture_mean,
+            soil_moisture_var, temperature_mean, temperature_var, anomalous)
+        ON t.plant_id = s.plant_id
+        WHEN MATCHED THEN UPDATE SET t.readings = s.readings,
+            t.last_time_taken = s.last_time_taken, t.soil_moisture_mean = s.soil_moisture_mean,
+            t.soil_moisture_var = s.soil_moisture_var, t.temperature_mean = s.temperature_mean,
+            t.temperature_var = s.temperature_var, t.anomalous = s.anomalous
+        WHEN NOT MATCHED THEN INSERT (plant_id, readings, last_time_taken, soil_moisture_mean,
+            soil_moisture_var, temperature_mean, temperature_var, anomalous)
+            VALUES (s.plant_id, s.readings, s.last_time_taken, s.soil_moisture_mean,
+                s.soil_moisture_var, s.temperature_mean, s.temperature_var, s.anomalous);''',
+                    tuple(value for row in chunk for value in row))
+    detector.changed.clear()
+
+
+def get_affected_plants() -> dict[str, list[int]]:
+    '''Returns the plants that require attention under each alert rule,
+    reading only the recordings added since the last run into each plant's
+    rolling flags and anomaly state.
+    The reads start WATERMARK_OVERLAP ids below the watermark so recordings
+    committed out of id order are not missed. The flags are rebuilt from the
+    stored recordings when the table was truncated or the thresholds changed.'''
     with get_connection() as conn:
         logging.info('Connection established.')
         with conn.cursor() as cur:
-            cur.execute(q)
-            logging.info('Query executed.')
-            plants = [plant['plant_id'] for plant in cur.fetchall()]
-            logging.info('Plants identified:%s',plants)
+            watermark, rules_hash, states = load_checker_state(cur)
+            thresholds = load_thresholds(cur)
+            detector = load_anomaly_state(cur)
+            reset = (get_last_recording_id(cur) < watermark
+                     or (rules_hash is not None and rules_hash != thresholds.fingerprint))
+            if reset:
+                logging.warning('Recordings restarted or thresholds changed since watermark'
+                                ' %s, rebuilding state.', watermark)
+                watermark, states = 0, {}
+            chunks = read_new_readings(cur, max(watermark - WATERMARK_OVERLAP, 0))
+            changed, newest = update_checker_state(states, detector.track(chunks), thresholds)
+            logging.info('Read recordings up to %s, %s plants changed.', newest, len(changed))
+            save_anomaly_state(cur, detector)
+            save_checker_state(cur, states, changed, max(watermark, newest),
+                               thresholds.fingerprint, reset)
+        conn.commit()
+    plants = {ALERT_RULE: sorted(plant_id for plant_id, history in states.items()
+                                 if flags_need_attention(history)),
+              ANOMALY_RULE: detector.get_anomalous()}
+    logging.info('Plants identified:%s', plants)
     return plants
 
 
-def send_emergency_email(plants: list[int]) -> None:
-    '''Sends an email using SES to a specified email address'''
+def get_open_alerts(cur, rules: list[str]) -> dict[tuple[int, str], dict]:
+    '''Returns the open alerts for the given rules keyed by (plant_id, rule)'''
+    placeholders = ', '.join(['%s'] * len(rules))
+    cur.execute(f'''SELECT plant_id, alert_rule, first_seen, last_seen, last_notified
+        FROM gamma.plant_alerts
+        WHERE alert_state = 'open' AND alert_rule IN ({placeholders});''', tuple(rules))
+    return {(row['plant_id'], row['alert_rule']): row for row in cur.fetchall()}
+
+
+def plan_alerts(firing: set[tuple[int, str]], open_alerts: dict[tuple[int, str], dict],
+                now: dt, cooldown: timedelta = ALERT_COOLDOWN,
+                resolve_after: timedelta = ALERT_RESOLVE_AFTER) -> dict[str, list]:
+    '''Sorts alerts into those newly firing, those still firing that are due a
+    reminder or still within their cooldown, and those that have not fired for
+    resolve_after. An open alert that stopped firing more recently is left
+    open and untouched, so a sensor flapping between normal and abnormal
+    readings keeps one open alert instead of opening and resolving it on
+    every run.'''
+    ongoing = firing & open_alerts.keys()
+    reminders = {alert for alert in ongoing
+                 if open_alerts[alert]['last_notified'] is None
+                 or now - open_alerts[alert]['last_notified'] >= cooldown}
+    resolved = {alert for alert in open_alerts.keys() - firing
+                if now - open_alerts[alert]['last_seen'] >= resolve_after}
+    return {'new': sorted(firing - open_alerts.keys()),
+            'reminder': sorted(reminders),
+            'quiet': sorted(ongoing - reminders),
+            'resolved': sorted(resolved)}
+
+
+def save_alerts(cur, plan: dict[str, list], now: dt) -> None:
+    '''Records the outcome of a run in gamma.plant_alerts with one MERGE per
+    chunk of alerts. New alerts are opened or reopened, reminded and resolved
+    alerts are marked as notified and quiet alerts only as seen.'''
+    rows = [(plant_id, rule, action) for action, alerts in plan.items()
+            for plant_id, rule in alerts]
+    for start in range(0, len(rows), ALERT_CHUNK_SIZE):
+        chunk = rows[start:start + ALERT_CHUNK_SIZE]
+        values = ', '.join(['(%s, %s, %s)'] * len(chunk))
+        cur.execute(f'''DECLARE @now DATETIME = %s;
+        MERGE gamma.plant_alerts WITH (HOLDLOCK) AS t
+        USING (VALUES {values}) AS s (plant_id, alert_rule, action)
+        ON t.plant_id = s.plant_id AND t.alert_rule = s.alert_rule
+        WHEN MATCHED THEN UPDATE SET
+            t.alert_state = CASE WHEN s.action = 'resolved' THEN 'resolved' ELSE 'open' END,
+            t.first_seen = CASE WHEN s.action = 'new' THEN @now ELSE t.first_seen END,
+            t.last_seen = CASE WHEN s.action = 'resolved' THEN t.last_seen ELSE @now END,
+            t.last_notified = CASE WHEN s.action = 'quiet' THEN t.last_notified ELSE @now END,
+            t.resolved_at = CASE WHEN s.action = 'resolved' THEN @now ELSE NULL END
+        WHEN NOT MATCHED AND s.action = 'new' THEN
+            INSERT (plant_id, alert_rule, alert_state, first_seen, last_seen, last_notified)
+            VALUES (s.plant_id, s.alert_rule, 'open', @now, @now, @now);''',
+                    (now, *[value for row in chunk for value in row]))
+
+
+@lru_cache(maxsize=1)
+def get_ses_client():
+    '''Returns the SES client, created once and reused by later invocations'''
     ses = client("ses", aws_access_key_id=ENV["MY_AWS_ACCESS_KEY"],
                  aws_secret_access_key=ENV["MY_AWS_SECRET_KEY"],
                  region_name="eu-west-2")
     logging.info('SES client connection established.')
+    return ses
+
+
+def describe_alert(alert: tuple[int, str]) -> str:
+    '''Returns the line describing one plant's alert in the digest'''
+    plant_id, rule = alert
+    return f'{RULE_DESCRIPTIONS.get(rule, rule)} for Plant ID: {plant_id}.'
+
+
+def send_alert_digest(plan: dict[str, list]) -> None:
+    '''Sends one email using SES listing the new, still open and resolved alerts'''
+    sections = [('NEW', 'WARNING: ', plan['new']),
+                ('STILL OPEN', 'REMINDER: ', plan['reminder']),
+                ('RESOLVED', 'RESOLVED: ', plan['resolved'])]
 
     text = "LMNH BOTANICAL WARNING SYSTEM TRIGGERED\n"
-    subject = f"WARNING: Plant Danger Detected {get_date()}."
-    for plant in plants:
-        logging.info('Inserted plant %s into email',plant)
-        text += f'WARNING: Abnormal abiotic conditions have been detected for Plant ID: {plant}.\n'
+    for title, prefix, alerts in sections:
+        if alerts:
+            text += f'\n{title}\n'
+            text += ''.join(f'{prefix}{describe_alert(alert)}\n' for alert in alerts)
     text+='\n This is an automated email. Please do not reply to this address.'
+    subject = (f"WARNING: {len(plan['new'])} new, {len(plan['reminder'])} open and "
+               f"{len(plan['resolved'])} resolved plant alerts {get_date()}.")
     logging.info('Email constructed.')
 
-    ses.send_email(Source=ENV['FROM'],
-                   Destination={'ToAddresses': [ENV['TO']]},
-                   Message={'Subject': {'Data': subject},
-                            'Body': {'Text': {'Data': text}}})
+    get_ses_client().send_email(Source=ENV['FROM'],
+                                Destination={'ToAddresses': [ENV['TO']]},
+                                Message={'Subject': {'Data': subject},
+                                         'Body': {'Text': {'Data': text}}})
     logging.info('Email sent.')
 
 def config_logs() -> logging.Logger:
@@ -73,16 +544,26 @@ def config_logs() -> logging.Logger:
     return logger
 
 def handler(event, context) -> None:
-    '''Calls functions to get plant data and assess plant health'''
+    '''Calls functions to get plant data and assess plant health, emailing a
+    digest of the alerts that opened, are due a reminder or resolved'''
     log = config_logs()
     logging.info('Log Configured.')
     load_dotenv()
     logging.info('Environment loaded.')
-    plant_ids = get_affected_plants()
-    if plant_ids:
-        send_emergency_email(plant_ids)
-    else:
-        logging.info('No plants identified')
+    now = dt.now()
+    affected = get_affected_plants()
+    firing = {(plant_id, rule) for rule, plants in affected.items() for plant_id in plants}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            plan = plan_alerts(firing, get_open_alerts(cur, list(affected)), now)
+        logging.info('Alerts planned:%s', {action: len(alerts) for action, alerts in plan.items()})
+        if plan['new'] or plan['reminder'] or plan['resolved']:
+            send_alert_digest(plan)
+        else:
+            logging.info('No alerts to send')
+        with conn.cursor() as cur:
+            save_alerts(cur, plan, now)
+        conn.commit()
 
 if __name__ == '__main__':
     handler({},{})
@@ -1,12 +1,32 @@
 """Tests for main.py."""
+import json
+import random
 import unittest
+from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
 from main import (
     config_logs,
     get_connection,
-    send_emergency_email
+    get_ses_client,
+    send_alert_digest,
+    flags_need_attention,
+    push_flag,
+    update_checker_state,
+    Thresholds,
+    AnomalyDetector,
+    get_affected_plants,
+    plan_alerts,
+    save_alerts,
+    handler
 )
 
+EMAIL_ENV = {
+    'MY_AWS_ACCESS_KEY': 'test_access_key',
+    'MY_AWS_SECRET_KEY': 'test_secret_key',
+    'FROM': 'test_from@example.com',
+    'TO': 'test_to@example.com'
+}
+
 
 class TestPlantConditions(unittest.TestCase):
     """Testing plant condition measuring functions in main.py."""
@@ -38,22 +58,446 @@ class TestPlantConditions(unittest.TestCase):
 
     @patch('main.client')
     @patch('main.get_date')
-    def test_send_emergency_email(self, mock_get_date, mock_client):
-        """Tests that email is sent when plant is in danger."""
+    def test_send_alert_digest(self, mock_get_date, mock_client):
+        """Tests that one email lists the new, open and resolved alerts."""
+        get_ses_client.cache_clear()
         mock_ses = MagicMock()
         mock_client.return_value = mock_ses
         mock_get_date.return_value = "Friday 03 October 2024 @ 15:30:00"
 
-        plants = [1, 2, 3]
-        with patch.dict('os.environ', {
-            'MY_AWS_ACCESS_KEY': 'test_access_key',
-            'MY_AWS_SECRET_KEY': 'test_secret_key',
-            'FROM': 'test_from@example.com',
-            'TO': 'test_to@example.com'
-        }):
-            send_emergency_email(plants)
+        plan = {'new': [(1, 'out_of_range')], 'reminder': [(2, 'out_of_range')],
+                'quiet': [(3, 'out_of_range')], 'resolved': [(4, 'out_of_range')]}
+        with patch.dict('os.environ', EMAIL_ENV):
+            send_alert_digest(plan)
 
         mock_ses.send_email.assert_called_once()  # Ensure email was sent
+        message = mock_ses.send_email.call_args[1]['Message']
+        text = message['Body']['Text']['Data']
+        self.assertIn('WARNING: Abnormal abiotic conditions for Plant ID: 1.', text)
+        self.assertIn('REMINDER: Abnormal abiotic conditions for Plant ID: 2.', text)
+        self.assertIn('RESOLVED: Abnormal abiotic conditions for Plant ID: 4.', text)
+        self.assertNotIn('Plant ID: 3.', text)
+        self.assertIn('1 new, 1 open and 1 resolved', message['Subject']['Data'])
+
+    @patch('main.client')
+    def test_ses_client_is_reused(self, mock_client):
+        """Tests that the SES client is created once across digests."""
+        get_ses_client.cache_clear()
+        plan = {'new': [(1, 'out_of_range')], 'reminder': [], 'quiet': [], 'resolved': []}
+        with patch.dict('os.environ', EMAIL_ENV):
+            send_alert_digest(plan)
+            send_alert_digest(plan)
+
+        mock_client.assert_called_once()
+        self.assertEqual(mock_client.return_value.send_email.call_count, 2)
+        get_ses_client.cache_clear()
+
+    def test_flags_need_attention(self):
+        """Tests that only three out of range readings in a row need attention."""
+        bad, good = ['2024-10-03 10:00:00', 1], ['2024-10-03 10:00:00', 0]
+
+        self.assertTrue(flags_need_attention([bad, bad, bad, good]))
+        self.assertFalse(flags_need_attention([bad, bad, good, bad]))
+        self.assertFalse(flags_need_attention([bad, bad]))
+
+    @patch('main.get_connection')
+    def test_get_affected_plants_reads_new_recordings(self, mock_connection):
+        """Tests that only recordings above the watermark are read and the
+        state is saved with the new watermark."""
+        conn = mock_connection.return_value.__enter__.return_value
+        cursor = conn.cursor.return_value.__enter__.return_value
+        stored = [['2024-10-03 10:00:00', 1], ['2024-10-03 09:59:00', 1]]
+        cursor.fetchone.side_effect = [{'recording_id': 5000, 'rules_hash': None},
+                                       {'recording_id': 5002}]
+        cursor.fetchall.side_effect = [[{'plant_id': 1, 'flag_history': json.dumps(stored)}],
+                                       [], [], []]
+        cursor.fetchmany.side_effect = [
+            [{'recording_id': 5001, 'plant_id': 1, 'time_taken': datetime(2024, 10, 3, 10, 1),
+              'soil_moisture': 10, 'temperature': 20},
+             {'recording_id': 5002, 'plant_id': 2, 'time_taken': datetime(2024, 10, 3, 10, 1),
+              'soil_moisture': 10, 'temperature': 20}], []]
+
+        self.assertEqual(get_affected_plants(), {'out_of_range': [1], 'anomaly': []})
+
+        queries = [call[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(queries[6][1], (4000,))
+        self.assertIn('gamma.plant_anomaly_state', queries[7][0])
+        self.assertIn('gamma.plant_checker_state', queries[8][0])
+        self.assertEqual(queries[-1][1], (5002, Thresholds([], []).fingerprint))
+        conn.commit.assert_called_once()
+
+    @patch('main.get_connection')
+    def test_get_affected_plants_rebuilds_after_truncate(self, mock_connection):
+        """Tests that the state is rebuilt when recording ids restart."""
+        cursor = mock_connection.return_value.__enter__.return_value\
+            .cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [{'recording_id': 5000, 'rules_hash': None},
+                                       {'recording_id': 1}]
+        cursor.fetchall.side_effect = [[{'plant_id': 1, 'flag_history': json.dumps(
+            [['2024-10-03 10:00:00', 1]] * 3)}], [], [], []]
+        cursor.fetchmany.side_effect = [[]]
+
+        self.assertEqual(get_affected_plants(), {'out_of_range': [], 'anomaly': []})
+
+        queries = [call[0][0] for call in cursor.execute.call_args_list]
+        self.assertEqual(cursor.execute.call_args_list[6][0][1], (0,))
+        self.assertIn('DELETE FROM gamma.plant_checker_state', queries[7])
+
+    @patch('main.get_connection')
+    def test_get_affected_plants_rebuilds_after_rule_change(self, mock_connection):
+        """Tests that the state is rebuilt when the threshold rules change."""
+        cursor = mock_connection.return_value.__enter__.return_value\
+            .cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [{'recording_id': 5000, 'rules_hash': 'old'},
+                                       {'recording_id': 5000}]
+        cursor.fetchall.side_effect = [[], [{'plant_id': 1, 'plant_species_id': 2}],
+                                       [{'plant_species_id': 2, 'plant_id': None,
+                                         'soil_moisture_min': 20, 'soil_moisture_max': None,
+                                         'temperature_min': None, 'temperature_max': None}], []]
+        cursor.fetchmany.side_effect = [[]]
+
+        get_affected_plants()
+
+        queries = [call[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(queries[6][1], (0,))
+        self.assertIn('DELETE FROM gamma.plant_checker_state', queries[7][0])
+        self.assertNotEqual(queries[-1][1][1], 'old')
+
+
+class TestThresholds(unittest.TestCase):
+    """Testing the compiled threshold rules in main.py."""
+
+    def setUp(self):
+        plants = [{'plant_id': plant_id, 'plant_species_id': species_id}
+                  for plant_id, species_id in [(3, 1), (1, 1), (2, 2), (4, 3)]]
+        rules = [{'plant_species_id': 1, 'plant_id': None, 'soil_moisture_min': 30,
+                  'soil_moisture_max': 50, 'temperature_min': None, 'temperature_max': None},
+                 {'plant_species_id': None, 'plant_id': 3, 'soil_moisture_min': None,
+                  'soil_moisture_max': 90, 'temperature_min': None, 'temperature_max': 20},
+                 {'plant_species_id': 9, 'plant_id': None, 'soil_moisture_min': 0,
+                  'soil_moisture_max': 100, 'temperature_min': 0, 'temperature_max': 100}]
+        self.thresholds = Thresholds(plants, rules)
+
+    def test_species_rule_overrides_defaults(self):
+        """Tests that a species rule replaces only the bounds it sets."""
+        self.assertEqual(self.thresholds.flag([1, 1, 1], [25, 40, 40], [25, 25, 40]).tolist(),
+                         [True, False, True])
+
+    def test_plant_rule_overrides_species_rule(self):
+        """Tests that a plant's own rule wins over its species' rule, which
+        still fills the bounds the plant rule leaves unset."""
+        self.assertEqual(self.thresholds.flag([3, 3, 3], [25, 80, 80], [18, 18, 25]).tolist(),
+                         [True, False, True])
+
+    def test_defaults_for_plants_without_rules(self):
+        """Tests that plants without rules, or missing from the plants table,
+        use the default thresholds."""
+        self.assertEqual(self.thresholds.flag([2, 4, 99, 0], [10, 40, 40, 80],
+                                              [25, 25, 25, 25]).tolist(),
+                         [True, False, False, True])
+
+    def test_fingerprint_changes_with_rules(self):
+        """Tests that the fingerprint only changes when a plant's bounds do."""
+        plants = [{'plant_id': 1, 'plant_species_id': 1}]
+        unused = [{'plant_species_id': 5, 'plant_id': None, 'soil_moisture_min': 0,
+                   'soil_moisture_max': None, 'temperature_min': None, 'temperature_max': None}]
+        used = [dict(unused[0], plant_species_id=1)]
+
+        self.assertEqual(Thresholds(plants, []).fingerprint,
+                         Thresholds(plants, unused).fingerprint)
+        self.assertEqual(Thresholds(plants, []).fingerprint,
+                         Thresholds(plants + [{'plant_id': 2, 'plant_species_id': 2}],
+                                    []).fingerprint)
+        self.assertNotEqual(Thresholds(plants, []).fingerprint,
+                            Thresholds(plants, used).fingerprint)
+
+
+def get_sql_affected_plants(recordings: list[dict]) -> list[int]:
+    """Returns the plants the previous full-window query found: those whose
+    three newest recordings by time_taken are all out of range."""
+    by_plant = {}
+    for recording in recordings:
+        by_plant.setdefault(recording['plant_id'], []).append(recording)
+    affected = []
+    for plant_id, plant_recordings in by_plant.items():
+        newest = sorted(plant_recordings, key=lambda r: r['time_taken'], reverse=True)[:3]
+        if len(newest) == 3 and all(r['soil_moisture'] > 70 or r['soil_moisture'] < 15
+                                    or r['temperature'] > 35 or r['temperature'] < 15
+                                    for r in newest):
+            affected.append(plant_id)
+    return sorted(affected)
+
+
+def get_ewma_flags(readings: list[tuple], alpha: float, sigma: float, warmup: int,
+                   min_std: tuple) -> list[bool]:
+    """Returns the anomaly flag of each (plant_id, value, value) reading,
+    scoring one reading at a time in plain Python."""
+    states, flags = {}, []
+    for plant_id, *values in readings:
+        count, means, variances = states.get(plant_id, (0, [0, 0], [0, 0]))
+        diffs = [value - mean for value, mean in zip(values, means)]
+        flags.append(count >= warmup and any(
+            abs(diff) > sigma * max(variance ** 0.5, floor)
+            for diff, variance, floor in zip(diffs, variances, min_std)))
+        if count:
+            means = [mean + alpha * diff for mean, diff in zip(means, diffs)]
+            variances = [(1 - alpha) * (variance + alpha * diff ** 2)
+                         for variance, diff in zip(variances, diffs)]
+        else:
+            means, variances = list(values), [0, 0]
+        states[plant_id] = (count + 1, means, variances)
+    return flags
+
+
+class TestAnomalyDetector(unittest.TestCase):
+    """Testing the EWMA anomaly detector in main.py."""
+
+    def setUp(self):
+        self.start = datetime(2024, 10, 3)
+        self.rng = random.Random(0)
+
+    def make_readings(self, plants: int, minutes: int) -> list[tuple]:
+        """Returns (plant_id, time_taken, moisture, temperature) readings, one
+        per plant per minute."""
+        return [(plant_id, self.start + timedelta(minutes=minute),
+                 self.rng.gauss(40, 2), self.rng.gauss(20, 1))
+                for minute in range(minutes) for plant_id in range(1, plants + 1)]
+
+    def test_flags_spike_after_warmup(self):
+        """Tests that steady readings are not flagged and a spike is, but only
+        once the plant has enough readings."""
+        detector = AnomalyDetector(warmup=30)
+        readings = self.make_readings(2, 60)
+        flags = detector.update(*zip(*[(p, t, (m, c)) for p, t, m, c in readings]))
+        self.assertFalse(flags.any())
+
+        spike = self.start + timedelta(minutes=60)
+        flags = detector.update([1, 2], [spike, spike], [[40, 45], [40, 20]])
+        self.assertEqual(flags.tolist(), [True, False])
+        self.assertEqual(detector.get_anomalous(), [1])
+
+        early = AnomalyDetector(warmup=30)
+        early.update([1] * 3, [spike - timedelta(minutes=i) for i in (2, 1, 0)],
+                     [[40, 20], [40, 20], [90, 20]])
+        self.assertEqual(early.get_anomalous(), [])
+
+    def test_matches_one_reading_at_a_time(self):
+        """Tests that batches with many readings per plant, out of order, give
+        the same flags as scoring each reading in time order."""
+        readings = self.make_readings(5, 80)
+        readings += [(plant_id, self.start + timedelta(minutes=80 + i),
+                      self.rng.choice([5, 40, 90]), self.rng.choice([0, 20, 40]))
+                     for i in range(20) for plant_id in range(1, 6)]
+        expected = get_ewma_flags([(p, m, c) for p, _, m, c in readings],
+                                  0.1, 3, 10, (1.0, 0.5))
+
+        detector = AnomalyDetector(alpha=0.1, sigma=3, warmup=10)
+        shuffled = list(enumerate(readings))
+        flags = [None] * len(readings)
+        for start in range(0, len(shuffled), 137):
+            batch = shuffled[start:start + 137]
+            self.rng.shuffle(batch)
+            batch_flags = detector.update([r[1][0] for r in batch], [r[1][1] for r in batch],
+                                          [r[1][2:] for r in batch])
+            for (i, _), flag in zip(batch, batch_flags.tolist()):
+                flags[i] = flag
+
+        self.assertEqual(flags, expected)
+        self.assertTrue(any(expected))
+
+    def test_ignores_readings_already_seen(self):
+        """Tests that re-read readings leave the state unchanged."""
+        detector = AnomalyDetector()
+        readings = self.make_readings(3, 10)
+        columns = list(zip(*[(p, t, (m, c)) for p, t, m, c in readings]))
+        detector.update(*columns)
+        means = detector.means.copy()
+        detector.changed.clear()
+
+        self.assertFalse(detector.update(*columns).any())
+        self.assertEqual(detector.means.tolist(), means.tolist())
+        self.assertEqual(detector.readings.tolist(), [10, 10, 10])
+        self.assertEqual(detector.changed, set())
+
+    def test_rows_round_trip(self):
+        """Tests that the stored state restores the same detector."""
+        detector = AnomalyDetector()
+        readings = self.make_readings(3, 5)
+        detector.update(*zip(*[(p, t, (m, c)) for p, t, m, c in readings]))
+        columns = ['plant_id', 'readings', 'last_time_taken', 'soil_moisture_mean',
+                   'soil_moisture_var', 'temperature_mean', 'temperature_var', 'anomalous']
+        rows = [dict(zip(columns, row)) for row in detector.to_rows(detector.changed)]
+
+        restored = AnomalyDetector.from_rows(rows)
+        self.assertEqual(restored.to_rows([1, 2, 3]), detector.to_rows([1, 2, 3]))
+        self.assertEqual(rows[0]['last_time_taken'], self.start + timedelta(minutes=4))
+
+
+class TestCheckerState(unittest.TestCase):
+    """Testing the incremental rolling state in main.py."""
+
+    def test_push_flag_orders_and_deduplicates(self):
+        """Tests that late readings are placed in time order and repeats ignored."""
+        history = []
+        for time_taken, flag in [('10:02', 1), ('10:00', 0), ('10:01', 1), ('10:01', 0),
+                                 ('10:03', 0), ('09:00', 1)]:
+            push_flag(history, time_taken, flag)
+
+        self.assertEqual(history, [['10:03', 0], ['10:02', 1], ['10:01', 1]])
+
+    def test_parity_with_full_window_query(self):
+        """Tests that over many runs, with late and re-read recordings, the
+        rolling state finds the same plants as the full-window query."""
+        rng = random.Random(0)
+        start = datetime(2024, 10, 3)
+        recordings, states = [], {}
+        watermark = 0
+
+        for run in range(200):
+            for plant_id in range(1, 21):
+                if rng.random() < 0.7:
+                    minutes = run - (rng.randint(1, 5) if rng.random() < 0.1 else 0)
+                    time_taken = start + timedelta(minutes=minutes, seconds=plant_id)
+                    if any(r['plant_id'] == plant_id and r['time_taken'] == time_taken
+                           for r in recordings):
+                        continue
+                    recordings.append({'recording_id': len(recordings) + 1,
+                                       'plant_id': plant_id, 'time_taken': time_taken,
+                                       'soil_moisture': rng.choice([10, 40, 80]),
+                                       'temperature': rng.choice([10, 25, 40])})
+
+            new = [r for r in recordings if r['recording_id'] > max(watermark - 30, 0)]
+            states = {plant_id: json.loads(json.dumps(history))
+                      for plant_id, history in states.items()}
+            _, newest = update_checker_state(states, [new])
+            watermark = max(watermark, newest)
+
+            rolling = sorted(plant_id for plant_id, history in states.items()
+                             if flags_need_attention(history))
+            self.assertEqual(rolling, get_sql_affected_plants(recordings), f'run {run}')
+
+
+class TestAlertState(unittest.TestCase):
+    """Testing alert deduplication and cooldown in main.py."""
+    now = datetime(2024, 10, 3, 15, 30)
+
+    def test_plan_alerts_transitions(self):
+        """Tests that alerts open, stay quiet in their cooldown, remind after
+        it and resolve once the plant recovers."""
+        cooldown = timedelta(hours=4)
+        open_alerts = {
+            (2, 'out_of_range'): {'last_notified': self.now - timedelta(hours=1),
+                                  'last_seen': self.now - timedelta(minutes=1)},
+            (3, 'out_of_range'): {'last_notified': self.now - timedelta(hours=5),
+                                  'last_seen': self.now - timedelta(minutes=1)},
+            (4, 'out_of_range'): {'last_notified': self.now - timedelta(hours=1),
+                                  'last_seen': self.now - timedelta(minutes=20)},
+            (5, 'out_of_range'): {'last_notified': self.now - timedelta(hours=1),
+                                  'last_seen': self.now - timedelta(minutes=5)}}
+        firing = {(1, 'out_of_range'), (2, 'out_of_range'), (3, 'out_of_range')}
+
+        plan = plan_alerts(firing, open_alerts, self.now, cooldown, timedelta(minutes=15))
+
+        self.assertEqual(plan, {'new': [(1, 'out_of_range')],
+                                'reminder': [(3, 'out_of_range')],
+                                'quiet': [(2, 'out_of_range')],
+                                'resolved': [(4, 'out_of_range')]})
+
+    def get_alternating_emails(self, resolve_after: timedelta) -> tuple[list, int]:
+        """Runs the checker once a minute over a sensor that alternates between
+        spikes and normal readings for half an hour and then settles. Returns
+        the (minute, digest) of every email sent and the last minute it fired."""
+        detector = AnomalyDetector(warmup=30)
+        start = self.now - timedelta(hours=1)
+        detector.update([1] * 60, [start + timedelta(minutes=i) for i in range(60)],
+                        [[40 + (i % 3 - 1) * 0.5, 20] for i in range(60)])
+
+        open_alerts = {}
+        emails = []
+        last_fired = None
+        for minute in range(60, 120):
+            now = start + timedelta(minutes=minute)
+            spike = minute < 90 and minute % 2 == 0
+            detector.update([1], [now], [[95 if spike else 40, 20]])
+            firing = {(plant_id, 'anomaly') for plant_id in detector.get_anomalous()}
+            if firing:
+                last_fired = minute
+
+            plan = plan_alerts(firing, open_alerts, now, timedelta(hours=4), resolve_after)
+            for alert in plan['new'] + plan['reminder']:
+                open_alerts[alert] = {'last_notified': now, 'last_seen': now}
+            for alert in plan['quiet']:
+                open_alerts[alert]['last_seen'] = now
+            for alert in plan['resolved']:
+                del open_alerts[alert]
+            if plan['new'] or plan['reminder'] or plan['resolved']:
+                emails.append((minute, {action: alerts for action, alerts in plan.items()
+                                        if alerts and action != 'quiet'}))
+
+        return emails, last_fired
+
+    def test_alternating_readings_send_one_alert(self):
+        """Tests that a sensor alternating between anomalous and normal
+        readings opens one alert and only resolves it once it settles."""
+        emails, last_fired = self.get_alternating_emails(timedelta(minutes=15))
+
+        self.assertEqual(len(emails), 2)
+        self.assertEqual(emails[0], (60, {'new': [(1, 'anomaly')]}))
+        self.assertEqual(emails[1], (last_fired + 15, {'resolved': [(1, 'anomaly')]}))
+
+        flapping, _ = self.get_alternating_emails(timedelta(0))
+        self.assertGreater(len(flapping), len(emails))
+
+    def test_save_alerts_one_merge(self):
+        """Tests that every alert is saved with one MERGE."""
+        cursor = MagicMock()
+        plan = {'new': [(1, 'out_of_range')], 'reminder': [], 'quiet': [(2, 'out_of_range')],
+                'resolved': [(4, 'out_of_range')]}
+
+        save_alerts(cursor, plan, self.now)
+
+        cursor.execute.assert_called_once()
+        query, params = cursor.execute.call_args[0]
+        self.assertIn('MERGE gamma.plant_alerts', query)
+        self.assertEqual(params, (self.now, 1, 'out_of_range', 'new', 2, 'out_of_range',
+                                  'quiet', 4, 'out_of_range', 'resolved'))
+
+    @patch('main.send_alert_digest')
+    @patch('main.get_affected_plants', return_value={'out_of_range': [1, 2], 'anomaly': []})
+    @patch('main.get_connection')
+    def test_handler_stays_quiet_in_cooldown(self, mock_connection, mock_affected,
+                                             mock_digest):
+        """Tests that no email is sent while every alert is within its cooldown."""
+        conn = mock_connection.return_value.__enter__.return_value
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [
+            {'plant_id': plant_id, 'alert_rule': 'out_of_range', 'first_seen': datetime.now(),
+             'last_seen': datetime.now(), 'last_notified': datetime.now()}
+            for plant_id in (1, 2)]
+
+        handler({}, {})
+
+        mock_digest.assert_not_called()
+        self.assertEqual(cursor.execute.call_count, 2)
+        conn.commit.assert_called_once()
+
+    @patch('main.send_alert_digest')
+    @patch('main.get_affected_plants', return_value={'out_of_range': [1], 'anomaly': []})
+    @patch('main.get_connection')
+    def test_handler_sends_one_digest(self, mock_connection, mock_affected, mock_digest):
+        """Tests that new and resolved alerts go out in a single digest."""
+        cursor = mock_connection.return_value.__enter__.return_value\
+            .cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [
+            {'plant_id': 5, 'alert_rule': 'out_of_range', 'first_seen': datetime.now(),
+             'last_seen': datetime.now() - timedelta(hours=1), 'last_notified': datetime.now()}]
+
+        handler({}, {})
+
+        mock_digest.assert_called_once()
+        plan = mock_digest.call_args[0][0]
+        self.assertEqual(plan['new'], [(1, 'out_of_range')])
+        self.assertEqual(plan['resolved'], [(5, 'out_of_range')])
 
 
 if __name__ == '__main__':